@@ -0,0 +1,119 @@
+"""
+Benchmark generalized spmm / rspmm against message passing with scatter_add and torch.sparse.mm on CPU.
+
+Usage:
+    python benchmarks/benchmark_spmm.py --num_node 20000 --degree 20 --dim 64 --num_thread 4
+"""
+
+import time
+import argparse
+
+import torch
+import torch_scatter
+
+from torchdrug import data
+from torchdrug.layers import functional
+
+
+def timeit(func, num_repeat):
+    func()
+    start = time.perf_counter()
+    for i in range(num_repeat):
+        func()
+    return (time.perf_counter() - start) / num_repeat * 1000
+
+
+def forward_backward(func, inputs):
+    def run():
+        output = func()
+        torch.autograd.grad(output, inputs, torch.ones_like(output), retain_graph=True)
+    return run
+
+
+def main(args):
+    torch.manual_seed(0)
+    torch.set_num_threads(args.num_thread)
+    num_edge = args.num_node * args.degree
+    edge_list = torch.randint(args.num_node, (num_edge, 2))
+    relation = torch.randint(args.num_relation, (num_edge, 1))
+    graph = data.Graph(edge_list, torch.rand(num_edge), num_node=args.num_node)
+    knowledge_graph = data.Graph(torch.cat([edge_list, relation], dim=-1), torch.rand(num_edge),
+                                 num_node=args.num_node, num_relation=args.num_relation)
+    input = torch.rand(args.num_node, args.dim, requires_grad=True)
+    relation_input = torch.rand(args.num_relation, args.dim, requires_grad=True)
+    graph.edge_weight.requires_grad_()
+    knowledge_graph.edge_weight.requires_grad_()
+
+    node_in, node_out = graph.edge_list.t()
+    index = graph.edge_list.flip(1).t()
+
+    def scatter_add():
+        message = graph.edge_weight.unsqueeze(-1) * input[node_in]
+        return torch_scatter.scatter_add(message, node_out, dim=0, dim_size=args.num_node)
+
+    def sparse_mm():
+        sparse = torch.sparse_coo_tensor(index, graph.edge_weight, (args.num_node, args.num_node))
+        return torch.sparse.mm(sparse, input)
+
+    def spmm():
+        adjacency = graph.adjacency.t()
+        return functional.generalized_spmm(adjacency, input)
+
+    # exclude the cost of coalescing COO indexes
+    adjacency = graph.adjacency.t().coalesce()
+
+    def spmm_coalesced():
+        return functional.generalized_spmm(adjacency, input)
+
+    def csr_spmm():
+        return functional.csr_spmm(graph.csc, graph.csr, graph.edge_weight, input)
+
+    kg_node_in, kg_node_out, kg_relation = knowledge_graph.edge_list.t()
+
+    def rscatter_add():
+        message = relation_input[kg_relation] * input[kg_node_in]
+        message = knowledge_graph.edge_weight.unsqueeze(-1) * message
+        return torch_scatter.scatter_add(message, kg_node_out, dim=0, dim_size=args.num_node)
+
+    def rspmm():
+        adjacency = knowledge_graph.adjacency.transpose(0, 1)
+        return functional.generalized_rspmm(adjacency, relation_input, input)
+
+    kg_adjacency = knowledge_graph.adjacency.transpose(0, 1).coalesce()
+
+    def rspmm_coalesced():
+        return functional.generalized_rspmm(kg_adjacency, relation_input, input)
+
+    def csr_rspmm():
+        return functional.csr_rspmm(knowledge_graph.csc, knowledge_graph.csr, kg_relation,
+                                    knowledge_graph.edge_weight, relation_input, input)
+
+    print("#node: %d, #edge: %d, dim: %d, #thread: %d" % (args.num_node, num_edge, args.dim, args.num_thread))
+    print("%-20s %12s %12s" % ("method", "forward (ms)", "fwd+bwd (ms)"))
+    benchmarks = [
+        ("scatter_add", scatter_add, (graph.edge_weight, input)),
+        ("torch.sparse.mm", sparse_mm, (graph.edge_weight, input)),
+        ("generalized_spmm", spmm, (graph.edge_weight, input)),
+        ("  w/o coalesce", spmm_coalesced, (graph.edge_weight, input)),
+        ("csr_spmm", csr_spmm, (graph.edge_weight, input)),
+        ("scatter_add (rel)", rscatter_add, (knowledge_graph.edge_weight, relation_input, input)),
+        ("generalized_rspmm", rspmm, (knowledge_graph.edge_weight, relation_input, input)),
+        ("  w/o coalesce", rspmm_coalesced, (knowledge_graph.edge_weight, relation_input, input)),
+        ("csr_rspmm", csr_rspmm, (knowledge_graph.edge_weight, relation_input, input)),
+    ]
+    for name, func, inputs in benchmarks:
+        with torch.no_grad():
+            forward = timeit(func, args.num_repeat)
+        both = timeit(forward_backward(func, inputs), args.num_repeat)
+        print("%-20s %12.2f %12.2f" % (name, forward, both))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--num_node", type=int, default=20000)
+    parser.add_argument("--degree", type=int, default=20)
+    parser.add_argument("--num_relation", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--num_thread", type=int, default=torch.get_num_threads())
+    parser.add_argument("--num_repeat", type=int, default=10)
+    main(parser.parse_args())
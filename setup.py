@@ -1,5 +1,95 @@
+import os
+import warnings
+import importlib.util
+
 import setuptools
 
+try:
+    import torch
+    from torch.utils import cpp_extension
+except ImportError:
+    torch = None
+
+
+def load_file_utils():
+    # torchdrug.utils.file only depends on the standard library, so it is loaded without importing torchdrug,
+    # which keeps the build-time checksum the same as the one checked at runtime
+    spec = importlib.util.spec_from_file_location("torchdrug_utils_file",
+                                                  os.path.join("torchdrug", "utils", "file.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_extensions():
+    """
+    C++ extensions built ahead of time.
+    Any extension that is not built here is compiled just-in-time on its first use.
+    Set ``TORCHDRUG_BUILD_EXT=0`` to skip them.
+    """
+    if os.environ.get("TORCHDRUG_BUILD_EXT", "1") == "0":
+        return []
+    if torch is None:
+        warnings.warn("PyTorch is not found in the build environment, so C++ extensions are not built ahead of time. "
+                      "They will be compiled just-in-time on their first use. "
+                      "Install PyTorch first and use `pip install --no-build-isolation .` to build them.")
+        return []
+
+    path = os.path.join("torchdrug", "layers", "functional", "extension")
+    cflags = ["-Ofast", "-fopenmp"]
+    if cpp_extension.CUDA_HOME is not None and torch.version.cuda is not None:
+        Extension = cpp_extension.CUDAExtension
+        suffixes = [".cpp", ".cu"]
+        extra_compile_args = {"cxx": cflags + ["-DCUDA_OP"], "nvcc": ["-O3"]}
+    else:
+        Extension = cpp_extension.CppExtension
+        suffixes = [".cpp"]
+        extra_compile_args = {"cxx": cflags}
+
+    extensions = [
+        cpp_extension.CppExtension("torchdrug.utils.extension.torch_ext",
+                                   [os.path.join("torchdrug", "utils", "extension", "torch_ext.cpp")],
+                                   extra_compile_args={"cxx": ["-Ofast"]}, optional=True),
+        Extension("torchdrug.layers.functional.extension.spmm",
+                  [os.path.join(path, name + suffix) for suffix in suffixes for name in ["spmm", "rspmm"]],
+                  extra_compile_args=extra_compile_args, extra_link_args=["-fopenmp"], optional=True),
+        Extension("torchdrug.layers.functional.extension.embedding",
+                  [os.path.join(path, "embedding" + suffix) for suffix in suffixes],
+                  extra_compile_args=extra_compile_args, extra_link_args=["-fopenmp"], optional=True),
+    ]
+    return extensions
+
+
+def get_cmdclass():
+    if torch is None:
+        return {}
+
+    class BuildExtension(cpp_extension.BuildExtension):
+        """Build extensions ahead of time, and leave failed ones to the JIT fallback."""
+
+        def build_extension(self, ext):
+            try:
+                super(BuildExtension, self).build_extension(ext)
+            except Exception as e:
+                warnings.warn("Failed to build extension `%s`. It will be compiled just-in-time instead.\n%s"
+                              % (ext.name, e))
+                return
+            # the runtime ignores the extension if its sources are changed after the build
+            with open(self.get_ext_fullpath(ext.name) + ".md5", "w") as fout:
+                fout.write(load_file_utils().get_source_checksum(ext.sources))
+
+        def copy_extensions_to_source(self):
+            # with --inplace, extensions are built in build_lib and copied to the source tree
+            super(BuildExtension, self).copy_extensions_to_source()
+            build_py = self.get_finalized_command("build_py")
+            for ext in self.extensions:
+                checksum_file = os.path.join(self.build_lib, self.get_ext_filename(ext.name)) + ".md5"
+                if os.path.exists(checksum_file):
+                    package_dir = build_py.get_package_dir(ext.name.rpartition(".")[0])
+                    self.copy_file(checksum_file, os.path.join(package_dir, os.path.basename(checksum_file)))
+
+    return {"build_ext": BuildExtension}
+
 
 if __name__ == "__main__":
     setuptools.setup(
@@ -8,6 +98,8 @@ if __name__ == "__main__":
         version="0.1.0",
         license="Apache-2.0",
         packages=setuptools.find_packages(),
+        ext_modules=get_extensions(),
+        cmdclass=get_cmdclass(),
         package_data={
             "torchdrug": [
                 "layers/functional/extension/*.h",
@@ -20,7 +112,7 @@ if __name__ == "__main__":
         test_suite="nose.collector",
         install_requires=
             [
-                "torch>=1.4.0",
+                "torch>=1.9.0",
                 "torch-scatter>=1.4.0",
                 "decorator",
                 "numpy>=1.11",
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+import torch
+from torch import nn
+
+from torchdrug import core, data
+
+
+class RecordTask(nn.Module):
+
+    def __init__(self):
+        super(RecordTask, self).__init__()
+        self.weight = nn.Parameter(torch.zeros(1))
+        self.targets = []
+
+    def forward(self, batch):
+        self.targets.append(batch["y"].tolist())
+        return self.weight.sum(), {}
+
+
+class EngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, "molecule.csv")
+        with open(self.file_name, "w") as fout:
+            fout.write("smiles,y\n")
+            for i in range(10):
+                fout.write("C,%d\n" % i)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stream(self):
+        dataset = data.MoleculeStream()
+        dataset.load_file(self.file_name)
+        task = RecordTask()
+        optimizer = torch.optim.SGD(task.parameters(), lr=0.1)
+        solver = core.Engine(task, dataset, None, None, optimizer, batch_size=3, log_interval=1000)
+        solver.train(num_epoch=2, batch_per_epoch=2)
+        solver.train(batch_per_epoch=2)
+        truth = [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9], [0, 1, 2], [3, 4, 5]]
+        self.assertEqual(task.targets, truth, "Incorrect stream across epochs")
+
+
+if __name__ == "__main__":
+    unittest.main()
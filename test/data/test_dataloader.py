@@ -0,0 +1,231 @@
+import unittest
+
+import torch
+from torch.utils import data as torch_data
+
+from torchdrug import data, transforms
+
+
+def check_shared(batch):
+    # runs in dataloader workers, before the batch is sent to the main process
+    graph = batch["graph"]
+    tensors = [graph.edge_list, graph.edge_weight, graph.node_feature, graph.edge_feature, graph.atom_type]
+    batch["shared"] = all(tensor.is_shared() for tensor in tensors)
+    return batch
+
+
+class GetBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        smiles = ["CCO", "c1ccccc1", "CC(=O)O", "CCCCCCCCCC", "CCN(CC)CC", "O=C=O", "C1CCCCC1CCCCCC", "CCCl", "N",
+                  "CCNc1nc(NC(C)C)nc(SC)n1"]
+        self.dataset = data.MoleculeDataset()
+        self.dataset.load_smiles(smiles, {"y": list(range(len(smiles))), "z": [0.5] * len(smiles)},
+                                 node_feature="default", edge_feature="default")
+
+    def assert_batch_equal(self, result, truth, message):
+        self.assertEqual(result.keys(), truth.keys(), message)
+        self.assertTrue(torch.equal(result["y"], truth["y"]), message)
+        self.assertTrue(torch.equal(result["z"], truth["z"]), message)
+        result = result["graph"]
+        truth = truth["graph"]
+        self.assertIsInstance(result, data.PackedMolecule, message)
+        self.assertTrue(torch.equal(result.edge_list, truth.edge_list), message)
+        self.assertTrue(torch.equal(result.edge_weight, truth.edge_weight), message)
+        self.assertTrue(torch.equal(result.num_nodes, truth.num_nodes), message)
+        self.assertTrue(torch.equal(result.num_edges, truth.num_edges), message)
+        self.assertTrue(torch.equal(result.node_feature, truth.node_feature), message)
+        self.assertTrue(torch.equal(result.edge_feature, truth.edge_feature), message)
+        self.assertTrue(torch.equal(result.atom_type, truth.atom_type), message)
+        self.assertTrue(torch.equal(result.bond_type, truth.bond_type), message)
+        self.assertTrue(torch.equal(result._offsets, truth._offsets), message)
+
+    def test_get_batch(self):
+        packed_dataset = data.MoleculeDataset()
+        packed_dataset.load_smiles(self.dataset.smiles_list, self.dataset.targets,
+                                   node_feature="default", edge_feature="default")
+        packed_dataset.pack_data()
+        subset = torch_data.Subset(torch_data.Subset(packed_dataset, [9, 7, 5, 3, 1, 0, 2, 4]), [6, 5, 4, 3, 2, 1, 0])
+        for dataset in [self.dataset, packed_dataset, subset]:
+            for batch_size, drop_last in [(1, False), (3, False), (3, True)]:
+                loader = data.DataLoader(dataset, batch_size=batch_size, drop_last=drop_last, batch_fetch=True)
+                self.assertIsInstance(loader.dataset, data.dataloader.BatchedDataset, "get_batch is not used")
+                truth = torch_data.DataLoader(dataset, batch_size=batch_size, drop_last=drop_last,
+                                              collate_fn=data.graph_collate)
+                self.assertEqual(len(loader), len(truth), "Incorrect number of batches")
+                for result, batch in zip(loader, truth):
+                    self.assert_batch_equal(result, batch, "Incorrect batch from get_batch")
+
+        sampler = torch_data.RandomSampler(self.dataset)
+        for indices in torch_data.BatchSampler(sampler, 4, False):
+            result = packed_dataset.get_batch(indices)
+            truth = data.graph_collate([self.dataset[i] for i in indices])
+            self.assert_batch_equal(result, truth, "Incorrect batch from get_batch")
+
+        loader = data.DataLoader(self.dataset, batch_size=3, collate_fn=lambda batch: batch, batch_fetch=True)
+        self.assertNotIsInstance(loader.dataset, data.dataloader.BatchedDataset,
+                                 "get_batch is used with a custom collate_fn")
+        loader = data.DataLoader(self.dataset, batch_size=3)
+        self.assertIs(loader.dataset, self.dataset, "get_batch is used without batch_fetch")
+
+    def test_pack_data(self):
+        molecules = list(self.dataset.data)
+        data.DataLoader(self.dataset, batch_size=3)
+        self.assertIsInstance(self.dataset.data, list, "Molecules are packed without calling pack_data")
+
+        self.dataset.pack_data()
+        self.assertNotIsInstance(self.dataset.data, list, "Packed arrays are kept beside the list of molecules")
+        self.assertEqual(len(self.dataset.data), len(molecules), "Incorrect number of packed molecules")
+        for i, molecule in enumerate(molecules):
+            self.assertTrue(torch.equal(self.dataset.data[i].node_feature, molecule.node_feature),
+                            "Incorrect packed molecules")
+        # replacing the molecules drops the packed arrays
+        self.dataset.data = molecules[::-1]
+        indices = [0, 3, 5]
+        truth = data.graph_collate([self.dataset[i] for i in indices])
+        self.assert_batch_equal(self.dataset.get_batch(indices), truth, "Stale packed arrays are used")
+
+    def test_worker(self):
+        lazy_dataset = data.MoleculeDataset()
+        lazy_dataset.load_smiles(self.dataset.smiles_list, self.dataset.targets, lazy=True,
+                                 node_feature="default", edge_feature="default")
+        # the first dataset fetches batches with get_batch, and the second one packs individual samples
+        for dataset in [self.dataset, lazy_dataset]:
+            truth = data.DataLoader(dataset, batch_size=3)
+            loader = data.DataLoader(dataset, batch_size=3, num_workers=2, batch_transform=check_shared,
+                                     batch_fetch=True)
+            self.assertEqual(len(loader), len(truth), "Incorrect number of batches with workers")
+            for result, batch in zip(loader, truth):
+                self.assertTrue(result.pop("shared"), "Batch is not allocated in shared memory by workers")
+                self.assert_batch_equal(result, batch, "Incorrect batch with workers")
+
+
+class DynamicBatchSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        smiles = ["C", "CC", "CCO", "c1ccccc1", "CC(=O)O", "CCCCCCCCCC", "CCN(CC)CC", "O=C=O", "C1CCCCC1CCCCCC",
+                  "CCNc1nc(NC(C)C)nc(SC)n1", "N", "CCCl"]
+        self.dataset = data.MoleculeDataset()
+        self.dataset.load_smiles(smiles, {"y": list(range(len(smiles)))})
+        self.num_nodes = torch.tensor([len(mol.atom_type) for mol in self.dataset.data])
+        self.num_edges = torch.tensor([int(mol.num_edge) for mol in self.dataset.data])
+
+    def test_budget(self):
+        sampler = data.DynamicBatchSampler(self.dataset, max_node=12, max_edge=20, shuffle=True, bucket_size=6)
+        for epoch in range(3):
+            sampler.set_epoch(epoch)
+            batches = list(sampler)
+            self.assertEqual(len(batches), len(sampler), "Incorrect number of batches")
+            index = torch.tensor(sum(batches, []))
+            self.assertTrue(torch.equal(index.sort()[0], torch.arange(len(self.dataset))), "Incorrect batch sampler")
+            for batch in batches:
+                if len(batch) > 1:
+                    self.assertLessEqual(self.num_nodes[batch].sum(), 12, "Node budget is exceeded")
+                    self.assertLessEqual(self.num_edges[batch].sum(), 20, "Edge budget is exceeded")
+
+        loader = data.DataLoader(self.dataset, batch_sampler=sampler)
+        for batch, index in zip(loader, sampler):
+            self.assertEqual(batch["y"].tolist(), index, "Incorrect batch")
+            self.assertEqual(batch["graph"].num_node, self.num_nodes[index].sum(), "Incorrect batch")
+
+    def test_distributed(self):
+        subset = torch_data.Subset(self.dataset, list(range(1, 12)))
+        samplers = [data.DynamicBatchSampler(subset, max_node=8, shuffle=True, num_replicas=3, rank=rank)
+                    for rank in range(3)]
+        batches = [list(sampler) for sampler in samplers]
+        self.assertEqual(len(set(len(batch) for batch in batches)), 1, "Uneven number of batches across ranks")
+        index = set(sum(sum(batches, []), []))
+        self.assertEqual(index, set(range(11)), "Incorrect distributed batch sampler")
+        for batch in sum(batches, []):
+            if len(batch) > 1:
+                self.assertLessEqual(self.num_nodes[1:][batch].sum(), 8, "Node budget is exceeded")
+
+
+class PrefetcherTest(unittest.TestCase):
+
+    def test_prefetch(self):
+        batches = [{"x": torch.full((3,), i)} for i in range(10)]
+        prefetcher = data.Prefetcher(batches, num_prefetch=3, transform=lambda batch: {"x": batch["x"] * 2})
+        self.assertEqual(len(prefetcher), 10, "Incorrect prefetcher length")
+        result = [batch["x"].tolist() for batch in prefetcher]
+        truth = [[i * 2] * 3 for i in range(10)]
+        self.assertEqual(result, truth, "Incorrect prefetcher")
+
+        for i, batch in enumerate(prefetcher):
+            if i == 2:
+                break
+        self.assertEqual(batch["x"].tolist(), [4] * 3, "Incorrect prefetcher")
+
+    def test_build_index(self):
+        graphs = [data.Graph(torch.randint(5, (8, 2)), num_node=5) for i in range(4)]
+        batches = [{"graph": graph, "y": torch.zeros(1)} for graph in graphs]
+        for batch in data.Prefetcher(batches, build_index=True):
+            cache = batch["graph"]._get_cache()
+            self.assertIn("csr", cache, "CSR index is not built by the prefetcher")
+            self.assertIn("csc", cache, "CSC index is not built by the prefetcher")
+
+    def test_error(self):
+        def generate():
+            yield torch.zeros(1)
+            raise KeyError("test")
+
+        prefetcher = data.Prefetcher(generate())
+        with self.assertRaises(KeyError):
+            list(prefetcher)
+
+
+class BatchTransformTest(unittest.TestCase):
+
+    def setUp(self):
+        smiles = ["CCO", "c1ccccc1", "CC(=O)O", "CCCCCCCCCC", "CCN(CC)CC", "O=C=O", "C1CCCCC1CCCCCC", "CCCl"]
+        self.dataset = data.MoleculeDataset()
+        self.dataset.load_smiles(smiles, {"y": list(range(len(smiles)))}, node_feature="default")
+
+    def test_virtual_node(self):
+        transform = transforms.VirtualAtom(atom_type=0, node_feature=torch.ones(self.dataset.node_feature_dim))
+        loader = data.DataLoader(self.dataset, batch_size=3, batch_transform=transform)
+        for i, batch in enumerate(loader):
+            graphs = [transform(self.dataset[j])["graph"] for j in range(i * 3, min(i * 3 + 3, len(self.dataset)))]
+            truth = data.Molecule.pack(graphs)
+            result = batch["graph"]
+            self.assertTrue(torch.equal(result.edge_list, truth.edge_list), "Incorrect batch virtual node")
+            self.assertTrue(torch.equal(result.num_nodes, truth.num_nodes), "Incorrect batch virtual node")
+            self.assertTrue(torch.equal(result.node_feature, truth.node_feature), "Incorrect batch virtual node")
+            self.assertTrue(torch.equal(result.bond_type, truth.bond_type), "Incorrect batch virtual node")
+
+    def test_bfs_order(self):
+        loader = data.DataLoader(self.dataset, batch_size=4, batch_transform=transforms.RandomBFSOrder())
+        for i, batch in enumerate(loader):
+            truth = data.Molecule.pack([self.dataset[j]["graph"] for j in range(i * 4, i * 4 + 4)])
+            result = batch["graph"]
+            self.assertTrue(torch.equal(result.num_nodes, truth.num_nodes), "Incorrect batch BFS order")
+            self.assertTrue(torch.equal(result.num_edges, truth.num_edges), "Incorrect batch BFS order")
+            # each node except the root is reached from a previous node
+            node_in, node_out = result.edge_list.t()[:2]
+            parent = torch.full((result.num_node,), result.num_node)
+            parent = parent.scatter_reduce(0, node_out, node_in, reduce="amin")
+            is_root = torch.zeros(result.num_node, dtype=torch.bool)
+            is_root[result.num_cum_nodes - result.num_nodes] = 1
+            self.assertTrue((is_root | (parent < torch.arange(result.num_node))).all(), "Incorrect batch BFS order")
+
+    def test_single_graph(self):
+        for i in range(len(self.dataset)):
+            graph = self.dataset[i]["graph"]
+            result = transforms.RandomBFSOrder()({"graph": graph})["graph"]
+            self.assertNotIsInstance(result, data.PackedGraph, "Single graph is transformed as a batch")
+            self.assertEqual(result.num_node, graph.num_node, "Incorrect BFS order")
+            node_in, node_out = result.edge_list.t()[:2]
+            parent = torch.full((result.num_node,), result.num_node)
+            parent = parent.scatter_reduce(0, node_out, node_in, reduce="amin")
+            self.assertTrue((parent[1:] < torch.arange(1, result.num_node)).all(), "Incorrect BFS order")
+
+            result = transforms.Shuffle()({"graph": graph})["graph"]
+            self.assertNotIsInstance(result, data.PackedGraph, "Single graph is transformed as a batch")
+            self.assertTrue(torch.equal(result.atom_type.sort()[0], graph.atom_type.sort()[0]), "Incorrect shuffle")
+            edges = result.atom_type[result.edge_list[:, :2]].tolist()
+            truth = graph.atom_type[graph.edge_list[:, :2]].tolist()
+            self.assertEqual(sorted(edges), sorted(truth), "Incorrect shuffle")
+
+
+if __name__ == "__main__":
+    unittest.main()
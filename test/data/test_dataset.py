@@ -0,0 +1,484 @@
+import os
+import csv
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from torch import multiprocessing as mp
+
+from torchdrug import data, datasets
+from torchdrug.utils import comm
+
+
+def distributed_worker(rank, smiles_list, queue):
+    os.environ["RANK"] = os.environ["LOCAL_RANK"] = str(rank)
+    comm.init_process_group("gloo", init_method="env://", rank=rank)
+    dataset = data.MoleculeDataset()
+    dataset.load_smiles(smiles_list, {"y": list(range(len(smiles_list)))}, distributed=True, node_feature="pretrain")
+    graph = data.graph_collate(dataset[:])["graph"]
+    # the gathered columns are placed in shared memory, so sharing them again doesn't copy them
+    columns = dataset.data.columns
+    is_shared = comm.share_memory(columns)["edge_list"] is columns["edge_list"]
+    queue.put((rank, list(dataset.smiles_list), dataset.targets["y"], graph.edge_list.tolist(),
+               graph.num_nodes.tolist(), graph.node_feature.tolist(), is_shared))
+    comm.synchronize()
+
+
+class MoleculeDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.smiles = ["C", "CCO", "c1ccccc1", "CC(=O)O", "CCCCCCCCCC", "CCN(CC)CC", "O=C=O", "CCNc1nc(NC(C)C)nc(SC)n1"]
+        self.targets = {"y": list(range(len(self.smiles)))}
+        self.dataset = data.MoleculeDataset()
+        self.dataset.load_smiles(self.smiles, self.targets)
+
+    def assert_graph_equal(self, result, truth, message):
+        self.assertTrue(torch.equal(result.edge_list, truth.edge_list), message)
+        self.assertTrue(torch.equal(result.edge_weight, truth.edge_weight), message)
+        self.assertTrue(torch.equal(result.node_feature, truth.node_feature), message)
+        self.assertTrue(torch.equal(result.edge_feature, truth.edge_feature), message)
+        self.assertTrue(torch.equal(result.atom_type, truth.atom_type), message)
+        self.assertTrue(torch.equal(result.bond_type, truth.bond_type), message)
+        if isinstance(truth, data.PackedGraph):
+            self.assertTrue(torch.equal(result.num_nodes, truth.num_nodes), message)
+            self.assertTrue(torch.equal(result.num_edges, truth.num_edges), message)
+        else:
+            self.assertEqual(result.num_node, truth.num_node, message)
+
+    def test_parallel(self):
+        smiles_list = self.smiles + ["invalid"] + self.smiles[::-1]
+        targets = {"y": list(range(len(smiles_list)))}
+        for lazy in [False, True]:
+            truth = data.MoleculeDataset()
+            truth.load_smiles(smiles_list, targets, lazy=lazy, node_feature="pretrain")
+            dataset = data.MoleculeDataset()
+            dataset.load_smiles(smiles_list, targets, lazy=lazy, num_worker=2, chunk_size=3, node_feature="pretrain")
+            self.assertEqual(list(dataset.smiles_list), list(truth.smiles_list), "Incorrect SMILES with workers")
+            self.assertEqual(dataset.targets["y"], truth.targets["y"], "Incorrect targets with workers")
+            for i in range(len(truth)):
+                self.assert_graph_equal(dataset[i]["graph"], truth[i]["graph"], "Incorrect molecules with workers")
+        self.assertTrue(torch.equal(dataset.get_scaffold_ids(num_worker=2, chunk_size=3), truth.get_scaffold_ids()),
+                        "Incorrect scaffolds with workers")
+
+        reactions = ["CCO>>CC=O", "invalid>>C", "c1ccccc1>>c1ccccc1O", "CC(=O)O.CO>>CC(=O)OC", "CCN>>CCNC"]
+        targets = {"y": list(range(len(reactions)))}
+        truth = data.ReactionDataset()
+        truth.load_smiles(reactions, targets)
+        dataset = data.ReactionDataset()
+        dataset.load_smiles(reactions, targets, num_worker=2, chunk_size=2)
+        self.assertEqual(list(dataset.smiles_list), list(truth.smiles_list), "Incorrect reactions with workers")
+        for i in range(len(truth)):
+            self.assertEqual(dataset[i]["y"], truth[i]["y"], "Incorrect targets with workers")
+            for result, graph in zip(dataset[i]["graph"], truth[i]["graph"]):
+                self.assertTrue(torch.equal(result.edge_list, graph.edge_list), "Incorrect reactions with workers")
+                self.assertTrue(torch.equal(result.node_feature, graph.node_feature),
+                                "Incorrect reactions with workers")
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_file = os.path.join(tmp_dir, "molecule.csv")
+            with open(csv_file, "w") as fout:
+                fout.write("smiles,y\n")
+                for smiles, y in zip(self.smiles, self.targets["y"]):
+                    fout.write("%s,%d\n" % (smiles, y))
+            cache_dir = os.path.join(tmp_dir, "cache")
+
+            for lazy in [False, True]:
+                truth = data.MoleculeDataset()
+                truth.load_csv(csv_file, lazy=lazy)
+                for i in range(2):
+                    dataset = data.MoleculeDataset()
+                    dataset.load_csv(csv_file, cache=True, lazy=lazy)
+                    self.assertEqual(dataset.lazy, lazy, "Incorrect lazy mode from cache")
+                    self.assertEqual(list(dataset.smiles_list), list(truth.smiles_list), "Incorrect SMILES from cache")
+                    self.assertEqual(dataset.targets["y"], truth.targets["y"], "Incorrect targets from cache")
+                    for j in range(len(truth)):
+                        self.assert_graph_equal(dataset[j]["graph"], truth[j]["graph"],
+                                                "Incorrect molecules from cache")
+            self.assertEqual(len(os.listdir(cache_dir)), 2, "Lazy mode is not part of the cache key")
+
+            dataset = data.MoleculeDataset()
+            dataset.load_csv(csv_file, cache=True, node_feature="pretrain")
+            self.assertEqual(len(os.listdir(cache_dir)), 3, "Featurization options are not part of the cache key")
+            truth = data.Molecule.from_smiles(self.smiles[0], node_feature="pretrain")
+            self.assertTrue(torch.equal(dataset[0]["graph"].node_feature, truth.node_feature),
+                            "Incorrect molecules from cache")
+
+            # options that aren't primitive types are pickled in the cache
+            for i in range(2):
+                dataset = data.MoleculeDataset()
+                dataset.load_csv(csv_file, cache=True, kekulize=np.bool_(True))
+                self.assertIsInstance(dataset.kwargs["kekulize"], np.bool_, "Incorrect options from cache")
+            self.assertEqual(len(os.listdir(cache_dir)), 4, "Incorrect cache with non-primitive options")
+
+            with open(csv_file, "a") as fout:
+                fout.write("CC,8\n")
+            dataset = data.MoleculeDataset()
+            dataset.load_csv(csv_file, cache=True)
+            self.assertEqual(len(dataset), len(self.smiles) + 1, "Cache is not invalidated by a modified file")
+            self.assertEqual(len(os.listdir(cache_dir)), 5, "Cache is not invalidated by a modified file")
+
+    def test_reaction_cache(self):
+        reactions = ["CCO>>CC=O", "c1ccccc1>>c1ccccc1O", "CC(=O)O.CO>>CC(=O)OC", "invalid>>C", "CCN>>CCNC"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_file = os.path.join(tmp_dir, "reaction.csv")
+            with open(csv_file, "w") as fout:
+                fout.write("smiles,y\n")
+                for i, smiles in enumerate(reactions):
+                    fout.write("%s,%d\n" % (smiles, i))
+
+            truth = data.ReactionDataset()
+            truth.load_csv(csv_file)
+            self.assertEqual(len(truth.smiles_list), len(truth), "Incorrect SMILES of valid reactions")
+            for lazy in [False, True, True]:
+                dataset = data.ReactionDataset()
+                dataset.load_csv(csv_file, cache=True, lazy=lazy)
+                self.assertEqual(dataset.lazy, lazy, "Incorrect lazy mode from cache")
+                self.assertEqual(len(dataset), len(truth), "Incorrect reactions from cache")
+                self.assertEqual(list(dataset.smiles_list), list(truth.smiles_list), "Incorrect SMILES from cache")
+                for i in range(len(truth)):
+                    self.assertEqual(dataset[i]["y"], truth[i]["y"], "Incorrect targets from cache")
+                    for result, graph in zip(dataset[i]["graph"], truth[i]["graph"]):
+                        self.assertTrue(torch.equal(result.edge_list, graph.edge_list),
+                                        "Incorrect reactions from cache")
+                        self.assertTrue(torch.equal(result.node_feature, graph.node_feature),
+                                        "Incorrect reactions from cache")
+                self.assertTrue(torch.equal(dataset.get_sizes()[0], truth.get_sizes()[0]), "Incorrect reaction sizes")
+
+    def test_mmap(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for lazy, num_worker in [(False, 0), (True, 0), (True, 2)]:
+                truth = data.MoleculeDataset()
+                truth.load_smiles(self.smiles, self.targets, lazy=lazy, node_feature="pretrain")
+                truth.save_mmap(tmp_dir, num_worker=num_worker, chunk_size=3)
+                dataset = data.MoleculeDataset()
+                dataset.load_mmap(tmp_dir)
+                self.assertFalse(dataset.lazy, "Incorrect lazy mode from memory-mapped files")
+                self.assertEqual(len(dataset), len(truth), "Incorrect number of molecules from memory-mapped files")
+                self.assertEqual(list(dataset.smiles_list), list(truth.smiles_list),
+                                 "Incorrect SMILES from memory-mapped files")
+                self.assertEqual(dataset.targets["y"], truth.targets["y"], "Incorrect targets from memory-mapped files")
+                for i in range(len(truth)):
+                    self.assert_graph_equal(dataset[i]["graph"], truth[i]["graph"],
+                                            "Incorrect molecules from memory-mapped files")
+                num_nodes, num_edges = dataset.get_sizes()
+                truth_nodes, truth_edges = truth.get_sizes()
+                self.assertTrue(torch.equal(num_nodes, truth_nodes), "Incorrect sizes from memory-mapped files")
+                self.assertTrue(torch.equal(num_edges, truth_edges), "Incorrect sizes from memory-mapped files")
+
+            # molecules are mapped again from the files rather than pickled
+            state = pickle.dumps(dataset.data)
+            self.assertLess(len(state), os.path.getsize(os.path.join(tmp_dir, "edge_list.npy")),
+                            "Memory-mapped molecules are pickled by value")
+            self.assert_graph_equal(pickle.loads(state)[1], truth[1]["graph"], "Incorrect unpickled molecules")
+
+            # copy-on-write mapping doesn't modify the files
+            dataset[1]["graph"].edge_list.zero_()
+            dataset = data.MoleculeDataset()
+            dataset.load_mmap(tmp_dir)
+            self.assert_graph_equal(dataset[1]["graph"], truth[1]["graph"], "Memory-mapped files are modified")
+
+    def test_sizes(self):
+        smiles_list = self.smiles + ["invalid", "[NH4+].[O-]C(=O)C1CC1", "c1ccc2[nH]ccc2c1"]
+        targets = {"y": list(range(len(smiles_list)))}
+        for kwargs in [{}, {"with_hydrogen": True}, {"kekulize": True}]:
+            truth = data.MoleculeDataset()
+            truth.load_smiles(smiles_list, targets, **kwargs)
+            num_nodes = torch.tensor([int(mol.num_node) for mol in truth.data])
+            num_edges = torch.tensor([int(mol.num_edge) for mol in truth.data])
+            for num_worker in [0, 2]:
+                dataset = data.MoleculeDataset()
+                dataset.load_smiles(smiles_list, targets, lazy=True, num_worker=num_worker, **kwargs)
+                sizes = dataset.get_sizes()
+                self.assertTrue(torch.equal(sizes[0], num_nodes), "Incorrect sizes of lazy molecules")
+                self.assertTrue(torch.equal(sizes[1], num_edges), "Incorrect sizes of lazy molecules")
+                self.assertIs(dataset.get_sizes(), sizes, "Sizes are not cached")
+
+            sizes = truth.get_sizes()
+            self.assertTrue(torch.equal(sizes[0], num_nodes), "Incorrect sizes of molecules")
+            self.assertIs(truth.get_sizes(), sizes, "Sizes are not cached")
+            truth.pack_data()
+            self.assertIsNot(truth.get_sizes(), sizes, "Sizes are not invalidated by pack_data")
+            self.assertTrue(torch.equal(truth.get_sizes()[1], num_edges), "Incorrect sizes of packed molecules")
+
+        reactions = ["CCO>>CC=O", "c1ccccc1>>c1ccccc1O", "invalid>>C", "CC(=O)O.CO>>CC(=O)OC"]
+        targets = {"y": list(range(len(reactions)))}
+        truth = data.ReactionDataset()
+        truth.load_smiles(reactions, targets)
+        for num_worker in [0, 2]:
+            dataset = data.ReactionDataset()
+            dataset.load_smiles(reactions, targets, lazy=True, num_worker=num_worker)
+            for result, size in zip(dataset.get_sizes(), truth.get_sizes()):
+                self.assertTrue(torch.equal(result, size), "Incorrect sizes of lazy reactions")
+
+    def test_negative_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.dataset.save_mmap(tmp_dir)
+            dataset = data.MoleculeDataset()
+            dataset.load_mmap(tmp_dir)
+            for i in range(-len(self.smiles), 0):
+                self.assert_graph_equal(dataset[i]["graph"], self.dataset[i]["graph"], "Incorrect negative index")
+            with self.assertRaises(IndexError):
+                dataset[len(self.smiles)]
+
+            indices = [-1, 0, -3, 2]
+            truth = data.graph_collate([self.dataset[i] for i in indices])
+            result = dataset.get_batch(indices)
+            self.assert_graph_equal(result["graph"], truth["graph"], "Incorrect negative index in a batch")
+            self.assertTrue(torch.equal(result["y"], truth["y"]), "Incorrect negative index in a batch")
+
+
+class DistributedMoleculeDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.num_worker = 3
+        # the second rank only gets invalid SMILES
+        self.smiles = ["C", "CCO", "invalid", "C1CC", "c1ccccc1", "CC(=O)O", "CCN(CC)CC"]
+        self.ctx = mp.get_context("spawn")
+        os.environ["WORLD_SIZE"] = str(self.num_worker)
+        os.environ["MASTER_ADDR"] = "localhost"
+        os.environ["MASTER_PORT"] = "1026"
+
+    def test_distributed(self):
+        queue = self.ctx.Queue()
+        spawn_ctx = mp.spawn(distributed_worker, (self.smiles, queue), nprocs=self.num_worker, join=False)
+        truth = data.MoleculeDataset()
+        truth.load_smiles(self.smiles, {"y": list(range(len(self.smiles)))}, node_feature="pretrain")
+        graph = data.graph_collate(truth[:])["graph"]
+        ranks = set()
+        for i in range(self.num_worker):
+            rank, smiles_list, targets, edge_list, num_nodes, node_feature, is_shared = queue.get(timeout=60)
+            ranks.add(rank)
+            self.assertTrue(is_shared, "Distributed featurization isn't gathered in shared memory")
+            self.assertEqual(smiles_list, list(truth.smiles_list), "Incorrect SMILES from distributed featurization")
+            self.assertEqual(targets, truth.targets["y"], "Incorrect targets from distributed featurization")
+            self.assertEqual(edge_list, graph.edge_list.tolist(), "Incorrect molecules from distributed featurization")
+            self.assertEqual(num_nodes, graph.num_nodes.tolist(), "Incorrect molecules from distributed featurization")
+            self.assertEqual(node_feature, graph.node_feature.tolist(),
+                             "Incorrect molecules from distributed featurization")
+        self.assertEqual(ranks, set(range(self.num_worker)), "Missing results from distributed ranks")
+        spawn_ctx.join()
+
+
+class StringListTest(unittest.TestCase):
+
+    def test_string_list(self):
+        strings = ["CCO", "", "c1ccccc1", "Zähler", "[13CH4]", ""]
+        result = data.dataset._StringList(strings)
+        self.assertEqual(len(result), len(strings), "Incorrect length of string list")
+        self.assertEqual(list(result), strings, "Incorrect iteration of string list")
+        for i in range(-len(strings), len(strings)):
+            self.assertEqual(result[i], strings[i], "Incorrect element of string list")
+        with self.assertRaises(IndexError):
+            result[len(strings)]
+        with self.assertRaises(IndexError):
+            result[-len(strings) - 1]
+        self.assertEqual(result[1:5:2], strings[1:5:2], "Incorrect slice of string list")
+        self.assertEqual(result[::-1], strings[::-1], "Incorrect slice of string list")
+        self.assertEqual(list(pickle.loads(pickle.dumps(result))), strings, "Incorrect pickled string list")
+        self.assertEqual(len(data.dataset._StringList([])), 0, "Incorrect empty string list")
+        indexes = [5, 0, 0, 3]
+        self.assertEqual(list(result.take(indexes)), [strings[i] for i in indexes], "Incorrect taken string list")
+        self.assertEqual(len(result.take([])), 0, "Incorrect taken string list")
+
+        smiles_list = ["C", "invalid", "CCO"]
+        molecules = data.MoleculeDataset()
+        molecules.load_smiles(smiles_list, {"y": [0, 1, 2]}, lazy=True)
+        self.assertIsInstance(molecules.smiles_list, data.dataset._StringList, "SMILES are not stored in a string list")
+        self.assertEqual(list(molecules.smiles_list), ["C", "CCO"], "Incorrect SMILES of valid molecules")
+
+
+class USPTO50kTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # the csv file is placed where the dataset expects its download
+        file_name = os.path.join(self.tmp_dir.name, os.path.basename(datasets.USPTO50k.url))
+        self.reactions = ["[CH3:1][OH:2].[CH3:3]I>>[CH3:1][O:2][CH3:3]", "invalid>>C",
+                          "[CH3:1][OH:2]>>[CH3:1][OH:2]", "[CH3:1][NH2:2].[CH3:3]Br>>[CH3:1][NH:2][CH3:3]"]
+        with open(file_name, "w") as fout:
+            writer = csv.writer(fout)
+            writer.writerow(["id", "class", "rxn_smiles"])
+            for i, reaction in enumerate(self.reactions):
+                writer.writerow([i, 1, reaction])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_smiles_list(self):
+        valid = [self.reactions[0], self.reactions[2], self.reactions[3]]
+        for as_synthon in [False, True]:
+            dataset = datasets.USPTO50k(self.tmp_dir.name, as_synthon=as_synthon, verbose=0)
+            self.assertIsInstance(dataset.smiles_list, data.dataset._StringList,
+                                  "SMILES are not stored in a string list")
+            self.assertEqual(len(dataset.smiles_list), len(dataset), "SMILES are not aligned with samples")
+            truth = [valid[i] for i in dataset.targets["sample id"]]
+            self.assertEqual(list(dataset.smiles_list), truth, "SMILES are not aligned with samples")
+
+
+class KnowledgeGraphDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        lines = [["a", "r1", "b"], ["b", "r2", "c"], ["\"d\tx\"", "r1", "a"], ["c", "", "e"], ["é", "r2", "\"f\ng\""],
+                 ["b", "r1", "h\"i\""]]
+        self.tsv_files = []
+        for i in range(2):
+            tsv_file = os.path.join(self.tmp_dir.name, "%d.tsv" % i)
+            with open(tsv_file, "w") as fout:
+                for line in lines[i * 3: i * 3 + 3]:
+                    fout.write("\t".join(line) + "\n")
+            self.tsv_files.append(tsv_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def load_csv(self, tsv_files):
+        inv_entity_vocab = {}
+        inv_relation_vocab = {}
+        triplets = []
+        for tsv_file in tsv_files:
+            with open(tsv_file, "r") as fin:
+                for h_token, r_token, t_token in csv.reader(fin, delimiter="\t"):
+                    h = inv_entity_vocab.setdefault(h_token, len(inv_entity_vocab))
+                    r = inv_relation_vocab.setdefault(r_token, len(inv_relation_vocab))
+                    t = inv_entity_vocab.setdefault(t_token, len(inv_entity_vocab))
+                    triplets.append((h, t, r))
+        return torch.tensor(triplets), list(inv_entity_vocab), list(inv_relation_vocab)
+
+    def test_load_tsv(self):
+        triplets, entity_vocab, relation_vocab = self.load_csv(self.tsv_files)
+        for cache in [False, True, True]:
+            for chunk_size in [1, 1024]:
+                dataset = data.KnowledgeGraphDataset()
+                dataset.load_tsvs(self.tsv_files, cache=cache, chunk_size=chunk_size)
+                self.assertTrue(torch.equal(dataset.graph.edge_list, triplets), "Incorrect triplets")
+                self.assertEqual(dataset.graph.edge_list.dtype, torch.long, "Incorrect triplets")
+                self.assertEqual(dataset.entity_vocab, entity_vocab, "Incorrect entity vocabulary")
+                self.assertEqual(dataset.relation_vocab, relation_vocab, "Incorrect relation vocabulary")
+                self.assertEqual(dataset.num_samples, [3, 3], "Incorrect number of samples")
+
+
+class NodeClassificationDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        nodes = [["p1", "0", "1", "0", "A"], ["p2", "1", "0", "0", "B"], ["p3", "0", "0", "1", "A"],
+                 ["p4", "1", "1", "0", "C"]]
+        edges = [["p1", "p2"], ["p3", "p1"], ["p4", "p5"], ["p5", "p2"]]
+        self.node_file = os.path.join(self.tmp_dir.name, "graph.content")
+        self.edge_file = os.path.join(self.tmp_dir.name, "graph.cites")
+        for file_name, lines in [(self.node_file, nodes), (self.edge_file, edges)]:
+            with open(file_name, "w") as fout:
+                for line in lines:
+                    fout.write("\t".join(line) + "\n")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def load_csv(self, node_file, edge_file):
+        inv_node_vocab = {}
+        inv_label_vocab = {}
+        node_feature = []
+        node_label = []
+        with open(node_file, "r") as fin:
+            for tokens in csv.reader(fin, delimiter="\t"):
+                inv_node_vocab[tokens[0]] = len(inv_node_vocab)
+                node_feature.append([int(token) for token in tokens[1:-1]])
+                node_label.append(inv_label_vocab.setdefault(tokens[-1], len(inv_label_vocab)))
+        edge_list = []
+        with open(edge_file, "r") as fin:
+            for h_token, t_token in csv.reader(fin, delimiter="\t"):
+                h = inv_node_vocab.setdefault(h_token, len(inv_node_vocab))
+                t = inv_node_vocab.setdefault(t_token, len(inv_node_vocab))
+                edge_list.append((h, t))
+        return torch.tensor(edge_list), torch.tensor(node_feature), torch.tensor(node_label), \
+               list(inv_node_vocab), list(inv_label_vocab)
+
+    def test_load_tsv(self):
+        edge_list, node_feature, node_label, node_vocab, label_vocab = self.load_csv(self.node_file, self.edge_file)
+        for cache in [False, True, True]:
+            dataset = data.NodeClassificationDataset()
+            dataset.load_tsv(self.node_file, self.edge_file, cache=cache)
+            graph = dataset.graph
+            self.assertTrue(torch.equal(graph.edge_list[:, :2], edge_list), "Incorrect edge list")
+            self.assertEqual(graph.num_node, len(node_vocab), "Incorrect number of nodes")
+            self.assertTrue(torch.equal(graph.node_feature[:len(node_feature)], node_feature),
+                            "Incorrect node features")
+            self.assertTrue(torch.equal(graph.node_label[:len(node_label)], node_label), "Incorrect node labels")
+            self.assertEqual(dataset.node_vocab, node_vocab, "Incorrect node vocabulary")
+            self.assertEqual(dataset.label_vocab, label_vocab, "Incorrect label vocabulary")
+
+
+class MoleculeStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, "molecule.csv")
+        self.smiles = ["C", "CCO", "c1ccccc1", "CC(=O)O", "CCCCCCCCCC", "CCN(CC)CC", "O=C=O", "CCl", "CCN", "OCCO",
+                       "C1CC1", "CC#N", "CC=O"]
+        with open(self.file_name, "w") as fout:
+            fout.write("smiles,y\n")
+            for i, smiles in enumerate(self.smiles):
+                fout.write("%s,%d\n" % (smiles, i))
+                if i % 5 == 4:
+                    # blank lines are skipped
+                    fout.write("\n  \n")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_shards(self, dataset, world_size):
+        shards = []
+        for rank in range(world_size):
+            os.environ["RANK"] = str(rank)
+            os.environ["WORLD_SIZE"] = str(world_size)
+            try:
+                shards.append([item["y"] for item in dataset])
+            finally:
+                os.environ.pop("RANK")
+                os.environ.pop("WORLD_SIZE")
+        return shards
+
+    def test_shard(self):
+        for world_size in [1, 2, 3, 7]:
+            for chunk_size in [1, 7, 1024]:
+                dataset = data.MoleculeStream()
+                dataset.load_file(self.file_name, chunk_size=chunk_size)
+                shards = self.read_shards(dataset, world_size)
+                result = [y for shard in shards for y in shard]
+                self.assertEqual(result, list(range(len(self.smiles))), "Incorrect byte offset sharding")
+
+    def test_boundary(self):
+        # all lines have the same length, so shard boundaries fall right after newlines
+        with open(self.file_name, "w") as fout:
+            fout.write("smiles,y\n")
+            for i in range(10):
+                fout.write("C,%d\n" % i)
+        for world_size in [2, 5, 10]:
+            for chunk_size in [1, 4, 1024]:
+                dataset = data.MoleculeStream()
+                dataset.load_file(self.file_name, chunk_size=chunk_size)
+                shards = self.read_shards(dataset, world_size)
+                result = [y for shard in shards for y in shard]
+                self.assertEqual(len(result), len(set(result)), "Duplicate lines across shards")
+                self.assertEqual(result, list(range(10)), "Incorrect byte offset sharding")
+
+    def test_shuffle(self):
+        dataset = data.MoleculeStream()
+        dataset.load_file(self.file_name, shuffle=True, buffer_size=4)
+        shards = self.read_shards(dataset, 2)
+        self.assertEqual(shards, self.read_shards(dataset, 2), "Shuffling is not deterministic")
+        self.assertEqual(sorted(y for shard in shards for y in shard), list(range(len(self.smiles))),
+                         "Incorrect shuffled shards")
+        dataset.set_epoch(1)
+        self.assertNotEqual(shards, self.read_shards(dataset, 2), "Shuffling doesn't change with epochs")
+
+        with self.assertRaises(ValueError):
+            dataset.load_file(self.file_name, shuffle=True, buffer_size=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -149,6 +149,25 @@ class GraphTest(unittest.TestCase):
             self.assertTrue(torch.equal(edge_feat_result, edge_feat_truth), "Incorrect feature in unpack")
             self.assertTrue(torch.equal(graph_feat_result, graph_feat_truth), "Incorrect feature in unpack")
 
+        node_feats = packed_graph.unpack_data(packed_graph.node_feature, type="node")
+        edge_feats = packed_graph.unpack_data(packed_graph.edge_feature, type="edge")
+        self.assertEqual(len(graphs), len(list(packed_graph)), "Incorrect length in iteration")
+        for graph, new_graph, node_feat, edge_feat in zip(graphs, packed_graph, node_feats, edge_feats):
+            self.assertTrue(torch.equal(new_graph.edge_list, graph.edge_list), "Incorrect index in iteration")
+            self.assertTrue(torch.equal(node_feat, graph.node_feature), "Incorrect node data in unpack")
+            self.assertTrue(torch.equal(edge_feat, graph.edge_feature), "Incorrect edge data in unpack")
+
+        # unpacked graphs are copies of the packed graph
+        node_feature = packed_graph.node_feature.clone()
+        edge_weight = packed_graph.edge_weight.clone()
+        for graph in packed_graph.unpack():
+            graph.node_feature.zero_()
+            graph.edge_weight.zero_()
+        self.assertTrue(torch.equal(packed_graph.node_feature, node_feature), "Unpacked graphs share storage")
+        self.assertTrue(torch.equal(packed_graph.edge_weight, edge_weight), "Unpacked graphs share storage")
+        iterator = iter(packed_graph)
+        self.assertTrue(torch.equal(next(iterator).edge_list, graphs[0].edge_list), "Incorrect index in iteration")
+
         graph = data.Graph(self.edge_list, self.edge_weight, self.num_node,
                            node_feature=self.node_feature, edge_feature=self.edge_feature)
         graphs = graphs[2:]
@@ -325,6 +344,16 @@ class GraphTest(unittest.TestCase):
         stat_result = sorted((graph.num_node, graph.num_edge) for graph in packed_graph2)
         self.assertEqual(stat_result, stat_truth, "Incorrect connected components")
 
+        # components are labeled by their minimal node
+        graph = data.Graph(self.edge_list[::4], num_node=self.num_node)
+        reachable = graph.adjacency.to_dense() + graph.adjacency.to_dense().t() + torch.eye(self.num_node)
+        for i in range(self.num_node):
+            reachable = (reachable @ reachable > 0).float()
+        truth = graph.split(reachable.argmax(dim=-1))
+        result = graph.connected_components()[0]
+        self.assertTrue(torch.equal(result.edge_list, truth.edge_list), "Incorrect connected components")
+        self.assertTrue(torch.equal(result.num_nodes, truth.num_nodes), "Incorrect connected components")
+
     def test_merge(self):
         graph = data.Graph(self.edge_list, self.edge_weight, self.num_node)
         graph2graph = torch.randint(2, (6,))
@@ -358,6 +387,116 @@ class GraphTest(unittest.TestCase):
         adj_truth = adj_truth.triu()
         self.assertTrue(torch.equal(adj_result, adj_truth), "Incorrect directed graph")
 
+    def test_from_trusted(self):
+        graphs = []
+        for i in range(3):
+            graph = data.Graph(self.edge_list, self.edge_weight, self.num_node,
+                               node_feature=self.node_feature, edge_feature=self.edge_feature)
+            graphs.append(graph)
+        packed_graph = data.Graph.pack(graphs)
+        edge_list = packed_graph.edge_list - packed_graph._offsets.unsqueeze(-1)
+        edge_list = edge_list[:, :2]
+        data_dict, meta_dict = packed_graph.data_by_meta()
+        truth = data.PackedGraph(edge_list, packed_graph.edge_weight, packed_graph.num_nodes,
+                                 packed_graph.num_edges, meta_dict=meta_dict, **data_dict)
+        result = data.PackedGraph._from_trusted(edge_list, packed_graph.edge_weight, packed_graph.num_nodes,
+                                                packed_graph.num_edges, meta_dict=meta_dict, **data_dict)
+        self.assertTrue(torch.equal(result.edge_list, truth.edge_list), "Incorrect trusted construction")
+        self.assertTrue(torch.equal(result.num_node, truth.num_node), "Incorrect trusted construction")
+        self.assertTrue(torch.equal(result.num_edge, truth.num_edge), "Incorrect trusted construction")
+        self.assertTrue(torch.equal(result._offsets, truth._offsets), "Incorrect trusted construction")
+        self.assertEqual(result.meta_dict, truth.meta_dict, "Incorrect trusted construction")
+        for k, v in truth.data_dict.items():
+            self.assertTrue(torch.equal(result.data_dict[k], v), "Incorrect trusted construction")
+
+    def test_match(self):
+        edge_list = torch.cat([self.edge_list, self.edge_list[:5]])
+        edge_list = torch.cat([edge_list, torch.randint(3, (len(edge_list), 1))], dim=-1)
+        graph = data.Graph(edge_list, num_node=self.num_node, num_relation=3)
+
+        pattern = torch.cat([edge_list[:10], torch.randint(-1, self.num_node, (20, 3))])
+        pattern[:, 2] = pattern[:, 2].clamp(max=2)
+        index, num_match = graph.match(pattern)
+        index = index.split(num_match.tolist())
+        for i in range(len(pattern)):
+            mask = pattern[i] != -1
+            truth = (edge_list[:, mask] == pattern[i, mask]).all(dim=-1).nonzero().flatten()
+            self.assertTrue(torch.equal(index[i], truth), "Incorrect edge match")
+
+        for h, t, r in pattern[10:].clamp(min=0).tolist():
+            truth = (edge_list == torch.tensor([h, t, r])).all(dim=-1).nonzero().flatten()
+            self.assertTrue(torch.equal(graph.index((h, t, r)), truth), "Incorrect edge index")
+            truth = (edge_list[:, 1] == t).nonzero().flatten()
+            self.assertTrue(torch.equal(graph.index((None, t)), truth), "Incorrect edge index")
+            self.assertEqual((h, t) in graph, bool(self.adjacency[h, t] > 0), "Incorrect edge containment")
+
+        # single queries scan the edges and don't build the sorted index
+        graph = data.Graph(edge_list, num_node=self.num_node, num_relation=3)
+        for h, t, r in pattern[10:].clamp(min=0).tolist():
+            truth = (edge_list[:, 1] == t).nonzero().flatten()
+            self.assertTrue(torch.equal(graph.index((None, t)), truth), "Incorrect edge index")
+            self.assertEqual((h, t) in graph, bool(self.adjacency[h, t] > 0), "Incorrect edge containment")
+        self.assertFalse(any(isinstance(k, tuple) and k[0] == "edge_key" for k in graph._get_cache()),
+                         "Single edge queries shouldn't build the sorted index")
+
+    def test_builder(self):
+        batch_size = 4
+        builder = data.PackedGraphBuilder(batch_size, node_capacity=1, edge_capacity=1)
+        graphs = [[[], []] for i in range(batch_size)]
+        for i in range(20):
+            mask = torch.rand(batch_size) > 0.3
+            feature = torch.rand(batch_size, self.num_feature)
+            builder.append_nodes(mask, {"node_feature": feature})
+            for j in mask.nonzero().flatten().tolist():
+                graphs[j][0].append(feature[j])
+            num_nodes = builder.num_nodes.clamp(min=1)
+            edges = (torch.rand(batch_size, 2) * num_nodes.unsqueeze(-1)).long()
+            mask = builder.num_nodes > 0
+            # pack tentative edges in between to test incremental packing
+            num_edges = builder.num_edges
+            builder.append_edges(None, torch.zeros(batch_size, 2, dtype=torch.long))
+            builder.pack()
+            builder.truncate_edges(num_edges)
+            builder.append_edges(mask, edges)
+            if i % 3 == 0:
+                builder.pack()
+            for j in mask.nonzero().flatten().tolist():
+                graphs[j][1].append(edges[j].tolist())
+        # discard the last edges
+        num_edges = builder.num_edges
+        builder.append_edges(None, torch.zeros(batch_size, 2, dtype=torch.long))
+        with self.assertRaises(ValueError):
+            builder.truncate_edges(builder.num_edges + 1)
+        with self.assertRaises(ValueError):
+            builder.truncate_edges(num_edges[:2])
+        builder.truncate_edges(num_edges)
+
+        truth = []
+        for node_feature, edge_list in graphs:
+            node_feature = torch.stack(node_feature) if node_feature else torch.zeros(0, self.num_feature)
+            truth.append(data.Graph(edge_list, num_node=len(node_feature), node_feature=node_feature))
+        truth = data.Graph.pack(truth)
+        result = builder.pack()
+        self.assertTrue(torch.equal(result.num_nodes, truth.num_nodes), "Incorrect graph builder")
+        self.assertTrue(torch.equal(result.num_edges, truth.num_edges), "Incorrect graph builder")
+        self.assertTrue(torch.equal(result.edge_list, truth.edge_list), "Incorrect graph builder")
+        self.assertTrue(torch.equal(result.node_feature, truth.node_feature), "Incorrect graph builder")
+
+        # unchanged edges reuse the last packed edge list, and new nodes shift the offsets of later graphs
+        self.assertIs(builder.pack().edge_list, result.edge_list, "Unchanged edges should reuse the packed edge list")
+        feature = torch.rand(batch_size, self.num_feature)
+        builder.append_nodes(None, {"node_feature": feature})
+        for j in range(batch_size):
+            graphs[j][0].append(feature[j])
+        truth = []
+        for node_feature, edge_list in graphs:
+            node_feature = torch.stack(node_feature)
+            truth.append(data.Graph(edge_list, num_node=len(node_feature), node_feature=node_feature))
+        truth = data.Graph.pack(truth)
+        result = builder.pack()
+        self.assertTrue(torch.equal(result.edge_list, truth.edge_list), "Incorrect graph builder")
+        self.assertTrue(torch.equal(result.node_feature, truth.node_feature), "Incorrect graph builder")
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
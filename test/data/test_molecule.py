@@ -3,6 +3,7 @@ import unittest
 import torch
 
 from torchdrug import data
+from torchdrug.data import feature
 
 
 class MoleculeTest(unittest.TestCase):
@@ -36,6 +37,30 @@ class MoleculeTest(unittest.TestCase):
         mol = data.Molecule.from_smiles(self.smiles, graph_feature="ecfp")
         self.assertTrue((mol.graph_feature > 0).any(), "Incorrect ECFP feature")
 
+    def test_feature_table(self):
+        smiles_list = [self.smiles, "[NH4+].[O-]C(=O)C1CC1", "C1CCC1C[CH2]", "F/C=C/Cl", "c1ccc2[nH]ccc2c1", "[2H]OC#N"]
+        tables = [v for v in vars(feature).values() if isinstance(v, feature.FeatureTable)]
+        self.assertTrue(tables, "No feature table is found")
+        self.assertIsInstance(feature.atom_default, feature.FeatureTable, "Default atom feature is not memoized")
+        self.assertIsInstance(feature.bond_default, feature.FeatureTable, "Default bond feature is not memoized")
+        for smiles in smiles_list:
+            mol = data.Molecule.from_smiles(smiles).to_molecule()
+            for table in tables:
+                objs = mol.GetBonds() if "bond" in table.__name__ else mol.GetAtoms()
+                for obj in objs:
+                    truth = table.func(obj) + (table.extra(obj) if table.extra else [])
+                    self.assertEqual(table(obj), truth,
+                                     "Incorrect memoized feature `%s` for `%s`" % (table.__name__, smiles))
+
+        for node_feature, edge_feature in [("default", "default"), ("property_prediction", "property_prediction"),
+                                           ("pretrain", "pretrain")]:
+            mols = [data.Molecule.from_smiles(smiles, node_feature=node_feature, edge_feature=edge_feature)
+                    for smiles in smiles_list]
+            result = data.PackedMolecule.from_smiles(smiles_list, node_feature=node_feature, edge_feature=edge_feature)
+            truth = data.Molecule.pack(mols)
+            self.assertTrue(torch.equal(result.node_feature, truth.node_feature), "Incorrect packed atom features")
+            self.assertTrue(torch.equal(result.edge_feature, truth.edge_feature), "Incorrect packed bond features")
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 
 import torch
@@ -18,6 +20,7 @@ class SplitTest(unittest.TestCase):
                   "CCNc1nc(NC(C)(C)C)nc(SC)n1",
                   "CCNc1nc(NC(C)C)nc(OC)n1",
                   "CCNc1nc(Cl)nc(NCC)n1"]
+        self.smiles = smiles
         self.dataset = data.MoleculeDataset()
         self.dataset.load_smiles(smiles, {})
         self.lengths = [5, 5]
@@ -30,6 +33,56 @@ class SplitTest(unittest.TestCase):
         self.assertEqual(len(test_scaffolds), 1, "Incorrect scaffold split")
         self.assertFalse(train_scaffolds.intersection(test_scaffolds), "Incorrect scaffold split")
 
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, "split.pt")
+            torch.manual_seed(0)
+            truth = data.scaffold_split(self.dataset, self.lengths, cache_file=cache_file)
+            truth_random = torch.rand(10)
+            torch.manual_seed(0)
+            result = data.scaffold_split(self.dataset, self.lengths, cache_file=cache_file)
+            self.assertEqual(type(result), type(truth), "Incorrect cached split")
+            for x, y in zip(result, truth):
+                self.assertIsInstance(x.indices, torch.Tensor, "Incorrect cached split")
+                self.assertTrue(torch.equal(x.indices, y.indices), "Incorrect cached split")
+            self.assertTrue(torch.equal(torch.rand(10), truth_random),
+                            "Random generator is not advanced by the cached split")
+
+            # a different seed gives a different split, even if the cache file exists
+            for seed in range(1, 5):
+                torch.manual_seed(seed)
+                truth = data.scaffold_split(self.dataset, self.lengths)
+                torch.manual_seed(seed)
+                result = data.scaffold_split(self.dataset, self.lengths, cache_file=cache_file)
+                for x, y in zip(result, truth):
+                    self.assertTrue(torch.equal(x.indices, y.indices), "Split is loaded from cache for another seed")
+
+            # same size but different molecules, where the cached indices would mix scaffolds
+            dataset = data.MoleculeDataset()
+            dataset.load_smiles([self.smiles[i // 2 + i % 2 * 5] for i in range(10)], {})
+            train, test = data.scaffold_split(dataset, self.lengths, cache_file=cache_file)
+            train_scaffolds = set(sample["graph"].to_scaffold() for sample in train)
+            test_scaffolds = set(sample["graph"].to_scaffold() for sample in test)
+            self.assertFalse(train_scaffolds.intersection(test_scaffolds), "Stale split is loaded from cache")
+
+            cache_file = os.path.join(tmp_dir, "ordered_split.pt")
+            truth = data.ordered_scaffold_split(self.dataset, None, cache_file=cache_file)
+            result = data.ordered_scaffold_split(self.dataset, None, cache_file=cache_file)
+            self.assertEqual(type(result), type(truth), "Incorrect cached split")
+            for x, y in zip(result, truth):
+                self.assertEqual(x.indices, y.indices, "Incorrect cached split")
+
+    def test_key(self):
+        keys = torch.randint(10, (100,))
+        splits = data.key_split(range(100), keys, [50, 30, 20])
+        indexes = [split.indices for split in splits]
+        self.assertTrue(all(isinstance(index, torch.Tensor) for index in indexes), "Incorrect key split")
+        self.assertTrue(torch.equal(torch.cat(indexes).sort()[0], torch.arange(100)), "Incorrect key split")
+        for i in range(len(indexes)):
+            for j in range(i + 1, len(indexes)):
+                overlap = set(keys[indexes[i]].tolist()).intersection(keys[indexes[j]].tolist())
+                self.assertFalse(overlap, "Incorrect key split")
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 
 from itertools import product
@@ -94,6 +96,133 @@ class SPMMTest(unittest.TestCase):
             self.assertTrue(torch.allclose(result_input, truth_input),
                             "Incorrect generalized rspmm backward (sum=`%s`, mul=`%s`)" % (sum_op, mul_op))
 
+    def test_csr_spmm(self):
+        edge_list = torch.cat([self.graph.edge_list, self.graph.edge_list[:10]])
+        graph = data.Graph(edge_list, torch.rand(len(edge_list)), num_node=self.num_node)
+        graph.edge_weight.requires_grad_()
+        self.input.requires_grad_()
+
+        node_in, node_out = graph.edge_list.t()
+        for sum_op, mul_op in self.operators:
+            result = functional.csr_spmm(graph.csc, graph.csr, graph.edge_weight, self.input, sum=sum_op, mul=mul_op)
+            sum_func = getattr(torch_scatter, "scatter_%s" % sum_op)
+            mul_func = getattr(torch, mul_op)
+            message = mul_func(graph.edge_weight.unsqueeze(-1), self.input[node_in])
+            truth = sum_func(message, node_out, dim=0, dim_size=self.num_node)
+            if isinstance(truth, tuple):
+                truth = truth[0]
+            self.assertTrue(torch.allclose(result, truth, atol=1e-6),
+                            "Incorrect csr spmm forward (sum=`%s`, mul=`%s`)" % (sum_op, mul_op))
+
+            result_edge, result_input = torch.autograd.grad(result, (graph.edge_weight, self.input), self.output_grad)
+            truth_edge, truth_input = torch.autograd.grad(truth, (graph.edge_weight, self.input), self.output_grad)
+            self.assertTrue(torch.allclose(result_edge, truth_edge, atol=1e-6),
+                            "Incorrect csr spmm backward (sum=`%s`, mul=`%s`)" % (sum_op, mul_op))
+            self.assertTrue(torch.allclose(result_input, truth_input, atol=1e-6),
+                            "Incorrect csr spmm backward (sum=`%s`, mul=`%s`)" % (sum_op, mul_op))
+        # add/mul goes through torch.sparse unless the extension is precompiled, so check its kernel directly
+        result = functional.spmm.CSRGeneralizedSPMMFunction.apply("add_mul", graph.csc, graph.csr,
+                                                                  graph.edge_weight, self.input)
+        message = graph.edge_weight.unsqueeze(-1) * self.input[node_in]
+        truth = torch_scatter.scatter_add(message, node_out, dim=0, dim_size=self.num_node)
+        self.assertTrue(torch.allclose(result, truth, atol=1e-6), "Incorrect csr spmm kernel forward")
+        self.assertIs(graph.csr[0], graph.csr[0], "Compressed index is not cached")
+        # degrees are summed over the cached indexes, which are weighted by edges
+        truth = torch_scatter.scatter_add(graph.edge_weight, node_in, dim_size=self.num_node)
+        self.assertTrue(torch.allclose(graph.degree_in, truth), "Incorrect in-degree from cached index")
+        truth = torch_scatter.scatter_add(graph.edge_weight, node_out, dim_size=self.num_node)
+        self.assertTrue(torch.allclose(graph.degree_out, truth), "Incorrect out-degree from cached index")
+
+        graph = self.knowledge_graph
+        node_in, node_out, relation = graph.edge_list.t()
+        result = functional.csr_spmm(graph.relational_csc, graph.relational_csr, graph.edge_weight, self.input)
+        message = graph.edge_weight.unsqueeze(-1) * self.input[node_in]
+        truth = torch_scatter.scatter_add(message, node_out * self.num_relation + relation, dim=0,
+                                          dim_size=self.num_node * self.num_relation)
+        self.assertTrue(torch.allclose(result, truth, atol=1e-6), "Incorrect relational csr spmm forward")
+        self.assertIs(graph.relational_csc[0], graph.relational_csc[0], "Compressed index is not cached")
+        truth = torch_scatter.scatter_add(graph.edge_weight, node_in, dim_size=self.num_node)
+        self.assertTrue(torch.allclose(graph.degree_in, truth), "Incorrect in-degree")
+
+    def test_csr_spmm_fallback(self):
+        graph = self.graph
+        graph.edge_weight.requires_grad_()
+        self.input.requires_grad_()
+        node_in, node_out = graph.edge_list.t()
+        message = graph.edge_weight.unsqueeze(-1) * self.input[node_in]
+        truth = torch_scatter.scatter_add(message, node_out, dim=0, dim_size=self.num_node)
+        truth_edge, truth_input = torch.autograd.grad(truth, (graph.edge_weight, self.input), self.output_grad)
+
+        spmm = functional.spmm.spmm
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, "broken.cpp")
+            with open(source, "w") as fout:
+                fout.write("#error this extension doesn't compile\n")
+            functional.spmm.spmm = utils.load_extension("broken", [source], build_directory=tmp_dir)
+            try:
+                # add/mul never compiles the extension, and silently uses torch.sparse instead
+                result = functional.csr_spmm(graph.csc, graph.csr, graph.edge_weight, self.input)
+                self.assertNotIn("module", functional.spmm.spmm.__dict__, "Extension is compiled in csr spmm")
+                self.assertNotIn("error", functional.spmm.spmm.__dict__, "Extension is compiled in csr spmm")
+                self.assertTrue(torch.allclose(result, truth, atol=1e-6), "Incorrect csr spmm fallback forward")
+                result_edge, result_input = torch.autograd.grad(result, (graph.edge_weight, self.input),
+                                                                self.output_grad)
+                self.assertTrue(torch.allclose(result_edge, truth_edge, atol=1e-6),
+                                "Incorrect csr spmm fallback backward")
+                self.assertTrue(torch.allclose(result_input, truth_input, atol=1e-6),
+                                "Incorrect csr spmm fallback backward")
+
+                # PyTorch < 1.10 has no CSR tensors, and uses COO tensors instead
+                sparse_csr_tensor = torch.sparse_csr_tensor
+                del torch.sparse_csr_tensor
+                try:
+                    result = functional.csr_spmm(graph.csc, graph.csr, graph.edge_weight, self.input)
+                finally:
+                    torch.sparse_csr_tensor = sparse_csr_tensor
+                self.assertTrue(torch.allclose(result, truth, atol=1e-6), "Incorrect csr spmm COO fallback forward")
+                result_edge, result_input = torch.autograd.grad(result, (graph.edge_weight, self.input),
+                                                                self.output_grad)
+                self.assertTrue(torch.allclose(result_edge, truth_edge, atol=1e-6),
+                                "Incorrect csr spmm COO fallback backward")
+                self.assertTrue(torch.allclose(result_input, truth_input, atol=1e-6),
+                                "Incorrect csr spmm COO fallback backward")
+
+                with self.assertWarns(UserWarning), self.assertRaises(Exception):
+                    functional.csr_spmm(graph.csc, graph.csr, graph.edge_weight, self.input, sum="max")
+            finally:
+                functional.spmm.spmm = spmm
+
+    def test_csr_rspmm(self):
+        edge_list = torch.cat([self.knowledge_graph.edge_list, self.knowledge_graph.edge_list[:10]])
+        graph = data.Graph(edge_list, torch.rand(len(edge_list)), num_node=self.num_node,
+                           num_relation=self.num_relation)
+        graph.edge_weight.requires_grad_()
+        self.relation.requires_grad_()
+        self.input.requires_grad_()
+
+        node_in, node_out, relation = graph.edge_list.t()
+        for sum_op, mul_op in self.operators:
+            result = functional.csr_rspmm(graph.csc, graph.csr, relation, graph.edge_weight, self.relation,
+                                          self.input, sum=sum_op, mul=mul_op)
+            sum_func = getattr(torch_scatter, "scatter_%s" % sum_op)
+            mul_func = getattr(torch, mul_op)
+            message = graph.edge_weight.unsqueeze(-1) * mul_func(self.relation[relation], self.input[node_in])
+            truth = sum_func(message, node_out, dim=0, dim_size=self.num_node)
+            if isinstance(truth, tuple):
+                truth = truth[0]
+            self.assertTrue(torch.allclose(result, truth, atol=1e-6),
+                            "Incorrect csr rspmm forward (sum=`%s`, mul=`%s`)" % (sum_op, mul_op))
+
+            inputs = (graph.edge_weight, self.relation, self.input)
+            result_edge, result_relation, result_input = torch.autograd.grad(result, inputs, self.output_grad)
+            truth_edge, truth_relation, truth_input = torch.autograd.grad(truth, inputs, self.output_grad)
+            self.assertTrue(torch.allclose(result_edge, truth_edge, atol=1e-6),
+                            "Incorrect csr rspmm backward (sum=`%s`, mul=`%s`)" % (sum_op, mul_op))
+            self.assertTrue(torch.allclose(result_relation, truth_relation, atol=1e-5),
+                            "Incorrect csr rspmm backward (sum=`%s`, mul=`%s`)" % (sum_op, mul_op))
+            self.assertTrue(torch.allclose(result_input, truth_input, atol=1e-6),
+                            "Incorrect csr rspmm backward (sum=`%s`, mul=`%s`)" % (sum_op, mul_op))
+
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,12 +1,45 @@
 import os
+import gc
 import unittest
 
 import torch
 from torch import multiprocessing as mp
 
+from torchdrug import data
 from torchdrug.utils import comm
 
 
+def share_worker(rank, smiles_list, queue):
+    os.environ["RANK"] = os.environ["LOCAL_RANK"] = str(rank)
+    comm.init_process_group("gloo", init_method="env://", rank=rank)
+    if comm.get_local_rank() == 0:
+        # bfloat16 has no numpy counterpart
+        obj = {"a": torch.arange(12).view(3, 4), "b": [torch.ones(5, dtype=torch.bool), 3],
+               "c": torch.arange(6, dtype=torch.bfloat16) / 4}
+        dataset = data.MoleculeDataset()
+        dataset.load_smiles(smiles_list, {"y": list(range(len(smiles_list)))})
+    else:
+        obj = dataset = None
+    obj = comm.share_memory(obj)
+    is_shared = comm.share_memory(obj)["a"] is obj["a"]
+    result = (rank, obj["a"].tolist(), obj["b"][0].tolist(), obj["b"][1], obj["c"].dtype, obj["c"].tolist(),
+              is_shared)
+    # the first process shares a tensor again, after other processes have released it
+    obj = obj["a"] if comm.get_local_rank() == 0 else None
+    gc.collect()
+    obj = comm.share_memory(obj)
+    dataset = comm.share_memory(dataset)
+    graph = dataset.get_batch(range(len(dataset)))["graph"]
+    # shared tensors are not kept alive by the module once the caller releases them
+    tmp = comm.share_memory(torch.ones(3) if comm.get_local_rank() == 0 else None)
+    num_shared = len(comm._shared_tensors)
+    del tmp
+    gc.collect()
+    is_released = len(comm._shared_tensors) < num_shared
+    queue.put(result + (obj.tolist(), list(dataset.smiles_list), graph.atom_type.tolist(), is_released))
+    comm.synchronize()
+
+
 def worker(rank, reduce_fn, objs, queue, event):
     comm.init_process_group("nccl", init_method="env://", rank=rank)
     result = reduce_fn(objs[rank])
@@ -74,5 +107,58 @@ class ReduceTest(unittest.TestCase):
         spawn_ctx.join()
 
 
+class LocalRankTest(unittest.TestCase):
+
+    def test_local_rank(self):
+        environ = dict(os.environ)
+        try:
+            for key in ["RANK", "LOCAL_RANK", "WORLD_SIZE"]:
+                os.environ.pop(key, None)
+            self.assertEqual(comm.get_local_rank(), 0, "Incorrect local rank for single process")
+            os.environ["RANK"] = "5"
+            os.environ["WORLD_SIZE"] = "8"
+            with self.assertRaises(ValueError):
+                comm.get_local_rank()
+            os.environ["LOCAL_RANK"] = "1"
+            self.assertEqual(comm.get_local_rank(), 1, "Incorrect local rank")
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+
+class ShareMemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.num_worker = 2
+        self.smiles = ["C", "CCO", "c1ccccc1", "CC(=O)O", "CCN(CC)CC"]
+        self.ctx = mp.get_context("spawn")
+        os.environ["WORLD_SIZE"] = str(self.num_worker)
+        os.environ["MASTER_ADDR"] = "localhost"
+        os.environ["MASTER_PORT"] = "1025"
+
+    def test_share_memory(self):
+        queue = self.ctx.Queue()
+        spawn_ctx = mp.spawn(share_worker, (self.smiles, queue), nprocs=self.num_worker, join=False)
+        truth = data.MoleculeDataset()
+        truth.load_smiles(self.smiles, {"y": list(range(len(self.smiles)))})
+        truth = data.graph_collate(truth[:])["graph"]
+        for i in range(self.num_worker):
+            rank, a, b, c, dtype, e, is_shared, d, smiles_list, atom_type, is_released = queue.get(timeout=60)
+            self.assertTrue(is_released, "Shared tensors are not released")
+            self.assertEqual(a, torch.arange(12).view(3, 4).tolist(), "Incorrect shared tensor")
+            self.assertEqual(d, a, "Incorrect shared tensor after release")
+            self.assertEqual(b, [True] * 5, "Incorrect shared tensor")
+            self.assertEqual(c, 3, "Incorrect shared object")
+            self.assertEqual(dtype, torch.bfloat16, "Incorrect dtype of shared tensor")
+            self.assertEqual(e, (torch.arange(6) / 4).tolist(), "Incorrect shared tensor")
+            self.assertTrue(is_shared, "Shared tensors are copied again")
+            self.assertEqual(smiles_list, self.smiles, "Incorrect shared dataset")
+            self.assertEqual(atom_type, truth.atom_type.tolist(), "Incorrect shared dataset")
+        spawn_ctx.join()
+        if os.path.isdir("/dev/shm"):
+            self.assertFalse([f for f in os.listdir("/dev/shm") if f.startswith("torchdrug_")],
+                             "Shared memory files are not removed")
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
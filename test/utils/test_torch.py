@@ -1,4 +1,7 @@
+import os
+import tempfile
 import unittest
+import importlib
 
 import torch
 
@@ -33,6 +36,41 @@ class TorchExtensionTest(unittest.TestCase):
         self.assertTrue(torch.equal(result._values(), truth._values()), "Incorrect sparse COO tensor construction")
         self.assertEqual(result.shape, truth.shape, "Incorrect sparse COO tensor construction")
 
+    def test_load_extension(self):
+        loader = utils.torch.torch_ext
+        self.assertEqual(loader.module_name, "torchdrug.utils.extension.torch_ext",
+                         "Incorrect name of precompiled extension")
+        loader = utils.load_extension("torch_ext", ["/tmp/extension/torch_ext.cpp"])
+        self.assertIsNone(loader.module_name, "Incorrect name of precompiled extension")
+        self.assertIsNone(loader.load_precompiled(), "Incorrect fallback of precompiled extension")
+
+        # a python module stands in for a compiled extension inside the package
+        package_path = os.path.dirname(os.path.abspath(utils.torch.__file__))
+        with tempfile.TemporaryDirectory(dir=os.path.join(package_path, "extension")) as tmp_dir:
+            source = os.path.join(tmp_dir, "fake_ext.cpp")
+            with open(source, "w") as fout:
+                fout.write("int x = 0;")
+            module_file = os.path.join(tmp_dir, "fake_ext.py")
+            with open(module_file, "w") as fout:
+                fout.write("x = 0")
+            importlib.invalidate_caches()
+            loader = utils.load_extension("fake_ext", [source])
+            self.assertEqual(loader.module_name, "torchdrug.utils.extension.%s.fake_ext" % os.path.basename(tmp_dir),
+                             "Incorrect name of precompiled extension")
+            with self.assertWarns(UserWarning):
+                self.assertIsNone(loader.load_precompiled(), "Extension without checksum is not rejected")
+
+            with open(module_file + ".md5", "w") as fout:
+                fout.write(utils.torch.get_source_checksum([source]))
+            module = loader.load_precompiled()
+            self.assertIsNotNone(module, "Precompiled extension is not loaded")
+            self.assertEqual(module.__name__, loader.module_name, "Incorrect precompiled extension")
+
+            with open(source, "a") as fout:
+                fout.write("\nint y = 0;")
+            with self.assertWarns(UserWarning):
+                self.assertIsNone(loader.load_precompiled(), "Stale extension is not rejected")
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Precompile the C++ extensions of TorchDrug.
+
+The compiled modules are placed beside their sources, so that they are imported directly
+instead of being compiled just-in-time on the first run.
+
+Usage:
+    python -m torchdrug.build_ext [-v]
+"""
+
+import os
+import glob
+import shutil
+import argparse
+import tempfile
+import importlib.machinery
+
+from torchdrug import utils
+from torchdrug.layers.functional import spmm, embedding
+
+
+def get_extensions():
+    return [utils.torch.torch_ext, spmm.spmm, embedding.embedding]
+
+
+def build_extension(loader, verbose=False):
+    """
+    Compile an extension and copy the shared library beside its sources.
+
+    Parameters:
+        loader (LazyExtensionLoader): extension loader returned by :func:`utils.load_extension`
+        verbose (bool, optional): print the compilation commands or not
+    """
+    target_path = os.path.dirname(os.path.abspath(loader.sources[0]))
+    target = os.path.join(target_path, loader.name + importlib.machinery.EXTENSION_SUFFIXES[0])
+    with tempfile.TemporaryDirectory() as build_directory:
+        loader.verbose = verbose
+        loader.load_jit(build_directory)
+        library = glob.glob(os.path.join(build_directory, "%s.*" % loader.name))
+        library = [file for file in library if os.path.splitext(file)[1] in (".so", ".pyd")]
+        shutil.copy(library[0], target)
+    with open(target + ".md5", "w") as fout:
+        fout.write(utils.torch.get_source_checksum(loader.sources))
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompile the C++ extensions of TorchDrug.")
+    parser.add_argument("-v", "--verbose", help="print the compilation commands", action="store_true")
+    args = parser.parse_args()
+
+    for loader in get_extensions():
+        print("Building %s" % loader.module_name)
+        target = build_extension(loader, args.verbose)
+        print("Saved to %s" % target)
+
+
+if __name__ == "__main__":
+    main()
@@ -48,19 +48,42 @@ class Engine(core.Configurable):
         scheduler (lr_scheduler._LRScheduler, optional): scheduler
         gpus (list of int, optional): GPU ids. By default, CPUs will be used.
             For multi-node multi-process case, repeat the GPU ids for each node.
-        batch_size (int, optional): batch size of a single CPU / GPU
+        batch_size (int, optional): batch size of a single CPU / GPU.
+            Ignored if ``max_node`` or ``max_edge`` is specified.
         gradient_interval (int, optional): perform a gradient update every n batches.
             This creates an equivalent batch size of ``batch_size * gradient_interval`` for optimization.
         num_worker (int, optional): number of CPU workers per GPU
         log_interval (int, optional): log every n gradient updates
+        shared_memory (bool, optional): for distributed training, place the datasets and the graph buffers of the task
+            in shared memory, so that processes on the same node share a single copy.
+            This only deduplicates datasets after they are constructed, since the engine takes them as arguments.
+            To also avoid the full construction on each process, load molecules with
+            ``load_smiles(distributed=True)``, or build the datasets on the first process of each node and pass
+            them through :func:`comm.share_memory <torchdrug.utils.comm.share_memory>` before the engine.
+            Datasets that are already shared are not copied again.
+        max_node (int, optional): if specified, batch graphs by a budget of nodes instead of ``batch_size``.
+            See :class:`data.DynamicBatchSampler <torchdrug.data.DynamicBatchSampler>`.
+        max_edge (int, optional): if specified, batch graphs by a budget of edges instead of ``batch_size``.
+            Can be used together with ``max_node``.
+        num_prefetch (int, optional): number of batches prepared ahead of the model in a background thread,
+            including batch transforms, transfer to the GPU and the CSR / CSC indexes of graphs.
+            By default, batches are prepared in the main thread.
+        batch_transform (callable, optional): transformation applied to each collated batch of all splits,
+            e.g. :class:`transforms.VirtualNode <torchdrug.transforms.VirtualNode>`.
+            See :class:`data.DataLoader <torchdrug.data.DataLoader>`.
     """
 
     def __init__(self, task, train_set, valid_set, test_set, optimizer, scheduler=None, gpus=None, batch_size=1,
-                 gradient_interval=1, num_worker=0, log_interval=100):
+                 gradient_interval=1, num_worker=0, log_interval=100, shared_memory=False, max_node=None,
+                 max_edge=None, num_prefetch=0, batch_transform=None):
         self.rank = comm.get_rank()
         self.world_size = comm.get_world_size()
         self.gpus = gpus
         self.batch_size = batch_size
+        self.max_node = max_node
+        self.max_edge = max_edge
+        self.num_prefetch = num_prefetch
+        self.batch_transform = batch_transform
         self.gradient_interval = gradient_interval
         self.num_worker = num_worker
         self.meter = core.Meter(log_interval=log_interval, silent=self.rank > 0)
@@ -81,6 +104,19 @@ class Engine(core.Configurable):
             backend = "gloo" if gpus is None else "nccl"
             comm.init_process_group(backend, init_method="env://")
 
+        shared_memory = shared_memory and self.world_size > 1
+        if shared_memory:
+            if self.rank == 0:
+                logger.info("Place datasets in shared memory")
+            datasets = {}
+            for dataset in [train_set, valid_set, test_set]:
+                while isinstance(dataset, torch_data.Subset):
+                    dataset = dataset.dataset
+                datasets[id(dataset)] = dataset
+            for dataset in datasets.values():
+                if hasattr(dataset, "share_memory"):
+                    dataset.share_memory()
+
         if hasattr(task, "preprocess"):
             if self.rank == 0:
                 logger.warning("Preprocess training set")
@@ -93,6 +129,12 @@ class Engine(core.Configurable):
             new_params = list(task.parameters())
             if len(new_params) != len(old_params):
                 optimizer.add_param_group({"params": new_params[len(old_params):]})
+        if shared_memory:
+            # graph buffers, e.g. the fact graph of knowledge graph completion
+            for module in task.modules():
+                for name, buffer in module._buffers.items():
+                    if isinstance(buffer, data.Graph):
+                        module._buffers[name] = buffer.share_memory()
         if self.world_size > 1:
             task = nn.SyncBatchNorm.convert_sync_batchnorm(task)
         if self.device.type == "cuda":
@@ -102,6 +144,7 @@ class Engine(core.Configurable):
         self.train_set = train_set
         self.valid_set = valid_set
         self.test_set = test_set
+        self._train_stream = None
         self.optimizer = optimizer
         self.scheduler = scheduler
 
@@ -112,12 +155,33 @@ class Engine(core.Configurable):
         If ``batch_per_epoch`` is specified, randomly draw a subset of the training set for each epoch.
         Otherwise, the whole training set is used for each epoch.
 
+        For iterable datasets, ``batch_per_epoch`` must be specified.
+        Each epoch continues reading where the last epoch stops, and the dataset is restarted once exhausted.
+
         Parameters:
             num_epoch (int, optional): number of epochs
             batch_per_epoch (int, optional): number of batches per epoch
         """
-        sampler = torch_data.DistributedSampler(self.train_set, self.world_size, self.rank)
-        dataloader = data.DataLoader(self.train_set, self.batch_size, sampler=sampler, num_workers=self.num_worker)
+        if isinstance(self.train_set, torch_data.IterableDataset):
+            # iterable datasets shard themselves across ranks and workers
+            if batch_per_epoch is None:
+                raise ValueError("`batch_per_epoch` should be provided for iterable datasets")
+            sampler = None
+        elif self.max_node is not None or self.max_edge is not None:
+            sampler = data.DynamicBatchSampler(self.train_set, self.max_node, self.max_edge, shuffle=True,
+                                               num_replicas=self.world_size, rank=self.rank)
+        else:
+            sampler = torch_data.DistributedSampler(self.train_set, self.world_size, self.rank)
+        if isinstance(sampler, data.DynamicBatchSampler):
+            dataloader = data.DataLoader(self.train_set, batch_sampler=sampler, num_workers=self.num_worker,
+                                         batch_transform=self._loader_transform(), batch_fetch=True)
+        else:
+            dataloader = data.DataLoader(self.train_set, self.batch_size, sampler=sampler,
+                                         num_workers=self.num_worker, batch_transform=self._loader_transform(),
+                                         batch_fetch=True)
+        if sampler is None and self._train_stream is None:
+            # keep the dataloader iterator, so that shards are not read from their first lines every epoch
+            self._train_stream = _stream(dataloader, self.train_set)
         batch_per_epoch = batch_per_epoch or len(dataloader)
         model = self.model
         if self.world_size > 1:
@@ -129,15 +193,19 @@ class Engine(core.Configurable):
         model.train()
 
         for epoch in self.meter(num_epoch):
-            sampler.set_epoch(epoch)
+            if sampler is not None:
+                sampler.set_epoch(epoch)
 
             metrics = []
             start_id = 0
             # the last gradient update may contain less than gradient_interval batches
             gradient_interval = min(batch_per_epoch - start_id, self.gradient_interval)
 
-            for batch_id, batch in enumerate(islice(dataloader, batch_per_epoch)):
-                if self.device.type == "cuda":
+            batches = islice(dataloader if sampler is not None else self._train_stream, batch_per_epoch)
+            if self.num_prefetch:
+                batches = self._prefetch(batches)
+            for batch_id, batch in enumerate(batches):
+                if self.device.type == "cuda" and not self.num_prefetch:
                     batch = utils.cuda(batch, device=self.device)
 
                 loss, metric = model(batch)
@@ -178,15 +246,29 @@ class Engine(core.Configurable):
         if comm.get_rank() == 0:
             logger.warning("Evaluate on %s" % split)
         test_set = getattr(self, "%s_set" % split)
-        sampler = torch_data.DistributedSampler(test_set, self.world_size, self.rank)
-        dataloader = data.DataLoader(test_set, self.batch_size, sampler=sampler, num_workers=self.num_worker)
+        if isinstance(test_set, torch_data.IterableDataset):
+            sampler = None
+        elif self.max_node is not None or self.max_edge is not None:
+            sampler = data.DynamicBatchSampler(test_set, self.max_node, self.max_edge, num_replicas=self.world_size,
+                                               rank=self.rank)
+        else:
+            sampler = torch_data.DistributedSampler(test_set, self.world_size, self.rank)
+        if isinstance(sampler, data.DynamicBatchSampler):
+            dataloader = data.DataLoader(test_set, batch_sampler=sampler, num_workers=self.num_worker,
+                                         batch_transform=self._loader_transform(), batch_fetch=True)
+        else:
+            dataloader = data.DataLoader(test_set, self.batch_size, sampler=sampler, num_workers=self.num_worker,
+                                         batch_transform=self._loader_transform(), batch_fetch=True)
         model = self.model
 
         model.eval()
         preds = []
         targets = []
-        for batch in dataloader:
-            if self.device.type == "cuda":
+        batches = dataloader
+        if self.num_prefetch:
+            batches = self._prefetch(batches)
+        for batch in batches:
+            if self.device.type == "cuda" and not self.num_prefetch:
                 batch = utils.cuda(batch, device=self.device)
 
             pred, target = model.predict_and_target(batch)
@@ -204,6 +286,17 @@ class Engine(core.Configurable):
 
         return metric
 
+    def _loader_transform(self):
+        # without workers, batch transforms are overlapped by the prefetcher instead of the data loader
+        if self.num_prefetch and not self.num_worker:
+            return None
+        return self.batch_transform
+
+    def _prefetch(self, batches):
+        transform = self.batch_transform if not self.num_worker else None
+        return data.Prefetcher(batches, self.num_prefetch, transform=transform, device=self.device,
+                               build_index=True)
+
     def load(self, checkpoint, load_optimizer=True):
         """
         Load a checkpoint from file.
@@ -271,3 +364,18 @@ class Engine(core.Configurable):
     def epoch(self):
         """Current epoch."""
         return self.meter.epoch_id
+
+
+def _stream(dataloader, dataset):
+    # iterate over an iterable dataset endlessly, and change the shuffling order on every pass
+    num_pass = 0
+    while True:
+        if hasattr(dataset, "set_epoch"):
+            dataset.set_epoch(num_pass)
+        is_empty = True
+        for batch in dataloader:
+            is_empty = False
+            yield batch
+        if is_empty:
+            return
+        num_pass += 1
@@ -1,14 +1,14 @@
-from .graph import Graph, PackedGraph, cat
+from .graph import Graph, PackedGraph, PackedGraphBuilder, cat
 from .molecule import Molecule, PackedMolecule
-from .dataset import MoleculeDataset, ReactionDataset, NodeClassificationDataset, KnowledgeGraphDataset, \
-    SemiSupervised, semisupervised, key_split, scaffold_split, ordered_scaffold_split
-from .dataloader import DataLoader, graph_collate
+from .dataset import MoleculeDataset, ReactionDataset, MoleculeStream, NodeClassificationDataset, \
+    KnowledgeGraphDataset, SemiSupervised, semisupervised, key_split, scaffold_split, ordered_scaffold_split
+from .dataloader import DataLoader, DynamicBatchSampler, Prefetcher, graph_collate
 from . import constant
 from . import feature
 
 __all__ = [
-    "Graph", "PackedGraph", "Molecule", "PackedMolecule",
-    "MoleculeDataset", "ReactionDataset", "NodeClassificationDataset", "KnowledgeGraphDataset", "SemiSupervised",
-    "semisupervised", "key_split", "scaffold_split", "ordered_scaffold_split",
-    "DataLoader", "graph_collate", "feature", "constant",
+    "Graph", "PackedGraph", "PackedGraphBuilder", "Molecule", "PackedMolecule",
+    "MoleculeDataset", "ReactionDataset", "MoleculeStream", "NodeClassificationDataset", "KnowledgeGraphDataset",
+    "SemiSupervised", "semisupervised", "key_split", "scaffold_split", "ordered_scaffold_split",
+    "DataLoader", "DynamicBatchSampler", "Prefetcher", "graph_collate", "feature", "constant",
 ]
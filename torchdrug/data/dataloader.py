@@ -1,9 +1,13 @@
+import math
+import queue
+import threading
 from collections import deque
 from collections.abc import Mapping, Sequence
 
 import torch
 
-from torchdrug import data
+from torchdrug import data, utils
+from torchdrug.utils import comm
 
 
 def graph_collate(batch):
@@ -44,10 +48,196 @@ def graph_collate(batch):
     raise TypeError("Can't collate data with type `%s`" % type(elem))
 
 
+class BatchedDataset(torch.utils.data.Dataset):
+    """
+    Map-style dataset that fetches a whole batch at once through ``dataset.get_batch(indices)``.
+
+    Nested :class:`Subset <torch.utils.data.Subset>` wrappers are resolved to indices of the underlying dataset.
+
+    Parameters:
+        dataset (Dataset): dataset that implements ``get_batch``, or subsets of such a dataset
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        indices = None
+        while isinstance(dataset, torch.utils.data.Subset):
+            if indices is None:
+                indices = torch.as_tensor(dataset.indices, dtype=torch.long)
+            else:
+                indices = torch.as_tensor(dataset.indices, dtype=torch.long)[indices]
+            dataset = dataset.dataset
+        self.base = dataset
+        self.indices = indices
+
+    @classmethod
+    def supports(cls, dataset):
+        """Check if a dataset or its underlying dataset implements ``get_batch``."""
+        while isinstance(dataset, torch.utils.data.Subset):
+            dataset = dataset.dataset
+        return hasattr(dataset, "get_batch")
+
+    def __getitem__(self, indices):
+        if self.indices is not None:
+            indices = self.indices[indices]
+        indices = torch.as_tensor(indices).tolist()
+        return self.base.get_batch(indices)
+
+    def __len__(self):
+        return len(self.dataset)
+
+
+class DynamicBatchSampler(torch.utils.data.Sampler):
+    """
+    Batch sampler that packs graphs into mini-batches under a budget of nodes and / or edges.
+
+    Graphs are added to a batch until the total number of nodes or edges would exceed the budget.
+    A graph that exceeds the budget on its own forms a batch by itself.
+    If ``bucket_size`` is specified, graphs in each bucket of consecutive samples are sorted by size before packing,
+    so that each batch contains graphs of similar sizes.
+
+    For distributed training, batches are split across processes in the same way as
+    `torch.utils.data.DistributedSampler`_. All processes should use the same ``seed``.
+
+    .. _torch.utils.data.DistributedSampler:
+        https://pytorch.org/docs/stable/data.html#torch.utils.data.distributed.DistributedSampler
+
+    Parameters:
+        dataset (Dataset): dataset of graphs, or subsets of such a dataset
+        max_node (int, optional): maximal number of nodes in a batch
+        max_edge (int, optional): maximal number of edges in a batch
+        shuffle (bool, optional): reshuffle the samples and the batches at every epoch
+        bucket_size (int, optional): number of samples in each bucket. By default, bucketing is not used.
+        num_replicas (int, optional): number of distributed processes. Default is the world size.
+        rank (int, optional): rank of this process. Default is the rank in distributed processes.
+        seed (int, optional): random seed for shuffling
+        drop_last (bool, optional): drop the tail batches that can't be evenly split across processes.
+            Otherwise, batches from the beginning are repeated to fill all processes.
+    """
+
+    def __init__(self, dataset, max_node=None, max_edge=None, shuffle=False, bucket_size=None, num_replicas=None,
+                 rank=None, seed=0, drop_last=False):
+        if max_node is None and max_edge is None:
+            raise ValueError("At least one of `max_node` and `max_edge` should be provided")
+        self.max_node = max_node
+        self.max_edge = max_edge
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+        self.num_replicas = num_replicas if num_replicas is not None else comm.get_world_size()
+        self.rank = rank if rank is not None else comm.get_rank()
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.num_nodes, self.num_edges = _get_sizes(dataset)
+        self._batches = None
+
+    def set_epoch(self, epoch):
+        """
+        Set the epoch for shuffling. This should be called before every epoch if ``shuffle`` is true.
+
+        Parameters:
+            epoch (int): epoch number
+        """
+        self.epoch = epoch
+
+    def _get_batches(self):
+        if self._batches is not None and self._batches[0] == self.epoch:
+            return self._batches[1]
+
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        if self.shuffle:
+            order = torch.randperm(len(self.num_nodes), generator=generator)
+        else:
+            order = torch.arange(len(self.num_nodes))
+        if self.bucket_size:
+            sizes = self.num_nodes if self.max_node is not None else self.num_edges
+            buckets = []
+            for bucket in order.split(self.bucket_size):
+                buckets.append(bucket[sizes[bucket].sort(stable=True)[1]])
+            order = torch.cat(buckets)
+
+        max_node = self.max_node if self.max_node is not None else float("inf")
+        max_edge = self.max_edge if self.max_edge is not None else float("inf")
+        batches = []
+        batch = []
+        batch_node = 0
+        batch_edge = 0
+        for index, num_node, num_edge in zip(order.tolist(), self.num_nodes[order].tolist(),
+                                             self.num_edges[order].tolist()):
+            if batch and (batch_node + num_node > max_node or batch_edge + num_edge > max_edge):
+                batches.append(batch)
+                batch = []
+                batch_node = 0
+                batch_edge = 0
+            batch.append(index)
+            batch_node += num_node
+            batch_edge += num_edge
+        if batch:
+            batches.append(batch)
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=generator).tolist()]
+
+        if self.drop_last:
+            num_batch = len(batches) // self.num_replicas * self.num_replicas
+            batches = batches[:num_batch]
+        else:
+            num_batch = math.ceil(len(batches) / self.num_replicas) * self.num_replicas
+            if batches:
+                batches = (batches * math.ceil(num_batch / len(batches)))[:num_batch]
+        batches = batches[self.rank::self.num_replicas]
+        self._batches = (self.epoch, batches)
+        return batches
+
+    def __iter__(self):
+        return iter(self._get_batches())
+
+    def __len__(self):
+        return len(self._get_batches())
+
+
+def _get_sizes(dataset):
+    # number of nodes and edges of each sample, preferably from sizes stored in the dataset
+    indices = None
+    base = dataset
+    while isinstance(base, torch.utils.data.Subset):
+        if indices is None:
+            indices = torch.as_tensor(base.indices, dtype=torch.long)
+        else:
+            indices = torch.as_tensor(base.indices, dtype=torch.long)[indices]
+        base = base.dataset
+    if hasattr(base, "get_sizes"):
+        num_nodes, num_edges = base.get_sizes()
+        if indices is not None:
+            num_nodes = num_nodes[indices]
+            num_edges = num_edges[indices]
+        return num_nodes, num_edges
+
+    num_nodes = []
+    num_edges = []
+    for i in range(len(dataset)):
+        graphs = dataset[i]["graph"]
+        if isinstance(graphs, data.Graph):
+            graphs = [graphs]
+        num_nodes.append(sum(int(graph.num_node) for graph in graphs))
+        num_edges.append(sum(int(graph.num_edge) for graph in graphs))
+    return torch.tensor(num_nodes, dtype=torch.long), torch.tensor(num_edges, dtype=torch.long)
+
+
 class DataLoader(torch.utils.data.DataLoader):
     """
     Extended data loader for batching graph structured data.
 
+    If ``batch_fetch`` is true and the dataset implements ``get_batch(indices)``, e.g.
+    :class:`MoleculeDataset <torchdrug.data.MoleculeDataset>`, each mini-batch is fetched by a single call
+    instead of collating individual samples.
+    Call :meth:`MoleculeDataset.pack_data <torchdrug.data.MoleculeDataset.pack_data>` beforehand to slice batches
+    from packed arrays.
+    This is only used with the default ``collate_fn``. In this case, ``loader.dataset`` is a wrapper of the dataset.
+    To batch graphs by a budget of nodes or edges, pass a :class:`DynamicBatchSampler` as ``batch_sampler``.
+    Transforms that support collated batches, e.g. :class:`transforms.VirtualNode <torchdrug.transforms.VirtualNode>`,
+    can be passed as ``batch_transform`` to run once per mini-batch rather than once per sample.
+
     See `torch.utils.data.DataLoader`_ for more details.
 
     .. _torch.utils.data.DataLoader:
@@ -61,12 +251,145 @@ class DataLoader(torch.utils.data.DataLoader):
         batch_sampler (Sampler, optional): sampler that draws a mini-batch of data from the dataset
         num_workers (int, optional): how many subprocesses to use for data loading
         collate_fn (callable, optional): merge a list of samples into a mini-batch
+        batch_transform (callable, optional): transformation applied to each mini-batch after collation.
+            This runs in the worker processes if ``num_workers > 0``.
+        batch_fetch (bool, optional): fetch each mini-batch through ``dataset.get_batch`` if available
         kwargs: keyword arguments for `torch.utils.data.DataLoader`_
     """
     def __init__(self, dataset, batch_size=1, shuffle=False, sampler=None, batch_sampler=None, num_workers=0,
-                 collate_fn=graph_collate, **kwargs):
-        super(DataLoader, self).__init__(dataset, batch_size, shuffle, sampler, batch_sampler, num_workers, collate_fn,
-                                         **kwargs)
+                 collate_fn=graph_collate, batch_transform=None, batch_fetch=False, **kwargs):
+        if batch_sampler is None:
+            is_batched = batch_size is not None and not (shuffle and sampler is not None)
+        else:
+            # invalid combinations are left to torch.utils.data.DataLoader to report
+            is_batched = not shuffle and sampler is None
+        if batch_fetch and is_batched and collate_fn is graph_collate and BatchedDataset.supports(dataset):
+            if batch_sampler is None:
+                if sampler is None:
+                    if shuffle:
+                        sampler = torch.utils.data.RandomSampler(dataset)
+                    else:
+                        sampler = torch.utils.data.SequentialSampler(dataset)
+                drop_last = kwargs.pop("drop_last", False)
+                batch_sampler = torch.utils.data.BatchSampler(sampler, batch_size, drop_last)
+            dataset = BatchedDataset(dataset)
+            # the batch sampler yields index lists, and each list is fetched as one batch
+            collate_fn = _identity
+            if batch_transform:
+                collate_fn = _TransformCollate(collate_fn, batch_transform)
+            # disable automatic batching, since each index drawn from the batch sampler is already a batch
+            super(DataLoader, self).__init__(dataset, batch_size=None, sampler=batch_sampler,
+                                             num_workers=num_workers, collate_fn=collate_fn, **kwargs)
+        else:
+            if batch_transform:
+                collate_fn = _TransformCollate(collate_fn, batch_transform)
+            super(DataLoader, self).__init__(dataset, batch_size, shuffle, sampler, batch_sampler, num_workers,
+                                             collate_fn, **kwargs)
+
+
+def _identity(batch):
+    return batch
+
+
+class _TransformCollate(object):
+    # a picklable closure, so that it can be sent to worker processes
+
+    def __init__(self, collate_fn, transform):
+        self.collate_fn = collate_fn
+        self.transform = transform
+
+    def __call__(self, batch):
+        return self.transform(self.collate_fn(batch))
+
+
+class Prefetcher(object):
+    """
+    Prefetch batches from an iterable in a background thread.
+
+    The thread stays up to ``num_prefetch`` batches ahead of the consumer.
+    Besides fetching, it also applies any post-collate work, e.g. batch-level transforms, device transfer and
+    graph indexes, so that the consumer doesn't block on input as long as the thread keeps up.
+
+    Parameters:
+        iterable (Iterable): iterable of batches, e.g. a data loader
+        num_prefetch (int, optional): maximal number of batches prepared ahead of the consumer
+        transform (Callable, optional): function applied to each batch in the background thread
+        device (torch.device, optional): if a CUDA device is specified, transfer each batch to the device
+            in the background thread
+        build_index (bool, optional): compute and cache the CSR and CSC indexes of graphs in each batch
+            in the background thread, after the device transfer
+    """
+
+    def __init__(self, iterable, num_prefetch=2, transform=None, device=None, build_index=False):
+        self.iterable = iterable
+        self.num_prefetch = num_prefetch
+        self.transform = transform
+        self.device = torch.device(device) if device is not None else None
+        self.build_index = build_index
+
+    def _prefetch(self, iterator, buffer, stop):
+        if self.device is not None and self.device.type == "cuda":
+            # copies are issued on the default stream of the device, so they are ordered with the consumer's kernels
+            torch.cuda.set_device(self.device)
+        try:
+            for batch in iterator:
+                if self.transform:
+                    batch = self.transform(batch)
+                if self.device is not None and self.device.type == "cuda":
+                    batch = utils.cuda(batch, device=self.device)
+                if self.build_index:
+                    _build_index(batch)
+                if not self._put(buffer, (batch, None), stop):
+                    return
+        except Exception as e:
+            self._put(buffer, (None, e), stop)
+            return
+        self._put(buffer, (_END, None), stop)
+
+    def _put(self, buffer, item, stop):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        buffer = queue.Queue(self.num_prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._prefetch, args=(iter(self.iterable), buffer, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch, error = buffer.get()
+                if error is not None:
+                    raise error
+                if batch is _END:
+                    break
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+    def __len__(self):
+        return len(self.iterable)
+
+
+_END = object()
+
+
+def _build_index(obj):
+    # graphs cache their indexes, so convolutions in the consumer reuse them
+    if isinstance(obj, data.Graph):
+        obj.csr
+        obj.csc
+    elif isinstance(obj, Mapping):
+        for v in obj.values():
+            _build_index(v)
+    elif isinstance(obj, Sequence) and not isinstance(obj, str):
+        for x in obj:
+            _build_index(x)
 
 
 class DataQueue(torch.utils.data.Dataset):
@@ -1,18 +1,30 @@
+import io
+import os
 import csv
+import json
 import math
+import random
+import pickle
+import hashlib
+import inspect
 import logging
 import warnings
+import multiprocessing
 from collections import defaultdict
+from collections.abc import Sequence
 
 from tqdm import tqdm
+import numpy as np
 
 from rdkit import Chem
 from rdkit.Chem.Scaffolds import MurckoScaffold
 import torch
 from torch.utils import data as torch_data
 
+import torchdrug
 from torchdrug import core, data, utils
-from torchdrug.utils import doc
+from torchdrug.core import Registry as R
+from torchdrug.utils import comm, doc
 
 
 logger = logging.getLogger(__name__)
@@ -26,7 +38,8 @@ class MoleculeDataset(torch_data.Dataset, core.Configurable):
     """
 
     @doc.copy_args(data.Molecule.from_molecule)
-    def load_smiles(self, smiles_list, targets, transform=None, lazy=False, verbose=0, **kwargs):
+    def load_smiles(self, smiles_list, targets, transform=None, lazy=False, verbose=0, num_worker=0, chunk_size=1000,
+                    distributed=False, **kwargs):
         """
         Load the dataset from SMILES and targets.
 
@@ -37,6 +50,14 @@ class MoleculeDataset(torch_data.Dataset, core.Configurable):
             lazy (bool, optional): if lazy mode is used, the molecules are processed in the dataloader.
                 This may slow down the data loading process, but save a lot of CPU memory and dataset loading time.
             verbose (int, optional): output verbose level
+            num_worker (int, optional): number of worker processes for constructing molecules.
+                By default, molecules are constructed in the main process.
+            chunk_size (int, optional): number of SMILES strings sent to a worker process at a time
+            distributed (bool, optional): if true, each distributed rank constructs a disjoint slice of molecules,
+                and the packed slices are gathered in shared memory by :func:`comm.cat_shared
+                <torchdrug.utils.comm.cat_shared>`, with a single copy on each node.
+                The process group should be initialized by :func:`comm.init_process_group
+                <torchdrug.utils.comm.init_process_group>` before loading. Ignored in lazy mode.
             **kwargs
         """
         num_sample = len(smiles_list)
@@ -55,24 +76,89 @@ class MoleculeDataset(torch_data.Dataset, core.Configurable):
         self.data = []
         self.targets = defaultdict(list)
 
-        if verbose:
-            smiles_list = tqdm(smiles_list, "Constructing molecules from SMILES")
-        for i, smiles in enumerate(smiles_list):
-            mol = Chem.MolFromSmiles(smiles)
+        if distributed and not lazy and comm.get_world_size() > 1:
+            is_valid, self.data = self._construct_distributed(smiles_list, verbose, num_worker, chunk_size, kwargs)
+            index = is_valid.nonzero().flatten().tolist()
+            self.smiles_list = [smiles_list[i] for i in index]
+            for field in targets:
+                self.targets[field] = [targets[field][i] for i in index]
+            self.smiles_list = _StringList(self.smiles_list)
+            return
+
+        if num_worker > 0:
+            mols = _parallel_map(_construct_molecules, smiles_list, (not lazy, kwargs), num_worker, chunk_size,
+                                 "Constructing molecules from SMILES" if verbose else None)
+        else:
+            iterable = smiles_list
+            if verbose:
+                iterable = tqdm(iterable, "Constructing molecules from SMILES")
+            mols = (Chem.MolFromSmiles(smiles) for smiles in iterable)
+        num_nodes = []
+        num_edges = []
+        for i, (smiles, mol) in enumerate(zip(smiles_list, mols)):
             if not mol:
                 logger.debug("Can't construct molecule from SMILES `%s`. Ignore this sample." % smiles)
                 continue
-            if not self.lazy or len(self.data) == 0:
+            if self.lazy:
+                # only the sizes are recorded in lazy mode, and the first molecule for the feature dimensions.
+                # the workers return the sizes instead of molecules
+                num_node, num_edge = mol if isinstance(mol, tuple) else _get_size(mol, kwargs)
+                num_nodes.append(num_node)
+                num_edges.append(num_edge)
+                mol = None if self.data else data.Molecule.from_smiles(smiles, **kwargs)
+            elif not isinstance(mol, data.Molecule):
                 mol = data.Molecule.from_molecule(mol, **kwargs)
-            else:
-                mol = None
             self.data.append(mol)
             self.smiles_list.append(smiles)
             for field in targets:
                 self.targets[field].append(targets[field][i])
+        self.smiles_list = _StringList(self.smiles_list)
+        if self.lazy:
+            self._sizes = (torch.tensor(num_nodes, dtype=torch.long), torch.tensor(num_edges, dtype=torch.long))
+            self._size_source = self.data
+
+    def _construct_distributed(self, smiles_list, verbose, num_worker, chunk_size, kwargs):
+        # each rank constructs a contiguous slice, so the gathered slices follow the order of the SMILES list
+        rank = comm.get_rank()
+        world_size = comm.get_world_size()
+        start = len(smiles_list) * rank // world_size
+        end = len(smiles_list) * (rank + 1) // world_size
+        smiles_list = smiles_list[start: end]
+
+        if num_worker > 0:
+            mols = _parallel_map(_construct_molecules, smiles_list, (True, kwargs), num_worker, chunk_size,
+                                 "Constructing molecules from SMILES" if verbose else None)
+        else:
+            iterable = smiles_list
+            if verbose:
+                iterable = tqdm(iterable, "Constructing molecules from SMILES")
+            mols = (Chem.MolFromSmiles(smiles) for smiles in iterable)
+        is_valid = []
+        graphs = []
+        for smiles, mol in zip(smiles_list, mols):
+            if not mol:
+                logger.debug("Can't construct molecule from SMILES `%s`. Ignore this sample." % smiles)
+                is_valid.append(False)
+                continue
+            if not isinstance(mol, data.Molecule):
+                mol = data.Molecule.from_molecule(mol, **kwargs)
+            graphs.append(mol)
+            is_valid.append(True)
+
+        if graphs:
+            packed = _MoleculeColumns.from_molecules(graphs)
+        else:
+            # an empty slice still contributes columns of the right dtypes and shapes to the exchange
+            packed = _MoleculeColumns.from_molecules([data.Molecule.from_smiles("C", **kwargs)])
+            packed.columns = {k: v[:0] for k, v in packed.columns.items()}
+        is_valid = comm.cat(torch.tensor(is_valid, dtype=torch.bool))
+        # only one copy of the columns is gathered on each node, and shared by its processes
+        columns = comm.cat_shared(packed.columns)
+        graphs = _MoleculeColumns(columns, packed.num_relation, packed.meta_dict, packed.relation_dict)
+        return is_valid, graphs
 
     @doc.copy_args(load_smiles)
-    def load_csv(self, csv_file, smiles_field="smiles", target_fields=None, verbose=0, **kwargs):
+    def load_csv(self, csv_file, smiles_field="smiles", target_fields=None, verbose=0, cache=False, **kwargs):
         """
         Load the dataset from a csv file.
 
@@ -83,8 +169,19 @@ class MoleculeDataset(torch_data.Dataset, core.Configurable):
             target_fields (list of str, optional): name of target columns in the table.
                 Default is all columns other than the SMILES column.
             verbose (int, optional): output verbose level
+            cache (bool, optional): store the constructed molecules in a ``cache`` directory next to the csv file,
+                and reuse them if the file and the featurization options are unchanged
             **kwargs
         """
+        if cache:
+            cache_file = self._get_cache_file(csv_file, smiles_field=smiles_field, target_fields=target_fields,
+                                              **kwargs)
+            if os.path.exists(cache_file):
+                if verbose:
+                    logger.info("Loading molecules from cache %s" % cache_file)
+                self.load_cache(cache_file, **kwargs)
+                return
+
         if target_fields is not None:
             target_fields = set(target_fields)
 
@@ -110,6 +207,138 @@ class MoleculeDataset(torch_data.Dataset, core.Configurable):
                         targets[field].append(value)
 
         self.load_smiles(smiles, targets, verbose=verbose, **kwargs)
+        if cache:
+            self.save_cache(cache_file)
+
+    def _get_cache_file(self, file_name, **kwargs):
+        # the cache is keyed by the file content and all options that affect the constructed molecules
+        options = {"class": self.__class__.__name__, "md5": utils.compute_md5(file_name)}
+        sig = inspect.signature(data.Molecule.from_molecule)
+        for name, param in sig.parameters.items():
+            if param.default is not inspect.Parameter.empty:
+                options[name] = kwargs.get(name, param.default)
+        for name in ["smiles_field", "target_fields", "lazy"]:
+            if name in kwargs:
+                options[name] = kwargs[name]
+        if options.get("target_fields") is not None:
+            options["target_fields"] = sorted(options["target_fields"])
+        options["version"] = torchdrug.__version__
+        options["featurizer"] = _get_featurizer_checksum(options)
+        return _get_cache_file(file_name, options)
+
+    def save_cache(self, cache_file):
+        """
+        Save the constructed molecules and targets to a binary file.
+
+        Molecules are stored as packed tensors, which can be reloaded by :meth:`load_cache`.
+
+        Parameters:
+            cache_file (str): file name
+        """
+        state = {
+            "smiles_list": list(self.smiles_list),
+            "targets": dict(self.targets),
+            "lazy": self.lazy,
+            "kwargs": self.kwargs,
+        }
+        if not self.lazy and self.data:
+            state["graph"] = _pack_state(self.data)
+        if self.lazy:
+            state["sizes"] = self.get_sizes()
+        # write to a temporary file first, so that concurrent processes never read a partial cache
+        tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+        torch.save(state, tmp_file)
+        os.replace(tmp_file, cache_file)
+
+    def load_cache(self, cache_file, transform=None, **kwargs):
+        """
+        Load the dataset from a binary file saved by :meth:`save_cache`.
+
+        Parameters:
+            cache_file (str): file name
+            transform (Callable, optional): data transformation function
+        """
+        state = _torch_load(cache_file)
+
+        self.transform = transform
+        self.lazy = state["lazy"]
+        self.kwargs = state["kwargs"]
+        self.smiles_list = _StringList(state["smiles_list"])
+        self.targets = defaultdict(list, state["targets"])
+        if "graph" in state:
+            self.data = _unpack_state(state["graph"])
+        else:
+            self.data = [None] * len(self.smiles_list)
+            if self.data:
+                self.data[0] = data.Molecule.from_smiles(self.smiles_list[0], **self.kwargs)
+        if "sizes" in state:
+            self._sizes = state["sizes"]
+            self._size_source = self.data
+
+    def save_mmap(self, path, verbose=0, num_worker=0, chunk_size=1000):
+        """
+        Save the dataset to a directory in a memory-mapped columnar format.
+
+        All molecules are packed into flat node and edge arrays, with one ``.npy`` file per attribute.
+        The directory can be reloaded by :meth:`load_mmap`.
+        In lazy mode, molecules are constructed from SMILES during the conversion.
+
+        Parameters:
+            path (str): directory to store the dataset
+            verbose (int, optional): output verbose level
+            num_worker (int, optional): number of worker processes for constructing molecules in lazy mode
+            chunk_size (int, optional): number of SMILES strings sent to a worker process at a time
+        """
+        path = os.path.expanduser(path)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        if self.lazy:
+            if num_worker > 0:
+                mols = _parallel_map(_construct_molecules, self.smiles_list, (True, self.kwargs), num_worker,
+                                     chunk_size, "Constructing molecules from SMILES" if verbose else None)
+            else:
+                mols = self.smiles_list
+                if verbose:
+                    mols = tqdm(mols, "Constructing molecules from SMILES")
+                mols = (data.Molecule.from_smiles(smiles, **self.kwargs) for smiles in mols)
+        else:
+            mols = self.data
+
+        packed = _MoleculeColumns.from_molecules(mols)
+        for k, v in packed.columns.items():
+            np.save(os.path.join(path, "%s.npy" % k), v.numpy())
+        meta = {
+            "smiles_list": list(self.smiles_list),
+            "targets": dict(self.targets),
+            "kwargs": self.kwargs,
+            "num_relation": packed.num_relation,
+            "meta_dict": packed.meta_dict,
+            "relation_dict": packed.relation_dict,
+        }
+        torch.save(meta, os.path.join(path, "meta.pt"))
+
+    def load_mmap(self, path, transform=None):
+        """
+        Load the dataset from a directory saved by :meth:`save_mmap`.
+
+        The arrays are memory-mapped rather than read into memory.
+        Each molecule is a zero-copy slice of the arrays,
+        and dataloader workers share the same pages instead of their own copies.
+
+        Parameters:
+            path (str): directory of the dataset
+            transform (Callable, optional): data transformation function
+        """
+        path = os.path.expanduser(path)
+        meta = _torch_load(os.path.join(path, "meta.pt"))
+
+        self.transform = transform
+        self.lazy = False
+        self.kwargs = meta["kwargs"]
+        self.smiles_list = _StringList(meta["smiles_list"])
+        self.targets = defaultdict(list, meta["targets"])
+        self.data = _MemoryMappedMolecules(path, meta)
 
     def _standarize_index(self, index, count):
         if isinstance(index, slice):
@@ -136,12 +365,124 @@ class MoleculeDataset(torch_data.Dataset, core.Configurable):
         return item
 
     def __getitem__(self, index):
+        if isinstance(index, torch.Tensor):
+            index = index.tolist()
         if isinstance(index, int):
             return self.get_item(index)
 
         index = self._standarize_index(index, len(self))
         return [self.get_item(i) for i in index]
 
+    def pack_data(self):
+        """
+        Pack all molecules into flat node and edge arrays, so that :meth:`get_batch` slices batches from the arrays.
+
+        The arrays replace the list of molecules in ``self.data`` rather than keeping a second copy,
+        and they can't be modified in place. Assign a new list to ``self.data`` to change the molecules.
+        Call this before dataloader workers are forked, so that all workers share the same arrays.
+        Lazy datasets are not affected.
+        """
+        if getattr(self, "lazy", False) or isinstance(self.data, _MoleculeColumns) or not self.data:
+            return
+        self.data = _MoleculeColumns.from_molecules(self.data)
+
+    def get_batch(self, indices):
+        """
+        Get a batch of samples, collated in the same way as :func:`graph_collate <torchdrug.data.graph_collate>`.
+
+        If the dataset is packed by :meth:`pack_data`, :meth:`share_memory` or :meth:`load_mmap`,
+        molecules are sliced from the node and edge arrays into a single PackedMolecule,
+        without constructing a Molecule for every sample.
+        Otherwise, or if the dataset has transforms, this falls back to collating individual samples.
+
+        Parameters:
+            indices (list of int): sample indices
+
+        Returns:
+            dict
+        """
+        if getattr(self, "lazy", False) or self.transform or not isinstance(self.data, _MoleculeColumns):
+            return data.graph_collate(self[list(indices)])
+
+        batch = {"graph": self.data.pack(indices)}
+        batch.update({k: data.graph_collate([v[i] for i in indices]) for k, v in self.targets.items()})
+        return batch
+
+    def get_sizes(self):
+        """
+        Get the number of nodes and edges of each molecule, before any transform.
+
+        The sizes are cached in the dataset until ``self.data`` is replaced, e.g. by :meth:`pack_data`.
+        Lazy datasets record the sizes when the SMILES strings are validated.
+
+        Returns:
+            (LongTensor, LongTensor): number of nodes, number of edges
+        """
+        if isinstance(self.data, _MoleculeColumns):
+            return self.data.num_nodes, self.data.num_edges
+        if getattr(self, "_size_source", None) is not self.data:
+            self._sizes = self._compute_sizes()
+            self._size_source = self.data
+        return self._sizes
+
+    def _compute_sizes(self):
+        if getattr(self, "lazy", False):
+            mols = (data.Molecule.from_smiles(smiles, **self.kwargs) for smiles in self.smiles_list)
+        else:
+            mols = self.data
+        num_nodes = []
+        num_edges = []
+        for mol in mols:
+            num_nodes.append(int(mol.num_node))
+            num_edges.append(int(mol.num_edge))
+        return torch.tensor(num_nodes, dtype=torch.long), torch.tensor(num_edges, dtype=torch.long)
+
+    def share_memory(self):
+        """
+        Place the molecules in shared memory, so that distributed processes on the same node share a single copy.
+
+        Molecules are packed into flat node and edge arrays, and the arrays are shared by
+        :func:`comm.share_memory <torchdrug.utils.comm.share_memory>`.
+        All distributed processes should call this method. Lazy datasets are not affected.
+        """
+        if getattr(self, "lazy", False) or isinstance(self.data, _MemoryMappedMolecules) or not self.data:
+            return
+        if isinstance(self.data, _MoleculeColumns):
+            packed = self.data
+        else:
+            packed = _MoleculeColumns.from_molecules(self.data)
+        columns = comm.share_memory(packed.columns)
+        self.data = _MoleculeColumns(columns, packed.num_relation, packed.meta_dict, packed.relation_dict)
+
+    def get_scaffold_ids(self, chirality=False, num_worker=0, chunk_size=1000):
+        """
+        Get the Murcko scaffold id of each molecule.
+
+        Scaffolds are computed from SMILES strings, and ids are assigned in the order of first occurrence.
+        The result is cached in the dataset.
+
+        Parameters:
+            chirality (bool, optional): consider chirality in the scaffold or not
+            num_worker (int, optional): number of worker processes for computing scaffolds.
+                By default, scaffolds are computed in the main process.
+            chunk_size (int, optional): number of SMILES strings sent to a worker process at a time
+
+        Returns:
+            LongTensor: scaffold ids of shape :math:`(n,)`
+        """
+        if getattr(self, "_scaffold_source", None) is not self.smiles_list:
+            self._scaffold_ids = {}
+            self._scaffold_source = self.smiles_list
+        if chirality not in self._scaffold_ids:
+            if num_worker > 0:
+                scaffolds = _parallel_map(_compute_scaffolds, self.smiles_list, (chirality,), num_worker, chunk_size)
+            else:
+                scaffolds = _compute_scaffolds(self.smiles_list, chirality)
+            scaffold2id = {}
+            ids = [scaffold2id.setdefault(scaffold, len(scaffold2id)) for scaffold in scaffolds]
+            self._scaffold_ids[chirality] = torch.tensor(ids, dtype=torch.long)
+        return self._scaffold_ids[chirality]
+
     @property
     def tasks(self):
         """List of tasks."""
@@ -199,7 +540,8 @@ class ReactionDataset(MoleculeDataset, core.Configurable):
     """
 
     @doc.copy_args(data.Molecule.from_molecule)
-    def load_smiles(self, smiles_list, targets, transform=None, verbose=0, **kwargs):
+    def load_smiles(self, smiles_list, targets, transform=None, lazy=False, verbose=0, num_worker=0, chunk_size=1000,
+                    **kwargs):
         """
         Load the dataset from SMILES and targets.
 
@@ -207,7 +549,12 @@ class ReactionDataset(MoleculeDataset, core.Configurable):
             smiles_list (list of str): SMILES strings
             targets (dict of list): prediction targets
             transform (Callable, optional): data transformation function
+            lazy (bool, optional): if lazy mode is used, the molecules are processed in the dataloader.
+                This may slow down the data loading process, but save a lot of CPU memory and dataset loading time.
             verbose (int, optional): output verbose level
+            num_worker (int, optional): number of worker processes for constructing molecules.
+                By default, molecules are constructed in the main process.
+            chunk_size (int, optional): number of SMILES strings sent to a worker process at a time
             **kwargs
         """
         num_sample = len(smiles_list)
@@ -216,26 +563,145 @@ class ReactionDataset(MoleculeDataset, core.Configurable):
                 raise ValueError("Number of target `%s` doesn't match with number of molecules. "
                                  "Expect %d but found %d" % (field, num_sample, len(target_list)))
 
-        self.smiles_list = smiles_list
+        self.transform = transform
+        self.lazy = lazy
+        self.kwargs = kwargs
+        self.smiles_list = []
         self.data = []
         self.targets = defaultdict(list)
-        if verbose:
-            smiles_list = tqdm(smiles_list, "Constructing molecules from SMILES")
-        for i, smiles in enumerate(smiles_list):
-            smiles_reactant, agent, smiles_product = smiles.split(">")
-            mols = []
-            for _smiles in [smiles_reactant, smiles_product]:
-                mol = Chem.MolFromSmiles(_smiles)
-                if not mol:
-                    logger.debug("Can't construct molecule from SMILES `%s`. Ignore this sample." % _smiles)
-                    break
-                mol = data.Molecule.from_molecule(mol, **kwargs)
-                mols.append(mol)
-            else:
-                self.data.append(mols)
-                for field in targets:
-                    self.targets[field].append(targets[field][i])
+        if num_worker > 0:
+            reactions = _parallel_map(_construct_reactions, smiles_list, (not lazy, kwargs), num_worker, chunk_size,
+                                      "Constructing molecules from SMILES" if verbose else None)
+        else:
+            iterable = smiles_list
+            if verbose:
+                iterable = tqdm(iterable, "Constructing molecules from SMILES")
+            reactions = (_construct_reaction(smiles, not lazy, kwargs) for smiles in iterable)
+        num_nodes = []
+        num_edges = []
+        for i, (smiles, mols) in enumerate(zip(smiles_list, reactions)):
+            if mols is None:
+                continue
+            if self.lazy:
+                # only the sizes are recorded in lazy mode, and the first reaction for the feature dimensions
+                num_nodes.append(mols[0])
+                num_edges.append(mols[1])
+                mols = None if self.data else _construct_reaction(smiles, True, kwargs)
+            self.data.append(mols)
+            self.smiles_list.append(smiles)
+            for field in targets:
+                self.targets[field].append(targets[field][i])
+        self.smiles_list = _StringList(self.smiles_list)
+        if self.lazy:
+            self._sizes = (torch.tensor(num_nodes, dtype=torch.long), torch.tensor(num_edges, dtype=torch.long))
+            self._size_source = self.data
+
+    def save_cache(self, cache_file):
+        """
+        Save the constructed molecules and targets to a binary file.
+
+        Reactants and products are stored as packed tensors, which can be reloaded by :meth:`load_cache`.
+
+        Parameters:
+            cache_file (str): file name
+        """
+        state = {
+            "smiles_list": list(self.smiles_list),
+            "targets": dict(self.targets),
+            "lazy": self.lazy,
+            "kwargs": self.kwargs,
+        }
+        if not self.lazy and self.data:
+            reactants, products = zip(*self.data)
+            state["reactant"] = _pack_state(list(reactants))
+            state["product"] = _pack_state(list(products))
+        if self.lazy:
+            state["sizes"] = self.get_sizes()
+        tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+        torch.save(state, tmp_file)
+        os.replace(tmp_file, cache_file)
+
+    def load_cache(self, cache_file, transform=None, **kwargs):
+        """
+        Load the dataset from a binary file saved by :meth:`save_cache`.
+
+        Parameters:
+            cache_file (str): file name
+            transform (Callable, optional): data transformation function
+        """
+        state = _torch_load(cache_file)
+
         self.transform = transform
+        self.lazy = state["lazy"]
+        self.kwargs = state["kwargs"]
+        self.smiles_list = _StringList(state["smiles_list"])
+        self.targets = defaultdict(list, state["targets"])
+        if "reactant" in state:
+            reactants = _unpack_state(state["reactant"])
+            products = _unpack_state(state["product"])
+            self.data = [list(mols) for mols in zip(reactants, products)]
+        else:
+            self.data = [None] * len(self.smiles_list)
+            if self.data:
+                self.data[0] = _construct_reaction(self.smiles_list[0], True, self.kwargs)
+        if "sizes" in state:
+            self._sizes = state["sizes"]
+            self._size_source = self.data
+
+    def get_item(self, index):
+        if getattr(self, "lazy", False):
+            item = {"graph": _construct_reaction(self.smiles_list[index], True, self.kwargs)}
+        else:
+            item = {"graph": self.data[index]}
+        item.update({k: v[index] for k, v in self.targets.items()})
+        if self.transform:
+            item = self.transform(item)
+        return item
+
+    def _get_reactions(self):
+        if getattr(self, "lazy", False):
+            return (_construct_reaction(smiles, True, self.kwargs) for smiles in self.smiles_list)
+        return self.data
+
+    def pack_data(self):
+        """Reactions are collated sample by sample, so there is nothing to pack."""
+        return
+
+    def share_memory(self):
+        """Reactions are not packed into arrays, so they are kept in the memory of each process."""
+        return
+
+    def get_sizes(self):
+        """
+        Get the total number of nodes and edges of the reactant and the product in each reaction.
+
+        The sizes are cached in the dataset until ``self.data`` is replaced.
+        Lazy datasets record the sizes when the SMILES strings are validated.
+
+        Returns:
+            (LongTensor, LongTensor): number of nodes, number of edges
+        """
+        return super(ReactionDataset, self).get_sizes()
+
+    def _compute_sizes(self):
+        num_nodes = []
+        num_edges = []
+        for reactant, product in self._get_reactions():
+            num_nodes.append(int(reactant.num_node + product.num_node))
+            num_edges.append(int(reactant.num_edge + product.num_edge))
+        return torch.tensor(num_nodes, dtype=torch.long), torch.tensor(num_edges, dtype=torch.long)
+
+    def get_batch(self, indices):
+        """
+        Get a batch of samples, collated by :func:`graph_collate <torchdrug.data.graph_collate>`.
+
+        Parameters:
+            indices (list of int): sample indices
+
+        Returns:
+            dict
+        """
+        return data.graph_collate(self[list(indices)])
 
     @property
     def node_feature_dim(self):
@@ -261,7 +727,7 @@ class ReactionDataset(MoleculeDataset, core.Configurable):
     def atom_types(self):
         """All atom types."""
         atom_types = set()
-        for graphs in self.data:
+        for graphs in self._get_reactions():
             for graph in graphs:
                 atom_types.update(graph.atom_type.tolist())
         return sorted(atom_types)
@@ -270,7 +736,7 @@ class ReactionDataset(MoleculeDataset, core.Configurable):
     def bond_types(self):
         """All bond types."""
         bond_types = set()
-        for graphs in self.data:
+        for graphs in self._get_reactions():
             for graph in graphs:
                 bond_types.update(graph.edge_list[:, 2].tolist())
         return sorted(bond_types)
@@ -279,6 +745,606 @@ class ReactionDataset(MoleculeDataset, core.Configurable):
         return len(self.data)
 
 
+class MoleculeStream(torch_data.IterableDataset):
+    """
+    Streaming molecule dataset over a large SMILES file.
+
+    The file is read in chunks instead of loaded into memory.
+    Lines are sharded across dataloader workers and distributed ranks by byte offsets,
+    and optionally shuffled within a fixed-size buffer.
+    Each sample contains a molecule graph, and any number of prediction targets.
+
+    .. note::
+
+        Shards are split by bytes, so different ranks may yield slightly different number of samples.
+        For distributed training, specify ``batch_per_epoch`` in :meth:`Engine.train <torchdrug.core.Engine.train>`
+        to keep all ranks in step.
+    """
+
+    @doc.copy_args(data.Molecule.from_molecule)
+    def load_file(self, file_name, smiles_field="smiles", target_fields=None, delimiter=",", header=True,
+                  transform=None, shuffle=False, buffer_size=10000, chunk_size=1048576, seed=0, **kwargs):
+        """
+        Load the dataset from a delimited SMILES file.
+
+        Parameters:
+            file_name (str): file name
+            smiles_field (str or int, optional): name of SMILES column in the table.
+                If the file has no header, this should be the column index.
+            target_fields (list of str or list of int, optional): name of target columns in the table.
+                If the file has no header, these should be column indexes.
+                Default is all columns other than the SMILES column.
+            delimiter (str, optional): delimiter of columns. Quoted fields are not supported.
+            header (bool, optional): the first line of the file is a header or not
+            transform (Callable, optional): data transformation function
+            shuffle (bool, optional): shuffle samples within a buffer or not
+            buffer_size (int, optional): number of samples in the shuffle buffer
+            chunk_size (int, optional): number of bytes read from the file at a time
+            seed (int, optional): random seed for shuffling
+            **kwargs
+        """
+        if shuffle and buffer_size <= 0:
+            raise ValueError("Expect a positive `buffer_size` for shuffling, but found %d" % buffer_size)
+        self.file_name = file_name
+        self.delimiter = delimiter
+        self.transform = transform
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.kwargs = kwargs
+        self.epoch = 0
+
+        with open(file_name, "rb") as fin:
+            if header:
+                fields = fin.readline().decode().rstrip("\r\n").split(delimiter)
+                self.start = fin.tell()
+            else:
+                line = fin.readline().decode().rstrip("\r\n")
+                fields = list(range(len(line.split(delimiter))))
+                self.start = 0
+        self.end = os.path.getsize(file_name)
+
+        if smiles_field not in fields:
+            raise ValueError("Can't find SMILES column `%s` in the file" % smiles_field)
+        if target_fields is None:
+            target_fields = [field for field in fields if field != smiles_field]
+        self.smiles_column = fields.index(smiles_field)
+        self.target_columns = {}
+        for field in target_fields:
+            if field not in fields:
+                raise ValueError("Can't find target column `%s` in the file" % field)
+            self.target_columns[field] = fields.index(field)
+
+    def set_epoch(self, epoch):
+        """
+        Set the epoch number, which changes the shuffling order.
+
+        Parameters:
+            epoch (int): epoch number
+        """
+        self.epoch = epoch
+
+    def _get_shard(self):
+        worker_info = torch_data.get_worker_info()
+        if worker_info is None:
+            num_worker, worker_id = 1, 0
+        else:
+            num_worker, worker_id = worker_info.num_workers, worker_info.id
+        num_shard = comm.get_world_size() * num_worker
+        shard_id = comm.get_rank() * num_worker + worker_id
+        return shard_id, num_shard
+
+    def _read_lines(self, start, end):
+        # each line belongs to the shard where it begins
+        with open(self.file_name, "rb") as fin:
+            if start > self.start:
+                fin.seek(start - 1)
+                fin.readline()
+            else:
+                fin.seek(start)
+            offset = fin.tell()
+            while offset < end:
+                # every line in the chunk begins before the end of the shard
+                chunk = fin.read(min(self.chunk_size, end - offset))
+                if not chunk:
+                    break
+                if not chunk.endswith(b"\n"):
+                    chunk += fin.readline()
+                offset += len(chunk)
+                lines = chunk.split(b"\n")
+                if not lines[-1]:
+                    lines.pop()
+                yield from lines
+
+    def _shuffle(self, iterable, rng):
+        buffer = []
+        for item in iterable:
+            if len(buffer) < self.buffer_size:
+                buffer.append(item)
+                continue
+            index = rng.randrange(self.buffer_size)
+            buffer[index], item = item, buffer[index]
+            yield item
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def _parse_line(self, line):
+        line = line.decode().rstrip("\r\n")
+        if not line.strip():
+            return None
+        values = line.split(self.delimiter)
+        if len(values) <= self.smiles_column:
+            return None
+        mol = Chem.MolFromSmiles(values[self.smiles_column])
+        if not mol:
+            logger.debug("Can't construct molecule from SMILES `%s`. Ignore this sample." % values[self.smiles_column])
+            return None
+        item = {"graph": data.Molecule.from_molecule(mol, **self.kwargs)}
+        for field, column in self.target_columns.items():
+            item[field] = utils.literal_eval(values[column])
+        return item
+
+    def __iter__(self):
+        shard_id, num_shard = self._get_shard()
+        length = self.end - self.start
+        start = self.start + length * shard_id // num_shard
+        end = self.start + length * (shard_id + 1) // num_shard
+
+        lines = self._read_lines(start, end)
+        if self.shuffle:
+            rng = random.Random(hash((self.seed, self.epoch, shard_id)))
+            lines = self._shuffle(lines, rng)
+        for line in lines:
+            item = self._parse_line(line)
+            if item is None:
+                continue
+            if self.transform:
+                item = self.transform(item)
+            yield item
+
+    @property
+    def tasks(self):
+        """List of tasks."""
+        return list(self.target_columns.keys())
+
+    @utils.cached_property
+    def _sample(self):
+        for line in self._read_lines(self.start, self.end):
+            item = self._parse_line(line)
+            if item is not None:
+                return item["graph"]
+        raise ValueError("Can't find any valid molecule in `%s`" % self.file_name)
+
+    @property
+    def node_feature_dim(self):
+        """Dimension of node features."""
+        return self._sample.node_feature.shape[-1]
+
+    @property
+    def edge_feature_dim(self):
+        """Dimension of edge features."""
+        return self._sample.edge_feature.shape[-1]
+
+    def __repr__(self):
+        lines = ["file: %s" % self.file_name, "#task: %d" % len(self.tasks)]
+        return "%s(\n  %s\n)" % (self.__class__.__name__, "\n  ".join(lines))
+
+
+def _get_size(mol, kwargs):
+    # the same atoms and bonds as data.Molecule.from_molecule, without featurization
+    if kwargs.get("with_hydrogen", False):
+        mol = Chem.AddHs(mol)
+    num_bond = sum(str(bond.GetBondType()) in data.Molecule.bond2id for bond in mol.GetBonds())
+    return mol.GetNumAtoms(), num_bond * 2
+
+
+def _construct_molecules(smiles_list, featurize, kwargs):
+    # without featurization, only the number of nodes and edges of a valid molecule is returned
+    mols = []
+    for smiles in smiles_list:
+        mol = Chem.MolFromSmiles(smiles)
+        if not mol:
+            mol = None
+        elif featurize:
+            mol = data.Molecule.from_molecule(mol, **kwargs)
+        else:
+            mol = _get_size(mol, kwargs)
+        mols.append(mol)
+    return mols
+
+
+def _construct_reaction(smiles, featurize, kwargs):
+    # without featurization, only the total number of nodes and edges of a valid reaction is returned
+    smiles_reactant, agent, smiles_product = smiles.split(">")
+    mols = []
+    for _smiles in [smiles_reactant, smiles_product]:
+        mol = Chem.MolFromSmiles(_smiles)
+        if not mol:
+            logger.debug("Can't construct molecule from SMILES `%s`. Ignore this sample." % _smiles)
+            return None
+        if featurize:
+            mol = data.Molecule.from_molecule(mol, **kwargs)
+        else:
+            mol = _get_size(mol, kwargs)
+        mols.append(mol)
+    if featurize:
+        return mols
+    return tuple(sum(sizes) for sizes in zip(*mols))
+
+
+def _construct_reactions(smiles_list, featurize, kwargs):
+    return [_construct_reaction(smiles, featurize, kwargs) for smiles in smiles_list]
+
+
+def _get_featurizer_checksum(options):
+    # featurizers are identified by the source files that define them,
+    # so that the cache is invalidated once any featurizer is modified
+    source_files = {inspect.getsourcefile(data.Molecule)}
+    for key, kind in [("node_feature", "atom"), ("edge_feature", "bond"), ("graph_feature", "molecule")]:
+        for name in data.Molecule._standarize_option(options.get(key)):
+            func = R.get("features.%s.%s" % (kind, name))
+            source_files.add(inspect.getsourcefile(inspect.unwrap(func)))
+    md5 = hashlib.md5()
+    for source_file in sorted(source_files):
+        with open(source_file, "rb") as fin:
+            md5.update(fin.read())
+    return md5.hexdigest()
+
+
+def _torch_load(file_name):
+    # cache files are written by torchdrug, and may hold any picklable option or target
+    # PyTorch 2.6 changes the default of torch.load to weights_only=True, which rejects them
+    if "weights_only" in inspect.signature(torch.load).parameters:
+        return torch.load(file_name, weights_only=False)
+    return torch.load(file_name)
+
+
+def _get_cache_file(file_name, options):
+    # cache files are named after the source file and a hash of the options
+    key = hashlib.md5(repr(sorted(options.items())).encode()).hexdigest()
+    path = os.path.join(os.path.dirname(os.path.abspath(file_name)), "cache")
+    if not os.path.exists(path):
+        os.makedirs(path, exist_ok=True)
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    return os.path.join(path, "%s_%s.pt" % (name, key))
+
+
+def _read_columns(file_name, num_column, chunk_size, verbose=0, delimiter=b"\t"):
+    # parse a delimited file chunk by chunk, yielding a flat list of byte tokens in row-major order
+    with open(file_name, "rb") as fin:
+        if verbose:
+            pbar = tqdm(desc="Loading %s" % file_name, total=os.path.getsize(file_name), unit="B", unit_scale=True)
+        while True:
+            chunk = fin.read(chunk_size)
+            if not chunk:
+                break
+            chunk += fin.readline()
+            if b'"' in chunk:
+                # quoted fields are parsed by csv.reader, the same as the line-by-line loader
+                chunk, tokens = _read_quoted_columns(chunk, fin, num_column, delimiter)
+            else:
+                tokens = None
+            if verbose:
+                pbar.update(len(chunk))
+            if tokens is None:
+                chunk = chunk.replace(b"\r\n", b"\n").rstrip(b"\n")
+                if not chunk:
+                    continue
+                num_line = chunk.count(b"\n") + 1
+                tokens = chunk.replace(b"\n", delimiter).split(delimiter)
+                if len(tokens) != num_line * num_column:
+                    raise ValueError("Expect %d columns in each line of `%s`" % (num_column, file_name))
+            yield tokens
+        if verbose:
+            pbar.close()
+
+
+def _read_quoted_columns(chunk, fin, num_column, delimiter):
+    # a quoted field may span multiple lines, so extend the chunk until no quote is left open at its end
+    while True:
+        try:
+            rows = list(csv.reader(io.StringIO(chunk.decode()), delimiter=delimiter.decode(), strict=True))
+            break
+        except csv.Error as e:
+            line = fin.readline() if "unexpected end of data" in str(e) else None
+            if not line:
+                rows = list(csv.reader(io.StringIO(chunk.decode()), delimiter=delimiter.decode()))
+                break
+            chunk += line
+    tokens = []
+    for row in rows:
+        if len(row) != num_column:
+            raise ValueError("Expect %d columns in each line of `%s`" % (num_column, fin.name))
+        tokens += [token.encode() for token in row]
+    return chunk, tokens
+
+
+def _index_tokens(tokens, inv_vocab):
+    # deduplicate tokens with one np.unique pass over a fixed-width bytes array,
+    # so that only distinct tokens are hashed in Python
+    # unseen tokens are appended to the vocab in the order of first occurrence
+    if len(tokens) == 0:
+        return np.zeros(0, dtype=np.int64)
+    first, inverse = np.unique(np.array(tokens, dtype=np.bytes_), return_index=True, return_inverse=True)[1:]
+    ids = np.empty(len(first), dtype=np.int64)
+    for i in np.argsort(first).tolist():
+        # look up the original token, since fixed-width bytes drop trailing null bytes
+        ids[i] = inv_vocab.setdefault(tokens[first[i]], len(inv_vocab))
+    return ids[inverse.reshape(-1)]
+
+
+def _parse_numbers(tokens):
+    # bulk counterpart of utils.literal_eval for numeric columns, keeping integer columns as integers
+    try:
+        return tokens.astype(np.int64)
+    except ValueError:
+        return tokens.astype(np.float32)
+
+
+def _concat_numbers(arrays, num_column):
+    if not arrays:
+        return np.zeros((0, num_column), dtype=np.int64)
+    if any(array.dtype == np.float32 for array in arrays):
+        arrays = [array.astype(np.float32) for array in arrays]
+    return np.concatenate(arrays)
+
+
+def _read_vocab(file_name):
+    # vocabularies are stored as json lists, so that any token, including empty strings, is kept as is
+    with open(file_name, "r", encoding="utf-8") as fin:
+        return json.load(fin)
+
+
+def _write_vocab(file_name, vocab):
+    with open(file_name, "w", encoding="utf-8") as fout:
+        json.dump(list(vocab), fout, ensure_ascii=False)
+
+
+def _compute_scaffolds(smiles_list, chirality):
+    return [MurckoScaffold.MurckoScaffoldSmiles(smiles=smiles, includeChirality=chirality) for smiles in smiles_list]
+
+
+class _StringList(Sequence):
+    """
+    Immutable list of strings stored in one contiguous buffer.
+
+    Unlike a list of ``str``, reading an element doesn't touch any per-element Python object,
+    so the memory pages are kept shared by forked dataloader workers.
+    """
+
+    def __init__(self, strings):
+        strings = [string.encode() for string in strings]
+        lengths = np.fromiter((len(string) for string in strings), dtype=np.int64, count=len(strings))
+        self.buffer = b"".join(strings)
+        self.offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("list index out of range")
+        return self.buffer[self.offsets[index]: self.offsets[index + 1]].decode()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def take(self, indexes):
+        """
+        Return a new string list of the selected strings, without decoding them.
+
+        Parameters:
+            indexes (array_like of int): indexes of strings. Indexes may repeat.
+        """
+        indexes = np.asarray(indexes, dtype=np.int64).reshape(-1)
+        starts = self.offsets[indexes]
+        ends = self.offsets[indexes + 1]
+        result = _StringList([])
+        result.buffer = b"".join([self.buffer[start: end] for start, end in zip(starts, ends)])
+        result.offsets = np.zeros(len(indexes) + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=result.offsets[1:])
+        return result
+
+
+class _MoleculeColumns(object):
+    """Molecules packed into flat node, edge and graph arrays."""
+
+    def __init__(self, columns, num_relation, meta_dict, relation_dict):
+        self.columns = columns
+        self.num_relation = num_relation
+        self.meta_dict = meta_dict
+        self.relation_dict = relation_dict
+
+        zero = torch.zeros(1, dtype=torch.long)
+        self.num_nodes = columns["num_nodes"]
+        self.num_edges = columns["num_edges"]
+        self.num_cum_nodes = torch.cat([zero, self.num_nodes.cumsum(0)])
+        self.num_cum_edges = torch.cat([zero, self.num_edges.cumsum(0)])
+
+    @classmethod
+    def from_molecules(cls, mols):
+        columns = defaultdict(list)
+        num_nodes = []
+        num_edges = []
+        meta_dict = None
+        for mol in mols:
+            if meta_dict is None:
+                meta_dict = mol.meta_dict
+                num_relation = mol.num_relation
+                relation_dict = {k: getattr(mol, k) for k, v in meta_dict.items() if v == "relation"}
+            num_nodes.append(mol.num_node)
+            num_edges.append(mol.num_edge)
+            columns["edge_list"].append(mol.edge_list)
+            columns["edge_weight"].append(mol.edge_weight)
+            for k, v in meta_dict.items():
+                if v in ["node", "edge"]:
+                    columns[k].append(getattr(mol, k))
+                elif v == "graph":
+                    columns[k].append(getattr(mol, k).unsqueeze(0))
+        if meta_dict is None:
+            raise ValueError("Can't pack an empty list of molecules")
+
+        columns = {k: torch.cat(v) for k, v in columns.items()}
+        columns["num_nodes"] = torch.stack(num_nodes)
+        columns["num_edges"] = torch.stack(num_edges)
+        return cls(columns, num_relation, meta_dict, relation_dict)
+
+    def get_item(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("index %d is out of range for %d molecules" % (index, len(self)))
+        node_start, node_end = self.num_cum_nodes[index: index + 2].tolist()
+        edge_start, edge_end = self.num_cum_edges[index: index + 2].tolist()
+        node_index = slice(node_start, node_end)
+        edge_index = slice(edge_start, edge_end)
+        data_dict = dict(self.relation_dict)
+        for k, v in self.meta_dict.items():
+            if v == "node":
+                data_dict[k] = self.columns[k][node_index]
+            elif v == "edge":
+                data_dict[k] = self.columns[k][edge_index]
+            elif v == "graph":
+                data_dict[k] = self.columns[k][index]
+
+        return data.Molecule(self.columns["edge_list"][edge_index], edge_weight=self.columns["edge_weight"][edge_index],
+                             num_node=self.num_nodes[index], num_relation=self.num_relation,
+                             meta_dict=self.meta_dict, **data_dict)
+
+    def pack(self, indices):
+        index = torch.as_tensor(indices, dtype=torch.long)
+        # num_cum_nodes has one more element than num_nodes, so negative indexes are normalized first
+        index = torch.where(index < 0, index + len(self), index)
+        num_nodes = self.num_nodes[index]
+        num_edges = self.num_edges[index]
+        node_index = _concat_ranges(self.num_cum_nodes[index], num_nodes)
+        edge_index = _concat_ranges(self.num_cum_edges[index], num_edges)
+        data_dict = dict(self.relation_dict)
+        for k, v in self.meta_dict.items():
+            if v == "node":
+                data_dict[k] = _shared_index_select(self.columns[k], node_index)
+            elif v == "edge":
+                data_dict[k] = _shared_index_select(self.columns[k], edge_index)
+            elif v == "graph":
+                data_dict[k] = _shared_index_select(self.columns[k], index)
+
+        num_cum_nodes = num_nodes.cumsum(0)
+        offsets = (num_cum_nodes - num_nodes).repeat_interleave(num_edges)
+        edge_list = _shared_index_select(self.columns["edge_list"], edge_index)
+        edge_list[:, :2] += offsets.unsqueeze(-1)
+        edge_weight = _shared_index_select(self.columns["edge_weight"], edge_index)
+        return data.PackedMolecule(edge_list, edge_weight=edge_weight,
+                                   num_nodes=num_nodes, num_edges=num_edges, num_relation=self.num_relation,
+                                   offsets=offsets, meta_dict=self.meta_dict, **data_dict)
+
+    def __getitem__(self, index):
+        return self.get_item(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_item(i)
+
+    def __len__(self):
+        return len(self.num_nodes)
+
+
+class _MemoryMappedMolecules(_MoleculeColumns):
+    """Read-only sequence of molecules backed by memory-mapped columns."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        columns = {}
+        names = ["edge_list", "edge_weight", "num_nodes", "num_edges"]
+        names += [k for k, v in meta["meta_dict"].items() if v in ["node", "edge", "graph"]]
+        for name in names:
+            # copy-on-write mapping, so that the arrays are writable without touching the files
+            array = np.load(os.path.join(path, "%s.npy" % name), mmap_mode="c")
+            columns[name] = torch.from_numpy(array)
+        super(_MemoryMappedMolecules, self).__init__(columns, meta["num_relation"], meta["meta_dict"],
+                                                     meta["relation_dict"])
+
+    def __getstate__(self):
+        # only pass the path to other processes, which map the same files
+        meta = {"num_relation": self.num_relation, "meta_dict": self.meta_dict, "relation_dict": self.relation_dict}
+        return {"path": self.path, "meta": meta}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["meta"])
+
+
+def _shared_index_select(tensor, index):
+    # in dataloader workers, place the result in shared memory, so that it is sent to the main process without copying
+    out = None
+    if torch.utils.data.get_worker_info() is not None and tensor.ndim > 0:
+        numel = len(index) * int(np.prod(tensor.shape[1:]))
+        if numel > 0:
+            storage = tensor.storage()._new_shared(numel)
+            out = tensor.new(storage).view(len(index), *tensor.shape[1:])
+    return torch.index_select(tensor, 0, index, out=out)
+
+
+def _concat_ranges(starts, counts):
+    # concatenation of range(start, start + count) for each pair, without a python loop
+    offsets = counts.cumsum(0) - counts
+    return torch.arange(int(counts.sum())) + (starts - offsets).repeat_interleave(counts)
+
+
+def _pack_state(graphs):
+    graph = graphs[0].pack(graphs)
+    return {
+        "edge_list": graph.edge_list,
+        "edge_weight": graph.edge_weight,
+        "num_nodes": graph.num_nodes,
+        "num_edges": graph.num_edges,
+        "num_relation": graph.num_relation,
+        "offsets": graph._offsets,
+        "meta_dict": graph.meta_dict,
+        "data_dict": graph.data_dict,
+    }
+
+
+def _unpack_state(state):
+    graph = data.PackedMolecule(state["edge_list"], edge_weight=state["edge_weight"], num_nodes=state["num_nodes"],
+                                num_edges=state["num_edges"], num_relation=state["num_relation"],
+                                offsets=state["offsets"], meta_dict=state["meta_dict"], **state["data_dict"])
+    return graph.unpack()
+
+
+def _map_chunk(args):
+    func, chunk, func_args = args
+    result = func(chunk, *func_args)
+    # serialize tensors in-band, otherwise every tensor is passed as a separate shared memory handle
+    return pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _parallel_map(func, inputs, args, num_worker, chunk_size, description=None):
+    """
+    Apply a chunk-wise function over inputs with a process pool. Results are yielded in the original order.
+
+    Parameters:
+        func (callable): function that takes a chunk of inputs followed by ``args``, and returns a list of results
+        inputs (list): inputs to process
+        args (tuple): additional arguments passed to ``func``
+        num_worker (int): number of worker processes
+        chunk_size (int): number of inputs in each chunk
+        description (str, optional): description for the progress bar. If not provided, no progress bar is shown.
+    """
+    chunks = ((func, inputs[i: i + chunk_size], args) for i in range(0, len(inputs), chunk_size))
+    with multiprocessing.Pool(num_worker) as pool:
+        results = pool.imap(_map_chunk, chunks)
+        if description:
+            results = tqdm(results, description, math.ceil(len(inputs) / chunk_size))
+        for result in results:
+            for x in pickle.loads(result):
+                yield x
+
+
 class NodeClassificationDataset(torch_data.Dataset, core.Configurable):
     """
     Node classification dataset.
@@ -286,7 +1352,7 @@ class NodeClassificationDataset(torch_data.Dataset, core.Configurable):
     The whole dataset contains one graph, where each node has its own node feature and label.
     """
 
-    def load_tsv(self, node_file, edge_file, verbose=0):
+    def load_tsv(self, node_file, edge_file, verbose=0, cache=False, chunk_size=67108864):
         """
         Load the edge list from a tsv file.
 
@@ -294,68 +1360,113 @@ class NodeClassificationDataset(torch_data.Dataset, core.Configurable):
             node_file (str): node feature and label file
             edge_file (str): edge list file
             verbose (int, optional): output verbose level
+            cache (bool, optional): store the parsed features, labels, edges and vocabularies in a ``cache``
+                directory next to the node file, and reuse them if the files are unchanged
+            chunk_size (int, optional): number of bytes parsed at a time
         """
+        if cache:
+            prefix = self._get_cache_prefix(node_file, edge_file)
+            result = self._load_cache(prefix, verbose)
+            if result is not None:
+                edge_list, node_feature, node_label, node_vocab, label_vocab = result
+                self.load_edge(edge_list, node_feature, node_label, node_vocab=node_vocab, label_vocab=label_vocab)
+                return
+
+        with open(node_file, "r") as fin:
+            num_column = len(next(csv.reader(fin, delimiter="\t"), [None]))
         inv_node_vocab = {}
         inv_label_vocab = {}
         node_feature = []
         node_label = []
-
-        with open(node_file, "r") as fin:
-            reader = csv.reader(fin, delimiter="\t")
-            if verbose:
-                reader = tqdm(reader, "Loading %s" % node_file, utils.get_line_count(node_file))
-            for tokens in reader:
-                node_token = tokens[0]
-                feature_tokens = tokens[1: -1]
-                label_token = tokens[-1]
-                inv_node_vocab[node_token] = len(inv_node_vocab)
-                if label_token not in inv_label_vocab:
-                    inv_label_vocab[label_token] = len(inv_label_vocab)
-                feature = [utils.literal_eval(f) for f in feature_tokens]
-                label = inv_label_vocab[label_token]
-                node_feature.append(feature)
-                node_label.append(label)
+        for tokens in _read_columns(node_file, num_column, chunk_size, verbose):
+            node_tokens = tokens[0::num_column]
+            label_tokens = tokens[num_column - 1::num_column]
+            num_node = len(inv_node_vocab)
+            _index_tokens(node_tokens, inv_node_vocab)
+            if len(inv_node_vocab) != num_node + len(node_tokens):
+                raise ValueError("Duplicate nodes in `%s`" % node_file)
+            feature_tokens = np.array(tokens).reshape(-1, num_column)[:, 1: -1]
+            node_feature.append(_parse_numbers(feature_tokens))
+            node_label.append(_index_tokens(label_tokens, inv_label_vocab))
+        node_feature = _concat_numbers(node_feature, num_column - 2)
+        node_label = np.concatenate(node_label) if node_label else np.zeros(0, dtype=np.int64)
 
         edge_list = []
-
-        with open(edge_file, "r") as fin:
-            reader = csv.reader(fin, delimiter="\t")
-            if verbose:
-                reader = tqdm(reader, "Loading %s" % edge_file, utils.get_line_count(edge_file))
-            for tokens in reader:
-                h_token, t_token = tokens
-                if h_token not in inv_node_vocab:
-                    inv_node_vocab[h_token] = len(inv_node_vocab)
-                h = inv_node_vocab[h_token]
-                if t_token not in inv_node_vocab:
-                    inv_node_vocab[t_token] = len(inv_node_vocab)
-                t = inv_node_vocab[t_token]
-                edge_list.append((h, t))
-
-        self.load_edge(edge_list, node_feature, node_label, inv_node_vocab=inv_node_vocab,
-                       inv_label_vocab=inv_label_vocab)
+        for tokens in _read_columns(edge_file, 2, chunk_size, verbose):
+            # unseen nodes are indexed in the order of first occurrence, with head before tail in each row
+            edge_list.append(_index_tokens(tokens, inv_node_vocab).reshape(-1, 2))
+        edge_list = np.concatenate(edge_list) if edge_list else np.zeros((0, 2), dtype=np.int64)
+
+        edge_list = torch.from_numpy(edge_list)
+        node_feature = torch.from_numpy(node_feature)
+        node_label = torch.from_numpy(node_label)
+        node_vocab = [token.decode() for token in inv_node_vocab]
+        label_vocab = [token.decode() for token in inv_label_vocab]
+        if cache:
+            self._save_cache(prefix, edge_list, node_feature, node_label, node_vocab, label_vocab)
+        self.load_edge(edge_list, node_feature, node_label, node_vocab=node_vocab, label_vocab=label_vocab)
 
     def load_edge(self, edge_list, node_feature, node_label, node_vocab=None, inv_node_vocab=None, label_vocab=None,
                   inv_label_vocab=None):
         node_vocab, inv_node_vocab = self._standarize_vocab(node_vocab, inv_node_vocab)
         label_vocab, inv_label_vocab = self._standarize_vocab(label_vocab, inv_label_vocab)
 
+        node_feature = torch.as_tensor(node_feature)
+        node_label = torch.as_tensor(node_label)
         self.num_labeled_node = len(node_feature)
         if len(node_vocab) > len(node_feature):
-            logger.warning("Missing features & labels for %d / %d nodes" %
-                           (len(node_vocab) - len(node_feature), len(node_vocab)))
-            dummy_label = 0
-            dummy_feature = [0] * len(node_feature[0])
-            node_label += [dummy_label] * (len(node_vocab) - len(node_feature))
-            node_feature += [dummy_feature] * (len(node_vocab) - len(node_feature))
+            num_missing = len(node_vocab) - len(node_feature)
+            logger.warning("Missing features & labels for %d / %d nodes" % (num_missing, len(node_vocab)))
+            dummy_label = node_label.new_zeros(num_missing)
+            dummy_feature = node_feature.new_zeros(num_missing, *node_feature.shape[1:])
+            node_label = torch.cat([node_label, dummy_label])
+            node_feature = torch.cat([node_feature, dummy_feature])
 
         self.graph = data.Graph(edge_list, num_node=len(node_vocab), node_feature=node_feature)
         with self.graph.node():
-            self.graph.node_label = torch.as_tensor(node_label)
+            self.graph.node_label = node_label
         self.node_vocab = node_vocab
         self.inv_node_vocab = inv_node_vocab
         self.label_vocab = label_vocab
-        self.inv_node_vocab = inv_label_vocab
+        self.inv_label_vocab = inv_label_vocab
+
+    def _get_cache_prefix(self, node_file, edge_file):
+        options = {"class": self.__class__.__name__,
+                   "md5": [utils.compute_md5(node_file), utils.compute_md5(edge_file)]}
+        return os.path.splitext(_get_cache_file(node_file, options))[0]
+
+    def _load_cache(self, prefix, verbose=0):
+        cache_files = ["%s.%s" % (prefix, ext) for ext in ["pt", "node.json", "label.json"]]
+        if not all(os.path.exists(f) for f in cache_files):
+            return None
+        if verbose:
+            logger.info("Loading node classification data from cache %s" % prefix)
+        state = _torch_load(cache_files[0])
+        node_feature = state["node_feature"]
+        if isinstance(node_feature, dict):
+            node_feature = torch.sparse_coo_tensor(node_feature["indices"], node_feature["values"],
+                                                   node_feature["size"]).to_dense()
+        node_vocab = _read_vocab(cache_files[1])
+        label_vocab = _read_vocab(cache_files[2])
+        return state["edge_list"], node_feature, state["node_label"], node_vocab, label_vocab
+
+    def _save_cache(self, prefix, edge_list, node_feature, node_label, node_vocab, label_vocab):
+        # bag-of-words features are mostly zero, so store them in COO format whenever that is smaller
+        num_nonzero = int(torch.count_nonzero(node_feature))
+        sparse_size = num_nonzero * (node_feature.ndim * 8 + node_feature.element_size())
+        if sparse_size < node_feature.numel() * node_feature.element_size():
+            sparse = node_feature.to_sparse().coalesce()
+            node_feature = {"indices": sparse.indices(), "values": sparse.values(), "size": list(sparse.shape)}
+        state = {"edge_list": edge_list, "node_feature": node_feature, "node_label": node_label}
+
+        cache_files = ["%s.%s" % (prefix, ext) for ext in ["pt", "node.json", "label.json"]]
+        tmp_prefix = "%s.%d.tmp" % (prefix, os.getpid())
+        tmp_files = ["%s.%s" % (tmp_prefix, ext) for ext in ["pt", "node.json", "label.json"]]
+        torch.save(state, tmp_files[0])
+        _write_vocab(tmp_files[1], node_vocab)
+        _write_vocab(tmp_files[2], label_vocab)
+        for tmp_file, cache_file in zip(tmp_files, cache_files):
+            os.replace(tmp_file, cache_file)
 
     def _standarize_vocab(self, vocab, inverse_vocab):
         if vocab is not None:
@@ -371,6 +1482,13 @@ class NodeClassificationDataset(torch_data.Dataset, core.Configurable):
                 vocab = sorted(inverse_vocab, key=lambda k: inverse_vocab[k])
         return vocab, inverse_vocab
 
+    def share_memory(self):
+        """
+        Place the graph in shared memory, so that distributed processes on the same node share a single copy.
+        All distributed processes should call this method.
+        """
+        self.graph = self.graph.share_memory()
+
     @property
     def num_node(self):
         """Number of nodes."""
@@ -408,74 +1526,89 @@ class KnowledgeGraphDataset(torch_data.Dataset, core.Configurable):
     The whole dataset contains one knowledge graph.
     """
 
-    def load_tsv(self, tsv_file, verbose=0):
+    def load_tsv(self, tsv_file, verbose=0, cache=False, chunk_size=67108864):
         """
         Load the dataset from a tsv file.
 
         Parameters:
             tsv_file (str): file name
             verbose (int, optional): output verbose level
+            cache (bool, optional): store the parsed triplets and vocabularies in a ``cache`` directory
+                next to the file, and reuse them if the file is unchanged
+            chunk_size (int, optional): number of bytes parsed at a time
         """
-        inv_entity_vocab = {}
-        inv_relation_vocab = {}
-        triplets = []
+        triplets, entity_vocab, relation_vocab, num_samples = \
+            self._read_triplets([tsv_file], verbose, cache, chunk_size)
+        self.load_triplet(triplets, entity_vocab=entity_vocab, relation_vocab=relation_vocab)
 
-        with open(tsv_file, "r") as fin:
-            reader = csv.reader(fin, delimiter="\t")
-            if verbose:
-                reader = tqdm(reader, "Loading %s" % tsv_file)
-            for tokens in reader:
-                h_token, r_token, t_token = tokens
-                if h_token not in inv_entity_vocab:
-                    inv_entity_vocab[h_token] = len(inv_entity_vocab)
-                h = inv_entity_vocab[h_token]
-                if r_token not in inv_relation_vocab:
-                    inv_relation_vocab[r_token] = len(inv_relation_vocab)
-                r = inv_relation_vocab[r_token]
-                if t_token not in inv_entity_vocab:
-                    inv_entity_vocab[t_token] = len(inv_entity_vocab)
-                t = inv_entity_vocab[t_token]
-                triplets.append((h, t, r))
-
-        self.load_triplet(triplets, inv_entity_vocab=inv_entity_vocab, inv_relation_vocab=inv_relation_vocab)
-
-    def load_tsvs(self, tsv_files, verbose=0):
+    def load_tsvs(self, tsv_files, verbose=0, cache=False, chunk_size=67108864):
         """
         Load the dataset from multiple tsv files.
 
         Parameters:
             tsv_files (list of str): list of file names
             verbose (int, optional): output verbose level
+            cache (bool, optional): store the parsed triplets and vocabularies in a ``cache`` directory
+                next to the first file, and reuse them if the files are unchanged
+            chunk_size (int, optional): number of bytes parsed at a time
         """
+        triplets, entity_vocab, relation_vocab, num_samples = \
+            self._read_triplets(tsv_files, verbose, cache, chunk_size)
+        self.load_triplet(triplets, entity_vocab=entity_vocab, relation_vocab=relation_vocab)
+        self.num_samples = num_samples
+
+    def _read_triplets(self, tsv_files, verbose, cache, chunk_size):
+        if cache:
+            options = {"class": self.__class__.__name__, "md5": [utils.compute_md5(f) for f in tsv_files]}
+            prefix = os.path.splitext(_get_cache_file(tsv_files[0], options))[0]
+            cache_files = ["%s.%s" % (prefix, ext) for ext in ["npy", "entity.json", "relation.json", "pt"]]
+            if all(os.path.exists(f) for f in cache_files):
+                if verbose:
+                    logger.info("Loading triplets from cache %s" % prefix)
+                # copy-on-write mapping, so that triplets are paged in from the file instead of read into memory
+                triplets = torch.from_numpy(np.load(cache_files[0], mmap_mode="c"))
+                entity_vocab = _read_vocab(cache_files[1])
+                relation_vocab = _read_vocab(cache_files[2])
+                num_samples = _torch_load(cache_files[3])["num_samples"]
+                return triplets, entity_vocab, relation_vocab, num_samples
+
         inv_entity_vocab = {}
         inv_relation_vocab = {}
         triplets = []
         num_samples = []
-
         for tsv_file in tsv_files:
-            with open(tsv_file, "r") as fin:
-                reader = csv.reader(fin, delimiter="\t")
-                if verbose:
-                    reader = tqdm(reader, "Loading %s" % tsv_file, utils.get_line_count(tsv_file))
-
-                num_sample = 0
-                for tokens in reader:
-                    h_token, r_token, t_token = tokens
-                    if h_token not in inv_entity_vocab:
-                        inv_entity_vocab[h_token] = len(inv_entity_vocab)
-                    h = inv_entity_vocab[h_token]
-                    if r_token not in inv_relation_vocab:
-                        inv_relation_vocab[r_token] = len(inv_relation_vocab)
-                    r = inv_relation_vocab[r_token]
-                    if t_token not in inv_entity_vocab:
-                        inv_entity_vocab[t_token] = len(inv_entity_vocab)
-                    t = inv_entity_vocab[t_token]
-                    triplets.append((h, t, r))
-                    num_sample += 1
+            num_sample = 0
+            for tokens in _read_columns(tsv_file, 3, chunk_size, verbose):
+                h_tokens, r_tokens, t_tokens = tokens[0::3], tokens[1::3], tokens[2::3]
+                # entities are indexed in the order of first occurrence, with head before tail in each row
+                entity_tokens = [None] * (len(h_tokens) * 2)
+                entity_tokens[0::2] = h_tokens
+                entity_tokens[1::2] = t_tokens
+                entities = _index_tokens(entity_tokens, inv_entity_vocab)
+                relations = _index_tokens(r_tokens, inv_relation_vocab)
+                triplets.append(np.stack([entities[0::2], entities[1::2], relations], axis=-1))
+                num_sample += len(h_tokens)
             num_samples.append(num_sample)
-
-        self.load_triplet(triplets, inv_entity_vocab=inv_entity_vocab, inv_relation_vocab=inv_relation_vocab)
-        self.num_samples = num_samples
+        if triplets:
+            triplets = np.concatenate(triplets)
+        else:
+            triplets = np.zeros((0, 3), dtype=np.int64)
+        entity_vocab = [token.decode() for token in inv_entity_vocab]
+        relation_vocab = [token.decode() for token in inv_relation_vocab]
+
+        if cache:
+            tmp_prefix = "%s.%d.tmp" % (prefix, os.getpid())
+            tmp_files = ["%s.%s" % (tmp_prefix, ext) for ext in ["npy", "entity.json", "relation.json", "pt"]]
+            # triplets are kept as int64 rather than int32, since Graph takes torch.long edge lists
+            # an int32 cache would be converted on load, which copies the whole array instead of mapping it
+            np.save(tmp_files[0], triplets)
+            _write_vocab(tmp_files[1], entity_vocab)
+            _write_vocab(tmp_files[2], relation_vocab)
+            torch.save({"num_samples": num_samples}, tmp_files[3])
+            for tmp_file, cache_file in zip(tmp_files, cache_files):
+                os.replace(tmp_file, cache_file)
+
+        return torch.from_numpy(triplets), entity_vocab, relation_vocab, num_samples
 
     def load_triplet(self, triplets, entity_vocab=None, relation_vocab=None, inv_entity_vocab=None,
                      inv_relation_vocab=None):
@@ -515,6 +1648,13 @@ class KnowledgeGraphDataset(torch_data.Dataset, core.Configurable):
                 vocab = sorted(inverse_vocab, key=lambda k: inverse_vocab[k])
         return vocab, inverse_vocab
 
+    def share_memory(self):
+        """
+        Place the knowledge graph in shared memory, so that distributed processes on the same node share a single copy.
+        All distributed processes should call this method.
+        """
+        self.graph = self.graph.share_memory()
+
     @property
     def num_entity(self):
         """Number of entities."""
@@ -580,51 +1720,101 @@ def semisupervised(dataset, length):
 
 
 def key_split(dataset, keys, lengths=None, key_lengths=None):
+    """
+    Randomly split a dataset into new datasets, where samples with the same key are kept in the same split.
 
-    def round_to_boundary(i):
-        for j in range(min(i, len(dataset) - i)):
-            if keys[indexes[i - j]] != keys[indexes[i - j - 1]]:
-                return i - j
-            if keys[indexes[i + j]] != keys[indexes[i + j - 1]]:
-                return i + j
-        if i < len(dataset) - i:
-            return 0
-        else:
-            return len(dataset)
+    Each split boundary is rounded to the nearest boundary between two keys.
+
+    Parameters:
+        dataset (Dataset): dataset to split
+        keys (array_like): key of each sample
+        lengths (list of int, optional): expected length for each split.
+            Note the results may be different in length due to rounding.
+        key_lengths (list of int, optional): number of keys for each split.
+            Only one of ``lengths`` and ``key_lengths`` should be provided.
 
+    Returns:
+        list of Subset: splits, whose indices are LongTensor
+    """
     keys = torch.as_tensor(keys)
     key_set, keys = torch.unique(keys, return_inverse=True)
     perm = torch.randperm(len(key_set))
     keys = perm[keys]
-    indexes = keys.argsort().tolist()
+    indexes = keys.argsort()
+
+    # boundaries between consecutive groups of the same key, including 0 and the end
+    _, counts = torch.unique_consecutive(keys[indexes], return_counts=True)
+    boundaries = torch.cat([torch.zeros(1, dtype=torch.long), counts.cumsum(0)])
 
     if key_lengths is not None:
         assert lengths is None
-        key2count = torch.bincount(keys)
-        key_offset = 0
-        lengths = []
-        for key_length in key_lengths:
-            lengths.append(key2count[key_offset: key_offset + key_length].sum().item())
-            key_offset += key_length
+        key_offsets = torch.as_tensor(key_lengths, dtype=torch.long).cumsum(0)
+        ends = boundaries[key_offsets.clamp(max=len(key_set))]
+        starts = torch.cat([torch.zeros(1, dtype=torch.long), ends[:-1]])
+        lengths = (ends - starts).tolist()
 
     offset = 0
     offsets = [offset]
     for length in lengths:
-        offset = round_to_boundary(offset + length)
+        offset = _round_to_boundary(boundaries, offset + length)
         offsets.append(offset)
-    offsets[-1] = len(dataset)
+    offsets[-1] = len(keys)
     return [torch_data.Subset(dataset, indexes[offsets[i]: offsets[i + 1]]) for i in range(len(lengths))]
 
 
-def scaffold_split(dataset, lengths):
+def _round_to_boundary(boundaries, position):
+    # nearest boundary to the position
+    # ties go to the smaller boundary, except that the end of the dataset wins over an inner boundary
+    end = int(boundaries[-1])
+    position = min(max(position, 0), end)
+    index = int(torch.searchsorted(boundaries, torch.tensor([position]))[0])
+    upper = int(boundaries[index])
+    if upper == position or index == 0:
+        return upper
+    lower = int(boundaries[index - 1])
+    if position - lower < upper - position or (position - lower == upper - position and upper != end):
+        return lower
+    return upper
+
+
+def scaffold_split(dataset, lengths, num_worker=0, cache_file=None):
     """
     Randomly split a dataset into new datasets with non-overlapping scaffolds.
 
+    For a :class:`MoleculeDataset`, scaffolds are computed from its SMILES strings.
+
     Parameters:
         dataset (Dataset): dataset to split
         lengths (list of int): expected length for each split.
             Note the results may be different in length due to rounding.
+        num_worker (int, optional): number of worker processes for computing scaffolds
+        cache_file (str, optional): file to store the split indices.
+            If the file exists and matches the dataset content, lengths and the state of the global random generator,
+            the split is loaded from it, and the random generator is advanced as if the split were computed.
     """
+    keys = None
+    checksum = _get_smiles_checksum(dataset)
+    if checksum is None:
+        keys = _get_scaffold_keys(dataset, num_worker)
+        checksum = _get_checksum(keys)
+    # the split is random, so it is only reused under the same seed
+    rng_state = hashlib.md5(torch.get_rng_state().numpy().tobytes()).hexdigest()
+    options = {"method": "scaffold_split", "num_sample": len(dataset), "lengths": list(lengths),
+               "checksum": checksum, "rng_state": rng_state}
+    indices = _load_split(cache_file, options)
+    if indices is not None:
+        return [torch_data.Subset(dataset, index) for index in indices]
+
+    if keys is None:
+        keys = _get_scaffold_keys(dataset, num_worker)
+    splits = key_split(dataset, keys, lengths)
+    _save_split(splits, cache_file, options, rng_state=torch.get_rng_state())
+    return splits
+
+
+def _get_scaffold_keys(dataset, num_worker):
+    if isinstance(dataset, MoleculeDataset) and not isinstance(dataset, ReactionDataset):
+        return dataset.get_scaffold_ids(num_worker=num_worker)
 
     scaffold2id = {}
     keys = []
@@ -636,11 +1826,10 @@ def scaffold_split(dataset, lengths):
         else:
             id = scaffold2id[scaffold]
         keys.append(id)
-
-    return key_split(dataset, keys, lengths)
+    return keys
 
 
-def ordered_scaffold_split(dataset, lengths, chirality=True):
+def ordered_scaffold_split(dataset, lengths, chirality=True, num_worker=0, cache_file=None):
     """
     Split a dataset into new datasets with non-overlapping scaffolds and sorted w.r.t. number of each scaffold.
 
@@ -648,15 +1837,25 @@ def ordered_scaffold_split(dataset, lengths, chirality=True):
         dataset (Dataset): dataset to split
         lengths (list of int): expected length for each split.
             Note the results may be different in length due to rounding.
+        chirality (bool, optional): consider chirality in the scaffold or not
+        num_worker (int, optional): number of worker processes for computing scaffolds
+        cache_file (str, optional): file to store the split indices.
+            If the file exists and matches the dataset content and chirality, the split is loaded from it.
     """
+    checksum = _get_smiles_checksum(dataset)
+    if checksum is None:
+        checksum = _get_checksum(dataset.get_scaffold_ids(chirality, num_worker=num_worker))
+    options = {"method": "ordered_scaffold_split", "num_sample": len(dataset), "chirality": chirality,
+               "checksum": checksum}
+    indices = _load_split(cache_file, options)
+    if indices is not None:
+        return tuple(torch_data.Subset(dataset, index.tolist()) for index in indices)
+
     frac_train, frac_valid, frac_test = 0.8, 0.1, 0.1
 
     scaffold2id = defaultdict(list)
-    for idx, smiles in enumerate(dataset.smiles_list):
-        scaffold = MurckoScaffold.MurckoScaffoldSmiles(smiles=smiles, includeChirality=chirality)
-        scaffold2id[scaffold].append(idx)
-
-    scaffold2id = {key: sorted(value) for key, value in scaffold2id.items()}
+    for idx, id in enumerate(dataset.get_scaffold_ids(chirality, num_worker=num_worker).tolist()):
+        scaffold2id[id].append(idx)
     scaffold_sets = [
         scaffold_set for (scaffold, scaffold_set) in sorted(
             scaffold2id.items(), key=lambda x: (len(x[1]), x[1][0]), reverse=True)
@@ -673,4 +1872,52 @@ def ordered_scaffold_split(dataset, lengths, chirality=True):
         else:
             train_idx.extend(scaffold_set)
 
-    return torch_data.Subset(dataset, train_idx), torch_data.Subset(dataset, valid_idx), torch_data.Subset(dataset, test_idx)
+    splits = torch_data.Subset(dataset, train_idx), torch_data.Subset(dataset, valid_idx), \
+             torch_data.Subset(dataset, test_idx)
+    _save_split(splits, cache_file, options)
+    return splits
+
+
+def _get_smiles_checksum(dataset):
+    # identify the dataset by its SMILES strings, so that a split is never reused for different molecules
+    smiles_list = getattr(dataset, "smiles_list", None)
+    if smiles_list is None:
+        return None
+    md5 = hashlib.md5()
+    if isinstance(smiles_list, _StringList):
+        md5.update(smiles_list.buffer)
+        md5.update(smiles_list.offsets.tobytes())
+    else:
+        for smiles in smiles_list:
+            md5.update(smiles.encode())
+            md5.update(b"\n")
+    return md5.hexdigest()
+
+
+def _get_checksum(keys):
+    keys = torch.as_tensor(keys, dtype=torch.long)
+    return hashlib.md5(keys.numpy().tobytes()).hexdigest()
+
+
+def _load_split(cache_file, options):
+    if cache_file is None or not os.path.exists(cache_file):
+        return None
+    state = _torch_load(cache_file)
+    if state["options"] != options:
+        logger.warning("Split options in `%s` don't match. Recompute the split." % cache_file)
+        return None
+    if "rng_state" in state:
+        # leave the random generator in the same state as computing the split
+        torch.set_rng_state(state["rng_state"])
+    return state["indices"]
+
+
+def _save_split(splits, cache_file, options, rng_state=None):
+    if cache_file is None:
+        return
+    state = {"options": options, "indices": [torch.as_tensor(split.indices, dtype=torch.long) for split in splits]}
+    if rng_state is not None:
+        state["rng_state"] = rng_state
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    torch.save(state, tmp_file)
+    os.replace(tmp_file, cache_file)
@@ -1,5 +1,7 @@
 import warnings
+import functools
 
+import torch
 from rdkit import Chem
 from rdkit.Chem import AllChem
 
@@ -45,8 +47,113 @@ def onehot(x, vocab, allow_unknown=False):
     return feature
 
 
-# TODO: this one is too slow
+class FeatureTable(object):
+    """
+    Memoized feature function over discrete invariants of atoms or bonds.
+
+    The feature function is only evaluated once for each distinct key, and the result is stored as a row in a table.
+    Featurizing a batch of atoms or bonds then reduces to key lookups and a single tensor gather.
+
+    Parameters:
+        func (callable): feature function
+        key (callable): function that maps an atom or a bond to a hashable key.
+            The feature function must only depend on this key.
+        extra (callable, optional): feature function that isn't memoized, e.g. coordinates.
+            Its features are appended to the memoized ones.
+    """
+
+    def __init__(self, func, key, extra=None):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.key = key
+        self.extra = extra
+        self.index = {}
+        self.rows = []
+        self.table = None
+
+    def lookup(self, x):
+        """
+        Get the row index of an atom or a bond in the table.
+        If the table has extra features, return the row index and the extra features instead.
+
+        Parameters:
+            x (rdchem.Atom or rdchem.Bond): atom or bond
+        """
+        key = self.key(x)
+        index = self.index.get(key)
+        if index is None:
+            index = len(self.rows)
+            self.rows.append(self.func(x))
+            self.index[key] = index
+        if self.extra:
+            return index, self.extra(x)
+        return index
+
+    def gather(self, indices):
+        """
+        Get features for a batch of row indices.
+
+        Parameters:
+            indices (list): row indices returned by :meth:`lookup`
+
+        Returns:
+            Tensor: features of shape :math:`(n, d)`
+        """
+        if self.table is None or len(self.table) < len(self.rows):
+            self.table = torch.tensor(self.rows)
+        if self.extra:
+            indices, extras = zip(*indices)
+            return torch.cat([self.table[list(indices)], torch.tensor(extras)], dim=-1)
+        return self.table[indices]
+
+    def __call__(self, x):
+        index = self.lookup(x)
+        if self.extra:
+            index, extra = index
+            return list(self.rows[index]) + extra
+        return list(self.rows[index])
+
+    def __reduce__(self):
+        # pickle by reference, as plain functions do
+        return self.__qualname__
+
+
+def feature_table(key, extra=None):
+    """
+    Memoize a feature function with a :class:`FeatureTable`.
+
+    This function should be applied as a decorator.
+
+    Parameters:
+        key (callable): function that maps an atom or a bond to a hashable key
+        extra (callable, optional): feature function appended to the memoized features without memoization
+    """
+
+    def decorator(func):
+        return FeatureTable(func, key, extra)
+
+    return decorator
+
+
+@R.register("features.atom.position")
+def atom_position(atom):
+    """
+    Atom position.
+    Return 3D position if available, otherwise 2D position is returned.
+    """
+    mol = atom.GetOwningMol()
+    if mol.GetNumConformers() == 0:
+        mol.Compute2DCoords()
+    conformer = mol.GetConformer()
+    pos = conformer.GetAtomPosition(atom.GetIdx())
+    return [pos.x, pos.y, pos.z]
+
+
 @R.register("features.atom.default")
+@feature_table(lambda atom: (atom.GetSymbol(), atom.GetChiralTag(), atom.GetTotalDegree(), atom.GetFormalCharge(),
+                             atom.GetTotalNumHs(), atom.GetNumRadicalElectrons(), atom.GetHybridization(),
+                             atom.GetIsAromatic(), atom.IsInRing()),
+               extra=atom_position)
 def atom_default(atom):
     """Default atom feature.
 
@@ -71,6 +178,7 @@ def atom_default(atom):
         
         atom_position(): the 3D position of the atom
     """
+    # atom_position() is appended by the feature table
     return onehot(atom.GetSymbol(), atom_vocab, allow_unknown=True) + \
            onehot(atom.GetChiralTag(), chiral_tag_vocab) + \
            onehot(atom.GetTotalDegree(), degree_vocab, allow_unknown=True) + \
@@ -78,11 +186,12 @@ def atom_default(atom):
            onehot(atom.GetTotalNumHs(), num_hs_vocab) + \
            onehot(atom.GetNumRadicalElectrons(), num_radical_vocab) + \
            onehot(atom.GetHybridization(), hybridization_vocab) + \
-           [atom.GetIsAromatic(), atom.IsInRing()] + \
-           atom_position(atom)
+           [atom.GetIsAromatic(), atom.IsInRing()]
 
 
 @R.register("features.atom.center_identification")
+@feature_table(lambda atom: (atom.GetSymbol(), atom.GetTotalNumHs(), atom.GetTotalDegree(), atom.GetTotalValence(),
+                             atom.GetIsAromatic(), atom.IsInRing()))
 def atom_center_identification(atom):
     """Reaction center identification atom feature.
 
@@ -107,6 +216,8 @@ def atom_center_identification(atom):
 
 
 @R.register("features.atom.synthon_completion")
+@feature_table(lambda atom: (atom.GetSymbol(), atom.GetTotalNumHs(), atom.GetTotalDegree(), atom.IsInRing(),
+                             atom.IsInRingSize(3), atom.IsInRingSize(4), atom.IsInRingSize(5), atom.IsInRingSize(6)))
 def atom_synthon_completion(atom):
     """Synthon completion atom feature.
 
@@ -133,6 +244,7 @@ def atom_synthon_completion(atom):
 
 
 @R.register("features.atom.symbol")
+@feature_table(lambda atom: atom.GetSymbol())
 def atom_symbol(atom):
     """Symbol atom feature.
 
@@ -143,6 +255,8 @@ def atom_symbol(atom):
 
 
 @R.register("features.atom.explicit_property_prediction")
+@feature_table(lambda atom: (atom.GetSymbol(), atom.GetDegree(), atom.GetTotalValence(), atom.GetFormalCharge(),
+                             atom.GetIsAromatic()))
 def atom_explicit_property_prediction(atom):
     """Explicit property prediction atom feature.
 
@@ -165,6 +279,8 @@ def atom_explicit_property_prediction(atom):
 
 
 @R.register("features.atom.property_prediction")
+@feature_table(lambda atom: (atom.GetSymbol(), atom.GetDegree(), atom.GetTotalNumHs(), atom.GetTotalValence(),
+                             atom.GetFormalCharge(), atom.GetIsAromatic()))
 def atom_property_prediction(atom):
     """Property prediction atom feature.
 
@@ -189,21 +305,8 @@ def atom_property_prediction(atom):
            [atom.GetIsAromatic()]
 
 
-@R.register("features.atom.position")
-def atom_position(atom):
-    """
-    Atom position.
-    Return 3D position if available, otherwise 2D position is returned.
-    """
-    mol = atom.GetOwningMol()
-    if mol.GetNumConformers() == 0:
-        mol.Compute2DCoords()
-    conformer = mol.GetConformer()
-    pos = conformer.GetAtomPosition(atom.GetIdx())
-    return [pos.x, pos.y, pos.z]
-
-
 @R.register("features.atom.pretrain")
+@feature_table(lambda atom: (atom.GetSymbol(), atom.GetChiralTag()))
 def atom_pretrain(atom):
     """Atom feature for pretraining.
 
@@ -216,7 +319,21 @@ def atom_pretrain(atom):
            onehot(atom.GetChiralTag(), chiral_tag_vocab)
 
 
+@R.register("features.bond.length")
+def bond_length(bond):
+    """Bond length"""
+    mol = bond.GetOwningMol()
+    if mol.GetNumConformers() == 0:
+        mol.Compute2DCoords()
+    conformer = mol.GetConformer()
+    h = conformer.GetAtomPosition(bond.GetBeginAtomIdx())
+    t = conformer.GetAtomPosition(bond.GetEndAtomIdx())
+    return [h.Distance(t)]
+
+
 @R.register("features.bond.default")
+@feature_table(lambda bond: (bond.GetBondType(), bond.GetBondDir(), bond.GetStereo(), bond.GetIsConjugated()),
+               extra=bond_length)
 def bond_default(bond):
     """Default bond feature.
 
@@ -231,26 +348,15 @@ def bond_default(bond):
         
         bond_length: the length of the bond
     """
+    # bond_length() is appended by the feature table
     return onehot(bond.GetBondType(), bond_type_vocab) + \
            onehot(bond.GetBondDir(), bond_dir_vocab) + \
            onehot(bond.GetStereo(), bond_stereo_vocab) + \
-           [int(bond.GetIsConjugated())] + \
-           bond_length(bond)
-
-
-@R.register("features.bond.length")
-def bond_length(bond):
-    """Bond length"""
-    mol = bond.GetOwningMol()
-    if mol.GetNumConformers() == 0:
-        mol.Compute2DCoords()
-    conformer = mol.GetConformer()
-    h = conformer.GetAtomPosition(bond.GetBeginAtomIdx())
-    t = conformer.GetAtomPosition(bond.GetEndAtomIdx())
-    return [h.Distance(t)]
+           [int(bond.GetIsConjugated())]
 
 
 @R.register("features.bond.property_prediction")
+@feature_table(lambda bond: (bond.GetBondType(), bond.GetIsConjugated(), bond.IsInRing()))
 def bond_property_prediction(bond):
     """Property prediction bond feature.
 
@@ -266,6 +372,7 @@ def bond_property_prediction(bond):
 
 
 @R.register("features.bond.pretrain")
+@feature_table(lambda bond: (bond.GetBondType(), bond.GetBondDir()))
 def bond_pretrain(bond):
     """Bond feature for pretraining.
 
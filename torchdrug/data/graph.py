@@ -6,10 +6,10 @@ import networkx as nx
 
 from matplotlib import pyplot as plt
 import torch
-from torch_scatter import scatter_add, scatter_min
+from torch_scatter import scatter_add, scatter_min, segment_csr
 
 from torchdrug import core, utils
-from torchdrug.utils import pretty
+from torchdrug.utils import comm, pretty
 
 plt.switch_backend("agg")
 
@@ -80,6 +80,41 @@ class Graph(core._MetaContainer):
             with self.graph():
                 self.graph_feature = torch.as_tensor(graph_feature, device=self.device)
 
+    @classmethod
+    def _from_trusted(cls, *args, **kwargs):
+        """
+        Construct a graph from inputs that are known to be valid, skipping all checks and conversions.
+
+        This is a fast path for internal operations that derive a graph from another graph.
+        The arguments follow :meth:`__init__`, except that all of them should be tensors on the same device,
+        ``num_node`` should be provided, and every attribute in ``data_dict`` should have its type in ``meta_dict``.
+        """
+        graph = cls.__new__(cls)
+        graph._trusted_init(*args, **kwargs)
+        return graph
+
+    def _trusted_init(self, edge_list, edge_weight=None, num_node=None, num_relation=None, meta_dict=None,
+                      **data_dict):
+        device = edge_list.device
+        if edge_weight is None:
+            edge_weight = torch.ones(len(edge_list), device=device)
+        if num_relation is not None:
+            num_relation = torch.as_tensor(num_relation, device=device)
+        meta_dict = {} if meta_dict is None else meta_dict.copy()
+        for key, type in [("node_feature", "node"), ("edge_feature", "edge"), ("graph_feature", "graph")]:
+            if key in data_dict:
+                meta_dict.setdefault(key, type)
+
+        self._setattr("_meta_context", None)
+        self._setattr("meta_dict", meta_dict)
+        self._setattr("_edge_list", edge_list)
+        self._setattr("_edge_weight", edge_weight)
+        self._setattr("num_node", torch.as_tensor(num_node, device=device))
+        self._setattr("num_edge", torch.tensor(len(edge_list), device=device))
+        self._setattr("num_relation", num_relation)
+        for k, v in data_dict.items():
+            self._setattr(k, v)
+
     def node(self):
         """
         Context manager for node attributes.
@@ -227,19 +262,29 @@ class Graph(core._MetaContainer):
             (PackedGraph, Tensor): connected components, number of connected components per graph
         """
         node_in, node_out = self.edge_list.t()[:2]
-        range = torch.arange(self.num_node, device=self.device)
-        node_in, node_out = torch.cat([node_in, node_out, range]), torch.cat([node_out, node_in, range])
-
-        # find connected component
-        # O(d|E|), d is the diameter of the graph
-        min_neighbor = torch.arange(self.num_node, device=self.device)
-        last = torch.zeros_like(min_neighbor)
-        while not torch.equal(min_neighbor, last):
-            last = min_neighbor
-            min_neighbor = scatter_min(min_neighbor[node_out], node_in, dim_size=self.num_node)[0]
-        anchor = torch.unique(min_neighbor)
+        node_in, node_out = torch.cat([node_in, node_out]), torch.cat([node_out, node_in])
+
+        # find connected component by union-find with pointer jumping
+        # O(|E|log|V|) in the worst case
+        # each root is always the minimal node of its tree, which is the same label as min propagation
+        parent = torch.arange(self.num_node, device=self.device)
+        while True:
+            parent_in = parent[node_in]
+            parent_out = parent[node_out]
+            mask = parent_in != parent_out
+            if not mask.any():
+                break
+            # hook the root of each tree to the minimal root among its neighbors
+            parent = scatter_min(parent_out[mask], parent_in[mask], dim=0, out=parent.clone())[0]
+            # compress each tree to a star
+            while True:
+                grandparent = parent[parent]
+                if torch.equal(grandparent, parent):
+                    break
+                parent = grandparent
+        anchor = torch.unique(parent)
         num_cc = scatter_add(torch.ones_like(anchor), self.node2graph[anchor])
-        return self.split(min_neighbor), num_cc
+        return self.split(parent), num_cc
 
     def split(self, node2graph):
         """
@@ -317,12 +362,18 @@ class Graph(core._MetaContainer):
                 raise ValueError("Inconsistent `num_relation` in graphs. Expect %d but got %d."
                                  % (num_relation, graph.num_relation))
 
-        edge_list = torch.cat(edge_list)
-        edge_weight = torch.cat(edge_weight)
-        data_dict = {k: torch.cat(v) for k, v in data_dict.items()}
+        # in dataloader workers, tensors are concatenated into shared memory
+        # so that the batch is sent to the main process without copying
+        edge_list = _shared_cat(edge_list)
+        edge_weight = _shared_cat(edge_weight)
+        data_dict = {k: _shared_cat(v) for k, v in data_dict.items()}
+        num_nodes = torch.as_tensor(num_nodes, device=edge_list.device)
+        num_edges = torch.as_tensor(num_edges, device=edge_list.device)
+        offsets = (num_nodes.cumsum(0) - num_nodes).repeat_interleave(num_edges)
+        edge_list[:, :2] += offsets.unsqueeze(-1)
 
         return cls.packed_type(edge_list, edge_weight=edge_weight, num_nodes=num_nodes, num_edges=num_edges,
-                               num_relation=num_relation, meta_dict=meta_dict, **data_dict)
+                               num_relation=num_relation, offsets=offsets, meta_dict=meta_dict, **data_dict)
 
     def repeat(self, count):
         """
@@ -385,6 +436,8 @@ class Graph(core._MetaContainer):
         """
         Return all indexes of the edge. Support partial match with wildcard `None`.
 
+        This scans all edges, unless :meth:`match` has already built a sorted index for the queried axes.
+
         Examples::
 
             >>> graph = data.Graph([[0, 1, 0], [0, 2, 1], [1, 2, 1]])
@@ -398,18 +451,117 @@ class Graph(core._MetaContainer):
         Returns:
             Tensor: indexes of the edge
         """
+        num_axis = self.edge_list.shape[1]
         if isinstance(edge, torch.Tensor):
+            mask = [True] * len(edge)
             index = slice(None, len(edge))
         else:
-            index = [x is not None for x in edge] + [False] * (self.edge_list.shape[1] - len(edge))
+            mask = [x is not None for x in edge]
+            index = mask + [False] * (num_axis - len(edge))
             edge = [x for x in edge if x is not None]
             index = torch.tensor(index, device=self.device)
+        mask = tuple(mask + [False] * (num_axis - len(mask)))
+
+        # reuse the sorted index if match() has built one for these axes, otherwise scan the edges
+        if ("edge_key",) + mask in self._get_cache():
+            query = torch.zeros(1, num_axis, dtype=torch.long, device=self.device)
+            query[0, torch.tensor(mask, device=self.device)] = torch.as_tensor(edge, dtype=torch.long,
+                                                                               device=self.device)
+            return self._match(query, torch.tensor([mask], device=self.device))[0]
 
         edge_list = self.edge_list[:, index]
         edge = torch.as_tensor(edge, device=self.device)
         match = (edge_list == edge).all(dim=-1)
         return match.nonzero().flatten()
 
+    def match(self, pattern):
+        """
+        Return all indexes of edges that match each pattern. Support partial match with wildcard `-1`.
+
+        This is a batched version of :meth:`index`. The first query builds a sorted index of the edges,
+        which is cached and reused by later calls of :meth:`match` and :meth:`index` on this graph.
+        Use this method rather than :meth:`index` for many queries.
+
+        Examples::
+
+            >>> graph = data.Graph([[0, 1, 0], [0, 2, 1], [1, 2, 1]])
+            >>> index, num_match = graph.match([[0, 1, 2], [0, 1, -1], [-1, 2, -1]])
+            >>> assert index.tolist() == [0, 1, 2]
+            >>> assert num_match.tolist() == [0, 1, 2]
+
+        Parameters:
+            pattern (array_like): queried edges of shape :math:`(n, 2)` or :math:`(n, 3)`
+
+        Returns:
+            (LongTensor, LongTensor): indexes of matched edges, number of matches for each pattern
+        """
+        pattern = torch.as_tensor(pattern, dtype=torch.long, device=self.device)
+        num_axis = self.edge_list.shape[1]
+        if pattern.ndim != 2 or pattern.shape[1] > num_axis:
+            raise ValueError("Expect patterns of shape (n, %d), but found %s" % (num_axis, tuple(pattern.shape)))
+        padding = -torch.ones(len(pattern), num_axis - pattern.shape[1], dtype=torch.long, device=self.device)
+        pattern = torch.cat([pattern, padding], dim=-1)
+        mask = pattern != -1
+
+        return self._match(pattern, mask)
+
+    def _edge_key(self, edge, mask):
+        # encode the specified axes of edges as a single integer
+        cache = self._get_cache()
+        if "edge_radix" not in cache:
+            radixes = [int(self.num_node), int(self.num_node)]
+            if self.edge_list.shape[1] > 2:
+                num_relation = int(self.num_relation) if self.num_relation is not None else 0
+                if len(self.edge_list):
+                    num_relation = max(num_relation, self.edge_list[:, 2].max().item() + 1)
+                radixes.append(num_relation)
+            cache["edge_radix"] = radixes
+
+        key = torch.zeros(len(edge), dtype=torch.long, device=self.device)
+        is_valid = torch.ones(len(edge), dtype=torch.bool, device=self.device)
+        for i, radix in enumerate(cache["edge_radix"]):
+            if mask[i]:
+                key = key * radix + edge[:, i]
+                is_valid &= (edge[:, i] >= 0) & (edge[:, i] < radix)
+        return key, is_valid
+
+    def _match(self, pattern, mask):
+        """
+        Return indexes of matched edges for each pattern. Only axes specified in the mask are compared.
+        Edges are sorted by the specified axes once for each mask, and then cached.
+        """
+        cache = self._get_cache()
+        starts = torch.zeros(len(pattern), dtype=torch.long, device=self.device)
+        num_match = torch.zeros(len(pattern), dtype=torch.long, device=self.device)
+        orders = []
+        offset = 0
+        masks, inverse = torch.unique(mask.long(), dim=0, return_inverse=True)
+        for i, mask in enumerate(masks.bool().tolist()):
+            name = ("edge_key",) + tuple(mask)
+            if name not in cache:
+                key, order = self._edge_key(self.edge_list, mask)[0].sort(stable=True)
+                cache[name] = (key, order)
+            key, order = cache[name]
+
+            query_index = (inverse == i).nonzero().flatten()
+            query, is_valid = self._edge_key(pattern[query_index], mask)
+            start = torch.searchsorted(key, query)
+            end = torch.searchsorted(key, query, right=True)
+            starts[query_index] = start + offset
+            num_match[query_index] = torch.where(is_valid, end - start, torch.zeros_like(start))
+            orders.append(order)
+            offset += len(order)
+
+        if orders:
+            order = torch.cat(orders)
+        else:
+            order = torch.zeros(0, dtype=torch.long, device=self.device)
+        query_index = torch.repeat_interleave(num_match)
+        num_cum_match = num_match.cumsum(0)
+        position = torch.arange(len(query_index), device=self.device)
+        position = position - (num_cum_match - num_match)[query_index] + starts[query_index]
+        return order[position], num_match
+
     def __getitem__(self, index):
         # why do we check tuple
         # case 1: x[0, 1] is parsed as (0, 1)
@@ -509,8 +661,9 @@ class Graph(core._MetaContainer):
         else:
             data_dict, meta_dict = self.data_mask(edge_index=edge_index)# , exclude="graph")
 
-        return type(self)(edge_list[edge_index], edge_weight=self.edge_weight[edge_index], num_node=num_node,
-                          num_relation=self.num_relation, meta_dict=meta_dict, **data_dict)
+        return type(self)._from_trusted(edge_list[edge_index], edge_weight=self.edge_weight[edge_index],
+                                        num_node=num_node, num_relation=self.num_relation, meta_dict=meta_dict,
+                                        **data_dict)
 
     def compact(self):
         """
@@ -537,8 +690,9 @@ class Graph(core._MetaContainer):
         index = self._standarize_index(index, self.num_edge)
         data_dict, meta_dict = self.data_mask(edge_index=index)
 
-        return type(self)(self.edge_list[index], edge_weight=self.edge_weight[index], num_node=self.num_node,
-                          num_relation=self.num_relation, meta_dict=meta_dict, **data_dict)
+        return type(self)._from_trusted(self.edge_list[index], edge_weight=self.edge_weight[index],
+                                        num_node=self.num_node, num_relation=self.num_relation, meta_dict=meta_dict,
+                                        **data_dict)
 
     def full(self):
         """
@@ -597,8 +751,8 @@ class Graph(core._MetaContainer):
         index = torch.arange(self.num_edge, device=self.device).unsqueeze(-1).expand(-1, 2).flatten()
         data_dict, meta_dict = self.data_mask(edge_index=index)
 
-        return type(self)(edge_list, edge_weight=self.edge_weight[index], num_node=self.num_node,
-                          num_relation=num_relation, meta_dict=meta_dict, **data_dict)
+        return type(self)._from_trusted(edge_list, edge_weight=self.edge_weight[index], num_node=self.num_node,
+                                        num_relation=num_relation, meta_dict=meta_dict, **data_dict)
 
     @utils.cached_property
     def adjacency(self):
@@ -637,13 +791,106 @@ class Graph(core._MetaContainer):
     @utils.cached_property
     def degree_out(self):
         """Out degree of nodes."""
+        # sum over the sorted edges if the CSC index is already cached, e.g. by message passing layers
+        if "csc" in self._get_cache():
+            ptr, node_in, order = self.csc
+            return segment_csr(self.edge_weight[order], ptr)
         return scatter_add(self.edge_weight, self.edge_list[:, 1], dim_size=self.num_node)
 
     @utils.cached_property
     def degree_in(self):
         """In degree of nodes."""
+        if "csr" in self._get_cache():
+            ptr, node_out, order = self.csr
+            return segment_csr(self.edge_weight[order], ptr)
         return scatter_add(self.edge_weight, self.edge_list[:, 0], dim_size=self.num_node)
 
+    @property
+    def csr(self):
+        """
+        Compressed sparse row (CSR) index of the adjacency matrix, i.e., edges sorted by ``(node_in, node_out)``.
+
+        The index is computed once and cached until :attr:`edge_list` is modified.
+
+        Returns:
+            (LongTensor, LongTensor, LongTensor): row pointers of shape :math:`(|V| + 1,)`,
+            column indexes (``node_out``) of shape :math:`(|E|,)` and edge ids of shape :math:`(|E|,)`
+        """
+        node_in, node_out = self.edge_list.t()[:2]
+        return self._compressed_index("csr", node_in, node_out, self.num_node, self.num_node)
+
+    @property
+    def csc(self):
+        """
+        Compressed sparse column (CSC) index of the adjacency matrix, i.e., edges sorted by ``(node_out, node_in)``.
+
+        The index is computed once and cached until :attr:`edge_list` is modified.
+
+        Returns:
+            (LongTensor, LongTensor, LongTensor): column pointers of shape :math:`(|V| + 1,)`,
+            row indexes (``node_in``) of shape :math:`(|E|,)` and edge ids of shape :math:`(|E|,)`
+        """
+        node_in, node_out = self.edge_list.t()[:2]
+        return self._compressed_index("csc", node_out, node_in, self.num_node, self.num_node)
+
+    @property
+    def relational_csr(self):
+        """
+        Compressed sparse row (CSR) index of the adjacency matrix flattened to shape :math:`(|V|, |V| \\times R)`,
+        i.e., edges sorted by ``(node_in, node_out * num_relation + relation)``.
+
+        The index is computed once and cached until :attr:`edge_list` is modified.
+
+        Returns:
+            (LongTensor, LongTensor, LongTensor): row pointers of shape :math:`(|V| + 1,)`,
+            column indexes of shape :math:`(|E|,)` and edge ids of shape :math:`(|E|,)`
+        """
+        node_in, node_out, relation = self.edge_list.t()
+        num_col = self.num_node * self.num_relation
+        return self._compressed_index("relational_csr", node_in, node_out * self.num_relation + relation,
+                                      self.num_node, num_col)
+
+    @property
+    def relational_csc(self):
+        """
+        Compressed sparse column (CSC) index of the adjacency matrix flattened to shape :math:`(|V|, |V| \\times R)`,
+        i.e., edges sorted by ``(node_out * num_relation + relation, node_in)``.
+
+        The index is computed once and cached until :attr:`edge_list` is modified.
+
+        Returns:
+            (LongTensor, LongTensor, LongTensor): column pointers of shape :math:`(|V| \\times R + 1,)`,
+            row indexes (``node_in``) of shape :math:`(|E|,)` and edge ids of shape :math:`(|E|,)`
+        """
+        node_in, node_out, relation = self.edge_list.t()
+        num_row = self.num_node * self.num_relation
+        return self._compressed_index("relational_csc", node_out * self.num_relation + relation, node_in,
+                                      num_row, self.num_node)
+
+    def _get_cache(self):
+        # derived structures are valid until the edges are modified
+        version = (self._edge_list.data_ptr(), self._edge_list._version,
+                   self._edge_weight.data_ptr(), self._edge_weight._version)
+        cache = self.__dict__.get("_cache")
+        if cache is None or cache[0] != version:
+            cache = (version, {})
+            self._setattr("_cache", cache)
+        return cache[1]
+
+    def _compressed_index(self, name, row, col, num_row, num_col):
+        """
+        Compute a compressed index for a sparse matrix with one non-zero entry at ``(row, col)`` for each edge.
+        The index is cached under ``name`` until the edges are modified.
+        """
+        cache = self._get_cache()
+        if name not in cache:
+            key = row * num_col + col
+            order = key.sort(stable=True)[1]
+            ptr = torch.zeros(int(num_row) + 1, dtype=torch.long, device=self.device)
+            ptr[1:] = torch.bincount(row, minlength=int(num_row)).cumsum(0)
+            cache[name] = (ptr, col[order], order)
+        return cache[name]
+
     @property
     def edge_list(self):
         """List of edges."""
@@ -715,17 +962,28 @@ class Graph(core._MetaContainer):
         """
         Detach this graph.
         """
-        return type(self)(self.edge_list.detach(), edge_weight=self.edge_weight.detach(),
-                          num_node=self.num_node, num_relation=self.num_relation,
-                          meta_dict=self.meta_dict, **utils.detach(self.data_dict))
+        return type(self)._from_trusted(self.edge_list.detach(), edge_weight=self.edge_weight.detach(),
+                                        num_node=self.num_node, num_relation=self.num_relation,
+                                        meta_dict=self.meta_dict, **utils.detach(self.data_dict))
 
     def clone(self):
         """
         Clone this graph.
         """
-        return type(self)(self.edge_list.clone(), edge_weight=self.edge_weight.clone(),
-                          num_node=self.num_node, num_relation=self.num_relation,
-                          meta_dict=self.meta_dict, **utils.clone(self.data_dict))
+        return type(self)._from_trusted(self.edge_list.clone(), edge_weight=self.edge_weight.clone(),
+                                        num_node=self.num_node, num_relation=self.num_relation,
+                                        meta_dict=self.meta_dict, **utils.clone(self.data_dict))
+
+    def share_memory(self):
+        """
+        Return a copy of this graph in shared memory.
+
+        Distributed processes on the same node share a single copy of the graph.
+        See :func:`comm.share_memory <torchdrug.utils.comm.share_memory>` for details.
+        """
+        edge_list, edge_weight, data_dict = comm.share_memory((self.edge_list, self.edge_weight, self.data_dict))
+        return type(self)(edge_list, edge_weight=edge_weight, num_node=self.num_node, num_relation=self.num_relation,
+                          meta_dict=self.meta_dict, **data_dict)
 
     def cuda(self, *args, **kwargs):
         """
@@ -870,6 +1128,24 @@ class PackedGraph(Graph):
         super(PackedGraph, self).__init__(edge_list, edge_weight=edge_weight, num_node=num_node,
                                           num_relation=num_relation, **kwargs)
 
+    def _trusted_init(self, edge_list, edge_weight=None, num_nodes=None, num_edges=None, num_relation=None,
+                      offsets=None, meta_dict=None, **data_dict):
+        num_cum_nodes = num_nodes.cumsum(0)
+        num_cum_edges = num_edges.cumsum(0)
+        if offsets is None:
+            offsets = self._get_offsets(num_nodes, num_cum_edges)
+            edge_list = edge_list.clone()
+            edge_list[:, :2] += offsets.unsqueeze(-1)
+
+        self._setattr("_offsets", offsets)
+        self._setattr("num_nodes", num_nodes)
+        self._setattr("num_edges", num_edges)
+        self._setattr("num_cum_nodes", num_cum_nodes)
+        self._setattr("num_cum_edges", num_cum_edges)
+
+        super(PackedGraph, self)._trusted_init(edge_list, edge_weight, num_nodes.sum(), num_relation, meta_dict,
+                                               **data_dict)
+
     def _get_offsets(self, num_nodes, num_cum_edges):
         if num_cum_edges.numel():
             num_edge = num_cum_edges[-1]
@@ -906,31 +1182,60 @@ class PackedGraph(Graph):
 
         data_dict, meta_dict = graph.data_mask(exclude="graph")
 
-        return type(self)(graph.edge_list, edge_weight=graph.edge_weight, num_nodes=num_nodes,
-                          num_edges=num_edges, num_relation=graph.num_relation, offsets=offsets,
-                          meta_dict=meta_dict, **data_dict)
+        return type(self)._from_trusted(graph.edge_list, edge_weight=graph.edge_weight, num_nodes=num_nodes,
+                                        num_edges=num_edges, num_relation=graph.num_relation, offsets=offsets,
+                                        meta_dict=meta_dict, **data_dict)
 
     def unpack(self):
         """
         Unpack this packed graph into a list of graphs.
 
+        The graphs don't share storage with this packed graph, so they can be modified in place independently.
+
         Returns:
             list of Graph
         """
+        num_nodes = self.num_nodes.tolist()
+        num_edges = self.num_edges.tolist()
+        edge_list = self.edge_list.clone()
+        edge_list[:, :2] -= self._offsets.unsqueeze(-1)
+        edge_lists = edge_list.split(num_edges)
+        edge_weights = self.edge_weight.clone().split(num_edges)
+
+        # copy and split each attribute in one call, rather than slicing it for every graph
+        data_dicts = [{} for i in range(self.batch_size)]
+        for k, v in self.data_dict.items():
+            type = self.meta_dict[k]
+            if type == "node":
+                values = v.clone().split(num_nodes)
+            elif type == "edge":
+                values = v.clone().split(num_edges)
+            elif type == "graph":
+                values = v.clone().unbind()
+            else:
+                values = [v] * self.batch_size
+            for data_dict, value in zip(data_dicts, values):
+                data_dict[k] = value
+
         graphs = []
-        for i in range(self.batch_size):
-            graphs.append(self.get_item(i))
+        for edge_list, edge_weight, num_node, data_dict in zip(edge_lists, edge_weights, num_nodes, data_dicts):
+            graph = self.unpacked_type._from_trusted(edge_list, edge_weight=edge_weight, num_node=num_node,
+                                                     num_relation=self.num_relation, meta_dict=self.meta_dict,
+                                                     **data_dict)
+            graphs.append(graph)
         return graphs
 
     def __iter__(self):
         self._iter_index = 0
+        self._iter_graphs = self.unpack()
         return self
 
     def __next__(self):
         if self._iter_index < self.batch_size:
-            item = self[self._iter_index]
+            item = self._iter_graphs[self._iter_index]
             self._iter_index += 1
             return item
+        self._iter_graphs = None
         raise StopIteration
 
     def _check_attribute(self, key, value):
@@ -971,11 +1276,9 @@ class PackedGraph(Graph):
                                  (self.num_node, self.num_edge, len(data)))
         data_list = []
         if type == "node":
-            for i in range(self.batch_size):
-                data_list.append(data[self.num_cum_nodes[i] - self.num_nodes[i]: self.num_cum_nodes[i]])
+            data_list = list(data.split(self.num_nodes.tolist()))
         elif type == "edge":
-            for i in range(self.batch_size):
-                data_list.append(data[self.num_cum_edges[i] - self.num_edges[i]: self.num_cum_edges[i]])
+            data_list = list(data.split(self.num_edges.tolist()))
 
         return data_list
 
@@ -1004,10 +1307,10 @@ class PackedGraph(Graph):
             shape[0] = count
             data_dict[k] = v.repeat(shape)
 
-        return type(self)(edge_list, edge_weight=self.edge_weight.repeat(count),
-                          num_nodes=self.num_nodes.repeat(count), num_edges=self.num_edges.repeat(count),
-                          num_relation=self.num_relation, offsets=offsets,
-                          meta_dict=self.meta_dict, **data_dict)
+        return type(self)._from_trusted(edge_list, edge_weight=self.edge_weight.repeat(count),
+                                        num_nodes=self.num_nodes.repeat(count),
+                                        num_edges=self.num_edges.repeat(count), num_relation=self.num_relation,
+                                        offsets=offsets, meta_dict=self.meta_dict, **data_dict)
 
     def repeat_interleave(self, repeats):
         """
@@ -1062,9 +1365,9 @@ class PackedGraph(Graph):
 
         data_dict, meta_dict = self.data_mask(node_index, edge_index, graph_index)
 
-        return type(self)(edge_list, edge_weight=self.edge_weight[edge_index],
-                          num_nodes=num_nodes, num_edges=num_edges, num_relation=self.num_relation, offsets=offsets,
-                          meta_dict=meta_dict, **data_dict)
+        return type(self)._from_trusted(edge_list, edge_weight=self.edge_weight[edge_index],
+                                        num_nodes=num_nodes, num_edges=num_edges, num_relation=self.num_relation,
+                                        offsets=offsets, meta_dict=meta_dict, **data_dict)
 
     def get_item(self, index):
         """
@@ -1100,13 +1403,14 @@ class PackedGraph(Graph):
             raise ValueError("Sum of `num_edges` is %d, but found %d edges in `edge_list`" % (num_edge, len(edge_list)))
         num_cum_edges = num_edges.cumsum(0)
 
-        if offsets is None:
-            _edge_list = edge_list
-        else:
+        if offsets is not None:
             offsets = torch.as_tensor(offsets, device=edge_list.device)
-            _edge_list = edge_list.clone()
-            _edge_list[:, :2] -= offsets.unsqueeze(-1)
         if num_nodes is None:
+            if offsets is None:
+                _edge_list = edge_list
+            else:
+                _edge_list = edge_list.clone()
+                _edge_list[:, :2] -= offsets.unsqueeze(-1)
             num_nodes = []
             for num_edge, num_cum_edge in zip(num_edges, num_cum_edges):
                 num_nodes.append(self._maybe_num_node(_edge_list[num_cum_edge - num_edge: num_cum_edge]))
@@ -1233,9 +1537,9 @@ class PackedGraph(Graph):
         else:
             data_dict, meta_dict = self.data_mask(edge_index=edge_index)
 
-        return type(self)(edge_list[edge_index], edge_weight=self.edge_weight[edge_index], num_nodes=num_nodes,
-                          num_edges=num_edges, num_relation=self.num_relation, offsets=offsets[edge_index],
-                          meta_dict=meta_dict, **data_dict)
+        return type(self)._from_trusted(edge_list[edge_index], edge_weight=self.edge_weight[edge_index],
+                                        num_nodes=num_nodes, num_edges=num_edges, num_relation=self.num_relation,
+                                        offsets=offsets[edge_index], meta_dict=meta_dict, **data_dict)
 
     def edge_mask(self, index):
         """
@@ -1251,9 +1555,9 @@ class PackedGraph(Graph):
         data_dict, meta_dict = self.data_mask(edge_index=index)
         num_edges = self._get_num_xs(index, self.num_cum_edges)
 
-        return type(self)(self.edge_list[index], edge_weight=self.edge_weight[index], num_nodes=self.num_nodes,
-                          num_edges=num_edges, num_relation=self.num_relation, offsets=self._offsets[index],
-                          meta_dict=meta_dict, **data_dict)
+        return type(self)._from_trusted(self.edge_list[index], edge_weight=self.edge_weight[index],
+                                        num_nodes=self.num_nodes, num_edges=num_edges, num_relation=self.num_relation,
+                                        offsets=self._offsets[index], meta_dict=meta_dict, **data_dict)
 
     def graph_mask(self, index, compact=False):
         """
@@ -1307,11 +1611,14 @@ class PackedGraph(Graph):
 
         if compact:
             data_dict, meta_dict = self.data_mask(node_index, edge_index, index)
+            # compact ids are consistent by construction
+            constructor = type(self)._from_trusted
         else:
             data_dict, meta_dict = self.data_mask(edge_index=edge_index)
-        return type(self)(edge_list[edge_index], edge_weight=self.edge_weight[edge_index], num_nodes=num_nodes,
-                          num_edges=num_edges, num_relation=self.num_relation, offsets=offsets,
-                          meta_dict=meta_dict, **data_dict)
+            constructor = type(self)
+        return constructor(edge_list[edge_index], edge_weight=self.edge_weight[edge_index], num_nodes=num_nodes,
+                           num_edges=num_edges, num_relation=self.num_relation, offsets=offsets,
+                           meta_dict=meta_dict, **data_dict)
 
     def subbatch(self, index):
         """
@@ -1351,25 +1658,39 @@ class PackedGraph(Graph):
         index = torch.arange(self.num_edge, device=self.device).unsqueeze(-1).expand(-1, 2).flatten()
         data_dict, meta_dict = self.data_mask(edge_index=index)
 
-        return type(self)(edge_list, edge_weight=self.edge_weight[index], num_nodes=self.num_nodes,
-                          num_edges=self.num_edges * 2, num_relation=num_relation, offsets=offsets,
-                          meta_dict=meta_dict, **data_dict)
+        return type(self)._from_trusted(edge_list, edge_weight=self.edge_weight[index], num_nodes=self.num_nodes,
+                                        num_edges=self.num_edges * 2, num_relation=num_relation, offsets=offsets,
+                                        meta_dict=meta_dict, **data_dict)
 
     def detach(self):
         """
         Detach this packed graph.
         """
-        return type(self)(self.edge_list.detach(), edge_weight=self.edge_weight.detach(),
-                          num_nodes=self.num_nodes, num_edges=self.num_edges, num_relation=self.num_relation,
-                          offsets=self._offsets, meta_dict=self.meta_dict, **utils.detach(self.data_dict))
+        return type(self)._from_trusted(self.edge_list.detach(), edge_weight=self.edge_weight.detach(),
+                                        num_nodes=self.num_nodes, num_edges=self.num_edges,
+                                        num_relation=self.num_relation, offsets=self._offsets, meta_dict=self.meta_dict,
+                                        **utils.detach(self.data_dict))
 
     def clone(self):
         """
         Clone this packed graph.
         """
-        return type(self)(self.edge_list.clone(), edge_weight=self.edge_weight.clone(),
-                          num_nodes=self.num_nodes, num_edges=self.num_edges, num_relation=self.num_relation,
-                          offsets=self._offsets, meta_dict=self.meta_dict, **utils.clone(self.data_dict))
+        return type(self)._from_trusted(self.edge_list.clone(), edge_weight=self.edge_weight.clone(),
+                                        num_nodes=self.num_nodes, num_edges=self.num_edges,
+                                        num_relation=self.num_relation, offsets=self._offsets, meta_dict=self.meta_dict,
+                                        **utils.clone(self.data_dict))
+
+    def share_memory(self):
+        """
+        Return a copy of this packed graph in shared memory.
+
+        Distributed processes on the same node share a single copy of the graph.
+        See :func:`comm.share_memory <torchdrug.utils.comm.share_memory>` for details.
+        """
+        edge_list, edge_weight, offsets, data_dict = \
+            comm.share_memory((self.edge_list, self.edge_weight, self._offsets, self.data_dict))
+        return type(self)(edge_list, edge_weight=edge_weight, num_nodes=self.num_nodes, num_edges=self.num_edges,
+                          num_relation=self.num_relation, offsets=offsets, meta_dict=self.meta_dict, **data_dict)
 
     def cuda(self, *args, **kwargs):
         """
@@ -1460,6 +1781,236 @@ class PackedGraph(Graph):
 Graph.packed_type = PackedGraph
 
 
+class PackedGraphBuilder(object):
+    """
+    Mutable builder for a batch of graphs that grow incrementally, e.g. in autoregressive generation.
+
+    Each graph has preallocated slots for nodes and edges, and the capacity is doubled once exhausted.
+    Appending elements to the graphs only writes the new elements, which takes amortized :math:`O(1)` time
+    per element, instead of reallocating the whole batch like rebuilding a packed graph.
+
+    Edges appended after a snapshot of :attr:`num_edges` can be discarded by :meth:`truncate_edges`.
+    :attr:`num_nodes` and :attr:`num_edges` shouldn't be assigned directly.
+
+    :meth:`pack` copies all nodes and edges out of the slots, which takes :math:`O(|V| + |E|)` time.
+    The result can't be a view of the slots, since a packed graph stores the elements of each graph contiguously,
+    while the slots of each graph are padded to the capacity. This is no more than the cost of running a
+    graph neural network on the result, which autoregressive generation does after every step anyway.
+    The builder keeps the result of the last :meth:`pack`. Node or edge attributes that haven't changed
+    since then are reused as is, instead of being copied from the slots again.
+
+    Example::
+
+        >>> builder = data.PackedGraphBuilder(2, num_relation=4, graph_type=data.PackedMolecule)
+        >>> builder.append_nodes(values={"atom_type": torch.tensor([6, 8])})
+        >>> builder.append_nodes(torch.tensor([True, False]), {"atom_type": torch.tensor([6, 6])})
+        >>> builder.append_edges(torch.tensor([True, False]), torch.tensor([[0, 1, 0], [0, 0, 0]]),
+        >>>                      {"bond_type": torch.tensor([0, 0])})
+        >>> graph = builder.pack()
+        >>> assert (graph.num_nodes == torch.tensor([2, 1])).all()
+
+    Parameters:
+        batch_size (int): number of graphs
+        num_relation (int, optional): number of relations
+        node_capacity (int, optional): initial number of node slots for each graph
+        edge_capacity (int, optional): initial number of edge slots for each graph
+        graph_type (type, optional): type of the packed graph to build. By default, :class:`PackedGraph` is used.
+        device (torch.device, optional): device of the graphs
+    """
+
+    def __init__(self, batch_size, num_relation=None, node_capacity=8, edge_capacity=16, graph_type=None,
+                 device=None):
+        if graph_type is None:
+            graph_type = PackedGraph
+        num_element = 2 if num_relation is None else 3
+
+        self.batch_size = batch_size
+        self.num_relation = num_relation
+        self.graph_type = graph_type
+        self.node_capacity = node_capacity
+        self.edge_capacity = edge_capacity
+        self.num_nodes = torch.zeros(batch_size, dtype=torch.long, device=device)
+        self.num_edges = torch.zeros(batch_size, dtype=torch.long, device=device)
+        self.edge_list = torch.zeros(batch_size, edge_capacity, num_element, dtype=torch.long, device=device)
+        self.node_data = {}
+        self.edge_data = {}
+        self._packed = {}
+
+    @property
+    def device(self):
+        return self.num_nodes.device
+
+    def _standarize_mask(self, mask):
+        if mask is None:
+            return torch.ones(self.batch_size, dtype=torch.bool, device=self.device)
+        return torch.as_tensor(mask, dtype=torch.bool, device=self.device)
+
+    def _get_capacity(self, num_xs, capacity):
+        size = num_xs.max().item() if self.batch_size else 0
+        while capacity < size:
+            capacity = max(capacity * 2, 1)
+        return capacity
+
+    def _grow(self, buffer, capacity):
+        new_buffer = buffer.new_zeros(len(buffer), capacity, *buffer.shape[2:])
+        new_buffer[:, :buffer.shape[1]] = buffer
+        return new_buffer
+
+    def _write(self, buffer, num_xs, mask, value):
+        index = mask.nonzero().squeeze(-1)
+        buffer[index, num_xs[index]] = value[index].to(buffer.dtype)
+
+    def append_nodes(self, mask=None, values=None):
+        """
+        Append a node to each selected graph.
+
+        Parameters:
+            mask (BoolTensor, optional): graphs to append nodes to, of shape :math:`(B,)`.
+                By default, append nodes to all graphs.
+            values (dict of Tensor, optional): node attributes of the new nodes.
+                Each attribute has shape :math:`(B, ...)`, where values of unselected graphs are ignored.
+        """
+        mask = self._standarize_mask(mask)
+        self._packed.pop("node", None)
+        num_nodes = self.num_nodes + mask
+        capacity = self._get_capacity(num_nodes, self.node_capacity)
+        if capacity > self.node_capacity:
+            for k, v in self.node_data.items():
+                self.node_data[k] = self._grow(v, capacity)
+            self.node_capacity = capacity
+
+        if values:
+            for k, v in values.items():
+                if k not in self.node_data:
+                    self.node_data[k] = torch.zeros(self.batch_size, self.node_capacity, *v.shape[1:],
+                                                    dtype=v.dtype, device=self.device)
+                self._write(self.node_data[k], self.num_nodes, mask, v)
+        self.num_nodes = num_nodes
+
+    def append_edges(self, mask, edges, values=None):
+        """
+        Append an edge to each selected graph.
+
+        Parameters:
+            mask (BoolTensor): graphs to append edges to, of shape :math:`(B,)`. ``None`` means all graphs.
+            edges (LongTensor): new edges of shape :math:`(B, 2)` or :math:`(B, 3)`.
+                Node ids are relative, i.e., the index in each graph.
+            values (dict of Tensor, optional): edge attributes of the new edges.
+                Each attribute has shape :math:`(B, ...)`, where values of unselected graphs are ignored.
+        """
+        mask = self._standarize_mask(mask)
+        self._packed.pop("edge", None)
+        num_edges = self.num_edges + mask
+        capacity = self._get_capacity(num_edges, self.edge_capacity)
+        if capacity > self.edge_capacity:
+            self.edge_list = self._grow(self.edge_list, capacity)
+            for k, v in self.edge_data.items():
+                self.edge_data[k] = self._grow(v, capacity)
+            self.edge_capacity = capacity
+
+        self._write(self.edge_list, self.num_edges, mask, edges)
+        if values:
+            for k, v in values.items():
+                if k not in self.edge_data:
+                    self.edge_data[k] = torch.zeros(self.batch_size, self.edge_capacity, *v.shape[1:],
+                                                    dtype=v.dtype, device=self.device)
+                self._write(self.edge_data[k], self.num_edges, mask, v)
+        self.num_edges = num_edges
+
+    def truncate_edges(self, num_edges):
+        """
+        Discard the edges appended after a snapshot of :attr:`num_edges`.
+
+        Parameters:
+            num_edges (LongTensor): number of edges to keep in each graph, of shape :math:`(B,)`
+        """
+        num_edges = torch.as_tensor(num_edges, dtype=torch.long, device=self.device)
+        if num_edges.shape != self.num_edges.shape:
+            raise ValueError("Expect `num_edges` to have shape %s, but found %s"
+                             % (tuple(self.num_edges.shape), tuple(num_edges.shape)))
+        if ((num_edges < 0) | (num_edges > self.num_edges)).any():
+            raise ValueError("Can't truncate edges to a negative number or more than the current number of edges")
+        self.num_edges = num_edges
+
+    def _pack(self, key, num_xs, buffers):
+        # the packed result stays valid until any element is written or the count is changed
+        if key in self._packed:
+            last_num_xs, graph_index, packed = self._packed[key]
+            if torch.equal(last_num_xs, num_xs):
+                return graph_index, packed
+
+        graph_index = torch.repeat_interleave(num_xs)
+        rank = torch.arange(len(graph_index), device=self.device) - (num_xs.cumsum(0) - num_xs)[graph_index]
+        packed = {}
+        for k, v in buffers.items():
+            index = graph_index * v.shape[1] + rank
+            packed[k] = v.flatten(0, 1).index_select(0, index)
+        self._packed[key] = (num_xs, graph_index, packed)
+        return graph_index, packed
+
+    def _offset_edges(self, edge2graph, edge_list):
+        # the packed edge list only changes with the packed edges or the node counts
+        if "offset" in self._packed:
+            last_num_nodes, last_edge_list, result = self._packed["offset"]
+            if last_edge_list is edge_list and torch.equal(last_num_nodes, self.num_nodes):
+                return result
+
+        offsets = (self.num_nodes.cumsum(0) - self.num_nodes)[edge2graph]
+        packed_edge_list = edge_list.clone()
+        packed_edge_list[:, :2] += offsets.unsqueeze(-1)
+        self._packed["offset"] = (self.num_nodes, edge_list, (packed_edge_list, offsets))
+        return packed_edge_list, offsets
+
+    def pack(self):
+        """
+        Return a packed graph of the current state.
+
+        The nodes and edges are copied out of the slots of the builder, so the result doesn't share storage
+        with the builder, and is not affected by further appends or truncations.
+        Attributes and edges that haven't changed since the last call share storage with the last result,
+        so they shouldn't be modified in place.
+
+        Returns:
+            PackedGraph
+        """
+        _, node_data = self._pack("node", self.num_nodes, self.node_data)
+        edge2graph, edge_data = self._pack("edge", self.num_edges, dict(self.edge_data, edge_list=self.edge_list))
+        data_dict = dict(node_data, **edge_data)
+        edge_list, offsets = self._offset_edges(edge2graph, data_dict.pop("edge_list"))
+        meta_dict = {}
+        for k in node_data:
+            meta_dict[k] = "node"
+        for k in self.edge_data:
+            meta_dict[k] = "edge"
+
+        return self.graph_type._from_trusted(edge_list, num_nodes=self.num_nodes, num_edges=self.num_edges,
+                                             num_relation=self.num_relation, offsets=offsets,
+                                             meta_dict=meta_dict, **data_dict)
+
+    def __len__(self):
+        return self.batch_size
+
+    def __repr__(self):
+        fields = ["batch_size=%d" % self.batch_size,
+                  "num_nodes=%s" % pretty.long_array(self.num_nodes.tolist()),
+                  "num_edges=%s" % pretty.long_array(self.num_edges.tolist())]
+        if self.num_relation is not None:
+            fields.append("num_relation=%d" % self.num_relation)
+        return "%s(%s)" % (self.__class__.__name__, ", ".join(fields))
+
+
+def _shared_cat(tensors):
+    out = None
+    elem = tensors[0]
+    if torch.utils.data.get_worker_info() is not None and elem.ndim > 0 \
+            and all(tensor.dtype == elem.dtype for tensor in tensors):
+        numel = sum([tensor.numel() for tensor in tensors])
+        if numel > 0:
+            storage = elem.storage()._new_shared(numel)
+            out = elem.new(storage).view(-1, *elem.shape[1:])
+    return torch.cat(tensors, out=out)
+
+
 def cat(graphs):
     for i, graph in enumerate(graphs):
         if not isinstance(graph, PackedGraph):
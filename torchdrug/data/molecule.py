@@ -8,13 +8,32 @@ import torch
 from torch_scatter import scatter_add, scatter_min, scatter_max
 
 from torchdrug import utils
-from torchdrug.data import constant, Graph, PackedGraph
+from torchdrug.data import constant, feature, Graph, PackedGraph
 from torchdrug.core import Registry as R
 from torchdrug.data.rdkit import draw
 
 plt.switch_backend("agg")
 
 
+def _extract_features(objs, funcs, features):
+    # memoized features are collected as row indices, and gathered in one pass by _stack_features
+    for func, feature_list in zip(funcs, features):
+        if isinstance(func, feature.FeatureTable):
+            feature_list += [func.lookup(obj) for obj in objs]
+        else:
+            feature_list += [func(obj) for obj in objs]
+
+
+def _stack_features(funcs, features):
+    tensors = []
+    for func, feature_list in zip(funcs, features):
+        if isinstance(func, feature.FeatureTable):
+            tensors.append(func.gather(feature_list))
+        else:
+            tensors.append(torch.tensor(feature_list))
+    return torch.cat(tensors, dim=-1)
+
+
 class Molecule(Graph):
     """
     Molecule graph with chemical features.
@@ -71,6 +90,20 @@ class Molecule(Graph):
             self.bond_stereo = bond_stereo
             self.stereo_atoms = stereo_atoms
 
+    def _trusted_init(self, edge_list, edge_weight=None, num_node=None, num_relation=None, meta_dict=None,
+                      **data_dict):
+        super(Molecule, self)._trusted_init(edge_list, edge_weight, num_node, num_relation, meta_dict, **data_dict)
+        # missing attributes default to zero as in __init__()
+        for key in ["atom_type", "formal_charge", "explicit_hs", "chiral_tag", "radical_electrons", "atom_map"]:
+            self.meta_dict[key] = "node"
+            if key not in data_dict:
+                self._setattr(key, torch.zeros(self.num_node.tolist(), dtype=torch.long, device=self.device))
+        for key in ["bond_type", "bond_stereo", "stereo_atoms"]:
+            self.meta_dict[key] = "edge"
+            if key not in data_dict:
+                size = (len(self.edge_list), 2) if key == "stereo_atoms" else len(self.edge_list)
+                self._setattr(key, torch.zeros(size, dtype=torch.long, device=self.device))
+
     def _standarize_atom_bond(self, atom_type, bond_type):
         if atom_type is None:
             raise ValueError("`atom_type` should be provided")
@@ -162,6 +195,8 @@ class Molecule(Graph):
         node_feature = cls._standarize_option(node_feature)
         edge_feature = cls._standarize_option(edge_feature)
         graph_feature = cls._standarize_option(graph_feature)
+        node_funcs = [R.get("features.atom.%s" % name) for name in node_feature]
+        edge_funcs = [R.get("features.bond.%s" % name) for name in edge_feature]
 
         atom_type = []
         formal_charge = []
@@ -169,7 +204,7 @@ class Molecule(Graph):
         chiral_tag = []
         radical_electrons = []
         atom_map = []
-        _node_feature = []
+        _node_feature = [[] for _ in node_funcs]
         atoms = [mol.GetAtomWithIdx(i) for i in range(mol.GetNumAtoms())] + [cls.dummy_atom]
         for atom in atoms:
             atom_type.append(atom.GetAtomicNum())
@@ -178,11 +213,7 @@ class Molecule(Graph):
             chiral_tag.append(atom.GetChiralTag())
             radical_electrons.append(atom.GetNumRadicalElectrons())
             atom_map.append(atom.GetAtomMapNum())
-            feature = []
-            for name in node_feature:
-                func = R.get("features.atom.%s" % name)
-                feature += func(atom)
-            _node_feature.append(feature)
+        _extract_features(atoms, node_funcs, _node_feature)
         atom_type = torch.tensor(atom_type)[:-1]
         atom_map = torch.tensor(atom_map)[:-1]
         formal_charge = torch.tensor(formal_charge)[:-1]
@@ -190,7 +221,7 @@ class Molecule(Graph):
         chiral_tag = torch.tensor(chiral_tag)[:-1]
         radical_electrons = torch.tensor(radical_electrons)[:-1]
         if len(node_feature) > 0:
-            _node_feature = torch.tensor(_node_feature)[:-1]
+            _node_feature = _stack_features(node_funcs, _node_feature)[:-1]
         else:
             _node_feature = None
 
@@ -198,7 +229,8 @@ class Molecule(Graph):
         bond_type = []
         bond_stereo = []
         stereo_atoms = []
-        _edge_feature = []
+        _edge_feature = [[] for _ in edge_funcs]
+        _bonds = []
         bonds = [mol.GetBondWithIdx(i) for i in range(mol.GetNumBonds())] + [cls.dummy_bond]
         for bond in bonds:
             type = str(bond.GetBondType())
@@ -218,17 +250,14 @@ class Molecule(Graph):
             bond_type += [type, type]
             bond_stereo += [stereo, stereo]
             stereo_atoms += [_atoms, _atoms]
-            feature = []
-            for name in edge_feature:
-                func = R.get("features.bond.%s" % name)
-                feature += func(bond)
-            _edge_feature += [feature, feature]
+            _bonds += [bond, bond]
+        _extract_features(_bonds, edge_funcs, _edge_feature)
         edge_list = edge_list[:-2]
         bond_type = torch.tensor(bond_type)[:-2]
         bond_stereo = torch.tensor(bond_stereo)[:-2]
         stereo_atoms = torch.tensor(stereo_atoms)[:-2]
         if len(edge_feature) > 0:
-            _edge_feature = torch.tensor(_edge_feature)[:-2]
+            _edge_feature = _stack_features(edge_funcs, _edge_feature)[:-2]
         else:
             _edge_feature = None
 
@@ -590,6 +619,9 @@ class PackedMolecule(PackedGraph, Molecule):
         node_feature = cls._standarize_option(node_feature)
         edge_feature = cls._standarize_option(edge_feature)
         graph_feature = cls._standarize_option(graph_feature)
+        node_funcs = [R.get("features.atom.%s" % name) for name in node_feature]
+        edge_funcs = [R.get("features.bond.%s" % name) for name in edge_feature]
+        graph_funcs = [R.get("features.molecule.%s" % name) for name in graph_feature]
 
         atom_type = []
         formal_charge = []
@@ -603,8 +635,8 @@ class PackedMolecule(PackedGraph, Molecule):
         bond_stereo = []
         stereo_atoms = []
 
-        _node_feature = []
-        _edge_feature = []
+        _node_feature = [[] for _ in node_funcs]
+        _edge_feature = [[] for _ in edge_funcs]
         _graph_feature = []
         num_nodes = []
         num_edges = []
@@ -619,19 +651,17 @@ class PackedMolecule(PackedGraph, Molecule):
             if kekulize:
                 Chem.Kekulize(mol)
 
-            for atom in mol.GetAtoms():
+            atoms = list(mol.GetAtoms())
+            for atom in atoms:
                 atom_type.append(atom.GetAtomicNum())
                 formal_charge.append(atom.GetFormalCharge())
                 explicit_hs.append(atom.GetNumExplicitHs())
                 chiral_tag.append(atom.GetChiralTag())
                 radical_electrons.append(atom.GetNumRadicalElectrons())
                 atom_map.append(atom.GetAtomMapNum())
-                feature = []
-                for name in node_feature:
-                    func = R.get("features.atom.%s" % name)
-                    feature += func(atom)
-                _node_feature.append(feature)
+            _extract_features(atoms, node_funcs, _node_feature)
 
+            bonds = []
             for bond in mol.GetBonds():
                 type = str(bond.GetBondType())
                 stereo = bond.GetStereo()
@@ -643,10 +673,6 @@ class PackedMolecule(PackedGraph, Molecule):
                     continue
                 type = cls.bond2id[type]
                 h, t = bond.GetBeginAtomIdx(), bond.GetEndAtomIdx()
-                feature = []
-                for name in edge_feature:
-                    func = R.get("features.bond.%s" % name)
-                    feature += func(bond)
                 edge_list += [[h, t, type], [t, h, type]]
                 # always explicitly store aromatic bonds
                 if bond.GetIsAromatic():
@@ -654,10 +680,10 @@ class PackedMolecule(PackedGraph, Molecule):
                 bond_type += [type, type]
                 bond_stereo += [stereo, stereo]
                 stereo_atoms += [_atoms, _atoms]
-                _edge_feature += [feature, feature]
+                bonds += [bond, bond]
+            _extract_features(bonds, edge_funcs, _edge_feature)
 
-            for name in graph_feature:
-                func = R.get("features.molecule.%s" % name)
+            for func in graph_funcs:
                 _graph_feature += func(mol)
 
             num_nodes.append(mol.GetNumAtoms())
@@ -670,7 +696,7 @@ class PackedMolecule(PackedGraph, Molecule):
         chiral_tag = torch.tensor(chiral_tag)[:-2]
         radical_electrons = torch.tensor(radical_electrons)[:-2]
         if len(node_feature) > 0:
-            _node_feature = torch.tensor(_node_feature)[:-2]
+            _node_feature = _stack_features(node_funcs, _node_feature)[:-2]
         else:
             _node_feature = None
 
@@ -681,7 +707,7 @@ class PackedMolecule(PackedGraph, Molecule):
         bond_stereo = torch.tensor(bond_stereo)[:-2]
         stereo_atoms = torch.tensor(stereo_atoms)[:-2]
         if len(edge_feature) > 0:
-            _edge_feature = torch.tensor(_edge_feature)[:-2]
+            _edge_feature = _stack_features(edge_funcs, _edge_feature)[:-2]
         else:
             _edge_feature = None
         if len(graph_feature) > 0:
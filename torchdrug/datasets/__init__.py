@@ -18,7 +18,7 @@ from .toxcast import ToxCast
 from .uspto50k import USPTO50k
 from .zinc250k import ZINC250k
 from .zinc2m import ZINC2m
-from .pubchem110m import PubChem110m
+from .pubchem110m import PubChem110m, PubChem110mStream
 
 from .chembl_filtered import ChEMBLFiltered
 
@@ -34,7 +34,7 @@ __all__ = [
     "BACE", "BBBP", "CEP", "ChEMBLFiltered", "ClinTox", "Delaney", "FreeSolv", "HIV", "Lipophilicity",
     "Malaria", "MOSES", "MUV", "OPV", "QM8", "QM9", "SIDER", "Tox21", "ToxCast",
     "USPTO50k", "ZINC250k",
-    "ZINC2m", "PubChem110m",
+    "ZINC2m", "PubChem110m", "PubChem110mStream",
     "FB15k", "FB15k237", "WN18", "WN18RR", "Hetionet",
     "Cora", "CiteSeer",
 ]
@@ -17,12 +17,14 @@ class CiteSeer(data.NodeClassificationDataset):
     Parameters:
         path (str): path to store the dataset
         verbose (int, optional): output verbose level
+        cache (bool, optional): store the parsed dataset in a ``cache`` directory under ``path``,
+            and reuse it if the files are unchanged
     """
 
     url = "https://linqs-data.soe.ucsc.edu/public/lbc/citeseer.tgz"
     md5 = "c8ded8ed395b31899576bfd1e91e4d6e"
 
-    def __init__(self, path, verbose=1):
+    def __init__(self, path, verbose=1, cache=False):
         path = os.path.expanduser(path)
         if not os.path.exists(path):
             os.makedirs(path)
@@ -36,4 +38,4 @@ class CiteSeer(data.NodeClassificationDataset):
         node_file = utils.extract(zip_file, "citeseer/citeseer.content")
         edge_file = utils.extract(zip_file, "citeseer/citeseer.cites")
 
-        self.load_tsv(node_file, edge_file, verbose=verbose)
\ No newline at end of file
+        self.load_tsv(node_file, edge_file, verbose=verbose, cache=cache)
\ No newline at end of file
@@ -45,4 +45,27 @@ class PubChem110m(data.MoleculeDataset):
                 smiles_list.append(smiles)
 
         targets = {}
-        self.load_smiles(smiles_list, targets, lazy=True, verbose=verbose, **kwargs)
\ No newline at end of file
+        self.load_smiles(smiles_list, targets, lazy=True, verbose=verbose, **kwargs)
+
+
+@R.register("datasets.PubChem110mStream")
+@doc.copy_args(data.MoleculeStream.load_file,
+               ignore=("file_name", "smiles_field", "target_fields", "delimiter", "header"))
+class PubChem110mStream(data.MoleculeStream):
+    """
+    PubChem, streamed from the SMILES file instead of loaded into memory.
+    This dataset doesn't contain any label information.
+
+    See :class:`PubChem110m` for the file layout.
+
+    Parameters:
+        path (str):
+        **kwargs
+    """
+
+    def __init__(self, path, **kwargs):
+        path = os.path.expanduser(path)
+        self.path = path
+
+        smiles_file = os.path.join(path, "CID-SMILES")
+        self.load_file(smiles_file, smiles_field=1, target_fields=[], delimiter="\t", header=False, **kwargs)
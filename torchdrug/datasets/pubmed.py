@@ -1,13 +1,18 @@
 import os
 import re
-import csv
+import logging
 
-from tqdm import tqdm
+import numpy as np
+
+import torch
 
 from torchdrug import data, utils
 from torchdrug.core import Registry as R
 
 
+logger = logging.getLogger(__name__)
+
+
 @R.register("datasets.PubMed")
 class PubMed(data.NodeClassificationDataset):
     """
@@ -21,12 +26,14 @@ class PubMed(data.NodeClassificationDataset):
     Parameters:
         path (str): path to store the dataset
         verbose (int, optional): output verbose level
+        cache (bool, optional): store the parsed dataset in a ``cache`` directory under ``path``,
+            and reuse it if the files are unchanged
     """
 
     url = "https://linqs-data.soe.ucsc.edu/public/Pubmed-Diabetes.tgz"
     md5 = "9fa24b917990c47e264a94079b9599fe"
 
-    def __init__(self, path, verbose=1):
+    def __init__(self, path, verbose=1, cache=False):
         path = os.path.expanduser(path)
         if not os.path.exists(path):
             os.makedirs(path)
@@ -40,60 +47,59 @@ class PubMed(data.NodeClassificationDataset):
         node_file = utils.extract(zip_file, "Pubmed-Diabetes/data/Pubmed-Diabetes.NODE.paper.tab")
         edge_file = utils.extract(zip_file, "Pubmed-Diabetes/data/Pubmed-Diabetes.DIRECTED.cites.tab")
 
-        inv_node_vocab = {}
-        node_feature = []
-        node_label = []
-
+        result = None
+        if cache:
+            prefix = self._get_cache_prefix(node_file, edge_file)
+            result = self._load_cache(prefix, verbose)
+        if result is None:
+            result = self._read_files(node_file, edge_file, verbose)
+            if cache:
+                self._save_cache(prefix, *result)
+        edge_list, node_feature, node_label, node_vocab, label_vocab = result
+        self.load_edge(edge_list, node_feature, node_label, node_vocab=node_vocab, label_vocab=label_vocab)
+
+    def _read_files(self, node_file, edge_file, verbose):
+        # each file is parsed by a few regular expressions over its whole content, instead of one per token
         with open(node_file, "r") as fin:
-            reader = csv.reader(fin, delimiter="\t")
             if verbose:
-                reader = iter(tqdm(reader, "Loading %s" % node_file, utils.get_line_count(node_file)))
-            _ = next(reader)
-            fields = next(reader)
-            group, = re.match(r"cat=(\S+):label", fields[0]).groups()
-            label_tokens = group.split(",")
-            inv_label_vocab = {token: i for i, token in enumerate(label_tokens)}
-            inv_feature_vocab = {}
-            for field in fields[1:]:
-                match = re.match(r"numeric:(\S+):0\.0", field)
-                if not match:
-                    continue
-                feature_token, = match.groups()
-                inv_feature_vocab[feature_token] = len(inv_feature_vocab)
-
-            for tokens in reader:
-                node_token = tokens[0]
-                label_token, = re.match(r"label=(\S+)", tokens[1]).groups()
-                feature = [0] * len(inv_feature_vocab)
-                inv_node_vocab[node_token] = len(inv_node_vocab)
-                for token in tokens[2:]:
-                    match = re.match(r"(\S+)=([0-9.]+)", token)
-                    if not match:
-                        continue
-                    feature_token, value = match.groups()
-                    feature[inv_feature_vocab[feature_token]] = utils.literal_eval(value)
-                label = inv_label_vocab[label_token]
-                node_feature.append(feature)
-                node_label.append(label)
-
-        edge_list = []
+                logger.info("Loading %s" % node_file)
+            _ = fin.readline()
+            fields = fin.readline().rstrip("\n").split("\t")
+            content = fin.read()
+        if not content.endswith("\n"):
+            content += "\n"
+
+        group, = re.match(r"cat=(\S+):label", fields[0]).groups()
+        label_tokens = group.split(",")
+        inv_label_vocab = {token: i for i, token in enumerate(label_tokens)}
+        feature_tokens = re.findall(r"numeric:(\S+):0\.0", "\t".join(fields[1:]))
+        inv_feature_vocab = {token: i for i, token in enumerate(feature_tokens)}
+
+        nodes = re.findall(r"^([^\t\n]*)\tlabel=(\S+)", content, re.MULTILINE)
+        node_tokens, node_label = zip(*nodes) if nodes else ((), ())
+        inv_node_vocab = {token: i for i, token in enumerate(node_tokens)}
+        node_label = torch.tensor([inv_label_vocab[token] for token in node_label], dtype=torch.long)
+
+        # line breaks are matched as empty features, and count the node of each feature
+        features = re.findall(r"\t(?!label=)([^\t\n=]+)=([0-9.]+)(?=[\t\n])|\n", content)
+        feature_tokens, feature_value = zip(*features) if features else ((), ())
+        is_feature = np.array(feature_value, dtype=str) != ""
+        node_index = np.cumsum(~is_feature)[is_feature]
+        feature_index = [inv_feature_vocab[token] for token in np.array(feature_tokens, dtype=str)[is_feature]]
+        feature_value = np.array(feature_value, dtype=str)[is_feature].astype(np.float32)
+        node_feature = torch.zeros(len(inv_node_vocab), len(inv_feature_vocab))
+        node_feature[torch.from_numpy(node_index), torch.tensor(feature_index, dtype=torch.long)] = \
+            torch.from_numpy(feature_value)
 
         with open(edge_file, "r") as fin:
-            reader = csv.reader(fin, delimiter="\t")
             if verbose:
-                reader = iter(tqdm(reader, "Loading %s" % edge_file, utils.get_line_count(edge_file)))
-            _ = next(reader)
-            _ = next(reader)
-            for tokens in reader:
-                h_token, = re.match(r"paper:(\S+)", tokens[1]).groups()
-                t_token, = re.match(r"paper:(\S+)", tokens[3]).groups()
-                if h_token not in inv_node_vocab:
-                    inv_node_vocab[h_token] = len(inv_node_vocab)
-                h = inv_node_vocab[h_token]
-                if t_token not in inv_node_vocab:
-                    inv_node_vocab[t_token] = len(inv_node_vocab)
-                t = inv_node_vocab[t_token]
-                edge_list.append((h, t))
-
-        self.load_edge(edge_list, node_feature, node_label, inv_node_vocab=inv_node_vocab,
-                       inv_label_vocab=inv_label_vocab)
\ No newline at end of file
+                logger.info("Loading %s" % edge_file)
+            content = fin.read()
+        edge_tokens = re.findall(r"^[^\t\n]*\tpaper:(\S+)\t\|\tpaper:(\S+)", content, re.MULTILINE)
+        edge_tokens = [token for tokens in edge_tokens for token in tokens]
+        for token in edge_tokens:
+            if token not in inv_node_vocab:
+                inv_node_vocab[token] = len(inv_node_vocab)
+        edge_list = torch.tensor([inv_node_vocab[token] for token in edge_tokens], dtype=torch.long).view(-1, 2)
+
+        return edge_list, node_feature, node_label, list(inv_node_vocab), label_tokens
@@ -74,6 +74,7 @@ class USPTO50k(data.ReactionDataset):
 
         data = self.data
         targets = self.targets
+        smiles_list = self.smiles_list
         self.data = []
         self.targets = defaultdict(list)
         indexes = range(len(data))
@@ -93,6 +94,8 @@ class USPTO50k(data.ReactionDataset):
                 new_k = self.target_alias.get(k, k)
                 self.targets[new_k] += [targets[k][i] - 1] * len(reactants)
             self.targets["sample id"] += [i] * len(reactants)
+        # keep SMILES strings aligned with the samples, e.g. for the checksum of cached splits
+        self.smiles_list = smiles_list.take(self.targets["sample id"])
 
         self.valid_rate = 1 - invalid / len(data)
 
@@ -106,11 +109,16 @@ class USPTO50k(data.ReactionDataset):
         edge_added = []
         edge_modified = []
         mask = product.edge_list[:, 0] < product.edge_list[:, 1]
-        for h, t, r in product.edge_list[mask]:
-            if (prod2react[h], prod2react[t]) not in reactant:
-                edge_added.append((h, t))
-            elif (prod2react[h], prod2react[t], r) not in reactant:
-                edge_modified.append((h, t))
+        edge_list = product.edge_list[mask]
+        node_in, node_out, relation = edge_list.t()
+        node_in, node_out = prod2react[node_in], prod2react[node_out]
+        any_relation = -torch.ones_like(relation)
+        has_edge = reactant.match(torch.stack([node_in, node_out, any_relation], dim=-1))[1] > 0
+        has_relation = reactant.match(torch.stack([node_in, node_out, relation], dim=-1))[1] > 0
+        for h, t, r in edge_list[~has_edge]:
+            edge_added.append((h, t))
+        for h, t, r in edge_list[has_edge & ~has_relation]:
+            edge_modified.append((h, t))
 
         return edge_added, edge_modified, prod2react
 
@@ -4,7 +4,7 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 from torch.utils import checkpoint
-from torch_scatter import scatter_mean, scatter_add, scatter_max
+from torch_scatter import scatter_mean, scatter_add, scatter_max, segment_csr
 
 from torchdrug import data, layers, utils
 from torchdrug.layers import functional
@@ -153,15 +153,14 @@ class GraphConv(MessagePassingBase):
 
     def message_and_aggregate(self, graph, input):
         node_in, node_out = graph.edge_list.t()[:2]
-        node_in = torch.cat([node_in, torch.arange(graph.num_node, device=graph.device)])
-        node_out = torch.cat([node_out, torch.arange(graph.num_node, device=graph.device)])
-        edge_weight = torch.cat([graph.edge_weight, torch.ones(graph.num_node, device=graph.device)])
+        # build the cached indexes first, so that degrees are summed over them
+        csc, csr = graph.csc, graph.csr
         degree_in = graph.degree_in + 1
         degree_out = graph.degree_out + 1
-        edge_weight = edge_weight / (degree_in[node_in] * degree_out[node_out]).sqrt()
-        adjacency = utils.sparse_coo_tensor(torch.stack([node_in, node_out]), edge_weight,
-                                            (graph.num_node, graph.num_node))
-        update = torch.sparse.mm(adjacency.t(), input)
+        edge_weight = graph.edge_weight / (degree_in[node_in] * degree_out[node_out]).sqrt()
+        update = functional.csr_spmm(csc, csr, edge_weight, input)
+        # add self loop
+        update = update + input / (degree_in * degree_out).sqrt().unsqueeze(-1)
         if self.edge_linear:
             edge_input = graph.edge_feature.float()
             if self.edge_linear.in_features > self.edge_linear.out_features:
@@ -337,9 +336,7 @@ class GraphIsomorphismConv(MessagePassingBase):
         return update
 
     def message_and_aggregate(self, graph, input):
-        adjacency = utils.sparse_coo_tensor(graph.edge_list.t()[:2], graph.edge_weight,
-                                            (graph.num_node, graph.num_node))
-        update = torch.sparse.mm(adjacency.t(), input)
+        update = functional.csr_spmm(graph.csc, graph.csr, graph.edge_weight, input)
         if self.edge_linear:
             edge_input = graph.edge_feature.float()
             edge_weight = graph.edge_weight.unsqueeze(-1)
@@ -423,11 +420,10 @@ class RelationalGraphConv(MessagePassingBase):
 
         node_in, node_out, relation = graph.edge_list.t()
         node_out = node_out * self.num_relation + relation
-        degree_out = scatter_add(graph.edge_weight, node_out, dim_size=graph.num_node * graph.num_relation)
+        csc, csr = graph.relational_csc, graph.relational_csr
+        degree_out = segment_csr(graph.edge_weight[csc[2]], csc[0])
         edge_weight = graph.edge_weight / degree_out[node_out]
-        adjacency = utils.sparse_coo_tensor(torch.stack([node_in, node_out]), edge_weight,
-                                            (graph.num_node, graph.num_node * graph.num_relation))
-        update = torch.sparse.mm(adjacency.t(), input)
+        update = functional.csr_spmm(csc, csr, edge_weight, input)
         if self.edge_linear:
             edge_input = graph.edge_feature.float()
             if self.edge_linear.in_features > self.edge_linear.out_features:
@@ -502,9 +498,7 @@ class NeuralFingerprintConv(MessagePassingBase):
         return update
 
     def message_and_aggregate(self, graph, input):
-        adjacency = utils.sparse_coo_tensor(graph.edge_list.t()[:2], graph.edge_weight,
-                                            (graph.num_node, graph.num_node))
-        update = torch.sparse.mm(adjacency.t(), input)
+        update = functional.csr_spmm(graph.csc, graph.csr, graph.edge_weight, input)
         if self.edge_linear:
             edge_input = graph.edge_feature.float()
             edge_weight = graph.edge_weight.unsqueeze(-1)
@@ -596,8 +590,7 @@ class ContinuousFilterConv(MessagePassingBase):
         node_in, node_out = graph.edge_list.t()[:2]
         position = graph.node_position
         edge_weight = graph.edge_weight * self.rbf_layer(self.rbf(position[node_in], position[node_out]))
-        adjacency = utils.sparse_coo_tensor(graph.edge_list.t()[:2], edge_weight, (graph.num_node, graph.num_node))
-        update = torch.sparse.mm(adjacency.t(), self.input_layer(input))
+        update = functional.csr_spmm(graph.csc, graph.csr, edge_weight, self.input_layer(input))
         if self.edge_linear:
             edge_input = graph.edge_feature.float()
             if self.edge_linear.in_features > self.edge_linear.out_features:
@@ -742,9 +735,9 @@ class ChebyshevConv(MessagePassingBase):
 
     def message_and_aggregate(self, graph, input):
         node_in, node_out = graph.edge_list.t()[:2]
+        csc, csr = graph.csc, graph.csr
         edge_weight = -graph.edge_weight / (graph.degree_in[node_in] * graph.degree_out[node_out]).sqrt()
-        adjacency = utils.sparse_coo_tensor(graph.edge_list.t()[:2], edge_weight, (graph.num_node, graph.num_node))
-        update = torch.sparse.mm(adjacency.t(), input)
+        update = functional.csr_spmm(csc, csr, edge_weight, input)
         if self.edge_linear:
             edge_input = graph.edge_feature.float()
             if self.edge_linear.in_features > self.edge_linear.out_features:
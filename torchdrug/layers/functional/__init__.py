@@ -3,7 +3,7 @@ from .functional import multinomial, masked_mean, mean_with_nan, shifted_softplu
     variadic_cross_entropy, variadic_sort, variadic_topk, variadic_arange, one_hot, \
     clipped_policy_gradient_objective, policy_gradient_objective
 from .embedding import transe_score, distmult_score, complex_score, simple_score, rotate_score
-from .spmm import generalized_spmm, generalized_rspmm
+from .spmm import generalized_spmm, generalized_rspmm, csr_spmm, csr_rspmm
 
 __all__ = [
     "multinomial", "masked_mean", "mean_with_nan", "shifted_softplus", "multi_slice_mask", "as_mask",
@@ -11,5 +11,5 @@ __all__ = [
     "variadic_cross_entropy", "variadic_sort", "variadic_topk", "variadic_arange", "one_hot",
     "clipped_policy_gradient_objective", "policy_gradient_objective",
     "transe_score", "distmult_score", "complex_score", "simple_score", "rotate_score",
-    "generalized_spmm", "generalized_rspmm",
+    "generalized_spmm", "generalized_rspmm", "csr_spmm", "csr_rspmm",
 ]
\ No newline at end of file
@@ -1,10 +1,9 @@
-#include <mutex>
-
 #define AT_PARALLEL_OPENMP true
 #include <ATen/Parallel.h>
 
 #include "operator.cuh"
 #include "rspmm.h"
+#include "util.h"
 
 namespace at {
 
@@ -39,6 +38,45 @@ void rspmm_backward_check(CheckedFrom c, const TensorArg &sparse_arg, const Tens
     checkSize(c, output_arg, {sparse_arg->size(0), input_arg->size(1)});
 }
 
+void csr_rspmm_forward_check(CheckedFrom c, const TensorArg &row_ptr_arg, const TensorArg &col_ind_arg,
+                             const TensorArg &order_arg, const TensorArg &layer_ind_arg, const TensorArg &value_arg,
+                             const TensorArg &relation_arg, const TensorArg &input_arg) {
+    checkDim(c, row_ptr_arg, 1);
+    checkDim(c, col_ind_arg, 1);
+    checkDim(c, order_arg, 1);
+    checkDim(c, layer_ind_arg, 1);
+    checkDim(c, value_arg, 1);
+    checkDim(c, relation_arg, 2);
+    checkDim(c, input_arg, 2);
+    checkScalarType(c, row_ptr_arg, kLong);
+    checkSameType(c, col_ind_arg, row_ptr_arg);
+    checkSameType(c, order_arg, row_ptr_arg);
+    checkSameType(c, layer_ind_arg, row_ptr_arg);
+    checkSameSize(c, col_ind_arg, order_arg);
+    checkSameSize(c, layer_ind_arg, value_arg);
+    checkScalarType(c, input_arg, value_arg->scalar_type());
+    checkSameType(c, relation_arg, input_arg);
+    checkSize(c, relation_arg, 1, input_arg->size(1));
+}
+
+void csr_rspmm_backward_check(CheckedFrom c, const TensorArg &row_ptr_arg, const TensorArg &col_ind_arg,
+                              const TensorArg &order_arg, const TensorArg &col_ptr_arg, const TensorArg &row_ind_t_arg,
+                              const TensorArg &order_t_arg, const TensorArg &layer_ind_arg, const TensorArg &value_arg,
+                              const TensorArg &relation_arg, const TensorArg &input_arg, const TensorArg &output_arg,
+                              const TensorArg &output_grad_arg) {
+    csr_rspmm_forward_check(c, row_ptr_arg, col_ind_arg, order_arg, layer_ind_arg, value_arg, relation_arg,
+                            input_arg);
+    csr_rspmm_forward_check(c, col_ptr_arg, row_ind_t_arg, order_t_arg, layer_ind_arg, value_arg, relation_arg,
+                            input_arg);
+    checkSameSize(c, order_arg, order_t_arg);
+    checkSize(c, input_arg, 0, col_ptr_arg->size(0) - 1);
+    checkDim(c, output_arg, 2);
+    checkSameSize(c, output_arg, output_grad_arg);
+    checkSameType(c, input_arg, output_arg);
+    checkSameType(c, input_arg, output_grad_arg);
+    checkSize(c, output_arg, {row_ptr_arg->size(0) - 1, input_arg->size(1)});
+}
+
 std::tuple<Tensor, Tensor, Tensor, Tensor> coo2csr3d(const SparseTensor &sparse) {
     TORCH_CHECK(sparse.is_coalesced(), "Expect coalesced sparse tensor");
     Tensor index = sparse.indices();
@@ -63,71 +101,80 @@ SparseTensor csr2coo3d(const Tensor &row_ptr_, const Tensor &col_ind, const Tens
 }
 
 template <class scalar_t, class NaryOp, class BinaryOp>
-void rspmm_forward_out_cpu(const int64_t *row_ptr, const int64_t *col_ind, const int64_t *layer_ind,
-                           const scalar_t *value, const scalar_t *relation, const scalar_t *input,
-                           scalar_t *output,
-                           int64_t num_row, int64_t nnz, int64_t dim) {
-    parallel_for(0, num_row, 0, [&](int64_t row_start, int64_t row_end) {
+void rspmm_forward_out_cpu(const int64_t *row_ptr, const int64_t *col_ind, const int64_t *order,
+                           const int64_t *layer_ind, const scalar_t *value, const scalar_t *relation,
+                           const scalar_t *input, scalar_t *output,
+                           int64_t num_row, int64_t dim) {
+    parallel_for_rows(row_ptr, num_row, [&](int64_t row_start, int64_t row_end) {
         for (int64_t row = row_start; row < row_end; row++) {
+            scalar_t *__restrict__ out = output + row * dim;
+            #pragma omp simd
             for (int64_t d = 0; d < dim; d++)
-                output[row * dim + d] = NaryOp::zero;
-
-            int64_t ptr_start = row_ptr[row];
-            int64_t ptr_end = row + 1 < num_row ? row_ptr[row + 1] : nnz;
-            for (int64_t ptr = ptr_start; ptr < ptr_end; ptr++) {
-                int64_t col = col_ind[ptr];
-                int64_t layer = layer_ind[ptr];
-                scalar_t val = value[ptr];
-                for (int64_t d = 0; d < dim; d++) {
-                    scalar_t x = BinaryOp::forward(relation[layer * dim + d], input[col * dim + d]);
-                    scalar_t y = val * x;
-                    scalar_t &out = output[row * dim + d];
-                    out = NaryOp::forward(out, y);
-                }
+                out[d] = NaryOp::zero;
+
+            for (int64_t ptr = row_ptr[row]; ptr < row_ptr[row + 1]; ptr++) {
+                int64_t id = order[ptr];
+                const scalar_t *__restrict__ rel = relation + layer_ind[id] * dim;
+                const scalar_t *__restrict__ in = input + col_ind[ptr] * dim;
+                scalar_t val = value[id];
+                #pragma omp simd
+                for (int64_t d = 0; d < dim; d++)
+                    out[d] = NaryOp::forward(out[d], val * BinaryOp::forward(rel[d], in[d]));
             }
         }
     });
 }
 
 template <class scalar_t, class NaryOp, class BinaryOp>
-void rspmm_backward_out_cpu(const int64_t *row_ptr, const int64_t *col_ind, const int64_t *layer_ind,
-                            const scalar_t *value, const scalar_t *relation, const scalar_t *input,
-                            const scalar_t *output, const scalar_t *output_grad,
-                            scalar_t *value_grad, scalar_t *relation_grad, scalar_t *input_grad,
-                            int64_t num_row, int64_t nnz, int64_t dim,
-                            std::vector<std::mutex> &relation_mutex, std::vector<std::mutex> &input_mutex) {
-    parallel_for(0, num_row, 0, [&](int64_t row_start, int64_t row_end) {
+void rspmm_backward_out_cpu(const int64_t *row_ptr, const int64_t *col_ind, const int64_t *order,
+                            const int64_t *col_ptr, const int64_t *row_ind_t, const int64_t *order_t,
+                            const int64_t *layer_ind, const scalar_t *value, const scalar_t *relation,
+                            const scalar_t *input, const scalar_t *output, const scalar_t *output_grad,
+                            scalar_t *value_grad, scalar_t *relation_grad_buffer, scalar_t *input_grad,
+                            int64_t num_row, int64_t num_col, int64_t num_relation, int64_t dim) {
+    // gradient w.r.t. values and relations, traversed by rows
+    // relation gradients are accumulated in a separate buffer for each thread
+    parallel_for_rows(row_ptr, num_row, [&](int64_t row_start, int64_t row_end) {
+        scalar_t *relation_grad = relation_grad_buffer + get_thread_num() * num_relation * dim;
         for (int64_t row = row_start; row < row_end; row++) {
-            int64_t ptr_start = row_ptr[row];
-            int64_t ptr_end = row + 1 < num_row ? row_ptr[row + 1] : nnz;
-            for (int64_t ptr = ptr_start; ptr < ptr_end; ptr++) {
-                int64_t col = col_ind[ptr];
-                int64_t layer = layer_ind[ptr];
-                scalar_t val = value[ptr];
+            const scalar_t *__restrict__ out = output + row * dim;
+            const scalar_t *__restrict__ out_grad = output_grad + row * dim;
+            for (int64_t ptr = row_ptr[row]; ptr < row_ptr[row + 1]; ptr++) {
+                int64_t id = order[ptr];
+                const scalar_t *__restrict__ rel = relation + layer_ind[id] * dim;
+                const scalar_t *__restrict__ in = input + col_ind[ptr] * dim;
+                scalar_t *__restrict__ rel_grad = relation_grad + layer_ind[id] * dim;
+                scalar_t val = value[id];
                 scalar_t val_grad = 0;
+                #pragma omp simd reduction(+:val_grad)
+                for (int64_t d = 0; d < dim; d++) {
+                    scalar_t x = BinaryOp::forward(rel[d], in[d]);
+                    scalar_t dout_dy = out_grad[d] * NaryOp::backward(out[d], val * x);
+                    val_grad += dout_dy * x;
+                    rel_grad[d] += dout_dy * val * BinaryOp::backward_lhs(rel[d], in[d]);
+                }
+                value_grad[id] = val_grad;
+            }
+        }
+    });
+    // gradient w.r.t. input, traversed by columns, so that each thread writes to different rows of input_grad
+    parallel_for_rows(col_ptr, num_col, [&](int64_t col_start, int64_t col_end) {
+        for (int64_t col = col_start; col < col_end; col++) {
+            const scalar_t *__restrict__ in = input + col * dim;
+            scalar_t *__restrict__ in_grad = input_grad + col * dim;
+            for (int64_t ptr_t = col_ptr[col]; ptr_t < col_ptr[col + 1]; ptr_t++) {
+                int64_t id = order_t[ptr_t];
+                int64_t row = row_ind_t[ptr_t];
+                const scalar_t *__restrict__ rel = relation + layer_ind[id] * dim;
+                const scalar_t *__restrict__ out = output + row * dim;
+                const scalar_t *__restrict__ out_grad = output_grad + row * dim;
+                scalar_t val = value[id];
+                #pragma omp simd
                 for (int64_t d = 0; d < dim; d++) {
-                    scalar_t rel = relation[layer * dim + d];
-                    scalar_t in = input[col * dim + d];
-                    scalar_t out = output[row * dim + d];
-                    scalar_t out_grad = output_grad[row * dim + d];
-                    scalar_t x = BinaryOp::forward(rel, in);
-                    scalar_t y = val * x;
-                    scalar_t dx_drel = BinaryOp::backward_lhs(rel, in);
-                    scalar_t dx_din = BinaryOp::backward_rhs(rel, in);
-                    scalar_t dout_dy = NaryOp::backward(out, y);
-                    scalar_t dy_dval = x;
-                    scalar_t dy_dx = val;
-                    val_grad += out_grad * dout_dy * dy_dval;
-                    {
-                        std::lock_guard<std::mutex> lock(relation_mutex[layer * dim + d]);
-                        relation_grad[layer * dim + d] += out_grad * dout_dy * dy_dx * dx_drel;
-                    }
-                    {
-                        std::lock_guard<std::mutex> lock(input_mutex[col * dim + d]);
-                        input_grad[col * dim + d] += out_grad * dout_dy * dy_dx * dx_din;
-                    }
+                    scalar_t x = BinaryOp::forward(rel[d], in[d]);
+                    scalar_t dout_dy = out_grad[d] * NaryOp::backward(out[d], val * x);
+                    in_grad[d] += dout_dy * val * BinaryOp::backward_rhs(rel[d], in[d]);
                 }
-                value_grad[ptr] = val_grad;
             }
         }
     });
@@ -150,21 +197,23 @@ Tensor rspmm_forward_cpu(const SparseTensor &sparse, const Tensor &relation_, co
     Tensor output = at::empty({num_row, dim}, input.options());
 
     auto csr = coo2csr3d(sparse);
-    Tensor row_ptr = std::get<0>(csr);
-    Tensor col_ind = std::get<1>(csr);
-    Tensor layer_ind = std::get<2>(csr);
-    Tensor value = std::get<3>(csr);
+    Tensor row_ptr = at::cat({std::get<0>(csr), at::full({1}, nnz, std::get<0>(csr).options())});
+    Tensor col_ind = std::get<1>(csr).contiguous();
+    Tensor order = at::arange(nnz, row_ptr.options());
+    Tensor layer_ind = std::get<2>(csr).contiguous();
+    Tensor value = std::get<3>(csr).contiguous();
 
     AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), fn_name, [&] {
         rspmm_forward_out_cpu<scalar_t, NaryOp<scalar_t>, BinaryOp<scalar_t>>(
             row_ptr.data_ptr<int64_t>(),
             col_ind.data_ptr<int64_t>(),
+            order.data_ptr<int64_t>(),
             layer_ind.data_ptr<int64_t>(),
             value.data_ptr<scalar_t>(),
             relation.data_ptr<scalar_t>(),
             input.data_ptr<scalar_t>(),
             output.data_ptr<scalar_t>(),
-            num_row, nnz, dim
+            num_row, dim
         );
     });
 
@@ -190,23 +239,35 @@ std::tuple<SparseTensor, Tensor, Tensor> rspmm_backward_cpu(
     int64_t nnz = sparse._nnz();
     int64_t dim = input.size(1);
     int64_t num_row = sparse.size(0);
+    int64_t num_col = sparse.size(1);
+    int64_t num_relation = relation.size(0);
     Tensor value_grad = at::zeros_like(sparse.values());
-    Tensor relation_grad = at::zeros_like(relation);
+    Tensor relation_grad_buffer = at::zeros({get_num_threads(), num_relation, dim}, relation.options());
     Tensor input_grad = at::zeros_like(input);
     SparseTensor sparse_grad = at::_sparse_coo_tensor_unsafe(sparse.indices(), value_grad, sparse.sizes());
 
     auto csr = coo2csr3d(sparse);
-    Tensor row_ptr = std::get<0>(csr);
-    Tensor col_ind = std::get<1>(csr);
-    Tensor layer_ind = std::get<2>(csr);
-    Tensor value = std::get<3>(csr);
-    std::vector<std::mutex> relation_mutex(relation.numel());
-    std::vector<std::mutex> input_mutex(input.numel());
+    Tensor row_ptr = at::cat({std::get<0>(csr), at::full({1}, nnz, std::get<0>(csr).options())});
+    Tensor row_ind = sparse.indices().select(0, 0).contiguous();
+    Tensor col_ind = std::get<1>(csr).contiguous();
+    Tensor order = at::arange(nnz, row_ptr.options());
+    Tensor layer_ind = std::get<2>(csr).contiguous();
+    Tensor value = std::get<3>(csr).contiguous();
+    // the transposed index replaces atomic updates to input_grad
+    // COO tensors carry no transposed index, so it is built here. Use csr_rspmm to reuse a cached one.
+    Tensor col_ptr = at::empty({num_col + 1}, row_ptr.options());
+    Tensor order_t = at::empty({nnz}, row_ptr.options());
+    csr_transpose(col_ind.data_ptr<int64_t>(), nnz, num_col, col_ptr.data_ptr<int64_t>(), order_t.data_ptr<int64_t>());
+    Tensor row_ind_t = row_ind.index_select(0, order_t);
 
     AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), fn_name, [&] {
         rspmm_backward_out_cpu<scalar_t, NaryOp<scalar_t>, BinaryOp<scalar_t>>(
             row_ptr.data_ptr<int64_t>(),
             col_ind.data_ptr<int64_t>(),
+            order.data_ptr<int64_t>(),
+            col_ptr.data_ptr<int64_t>(),
+            row_ind_t.data_ptr<int64_t>(),
+            order_t.data_ptr<int64_t>(),
             layer_ind.data_ptr<int64_t>(),
             value.data_ptr<scalar_t>(),
             relation.data_ptr<scalar_t>(),
@@ -214,16 +275,121 @@ std::tuple<SparseTensor, Tensor, Tensor> rspmm_backward_cpu(
             output.data_ptr<scalar_t>(),
             output_grad.data_ptr<scalar_t>(),
             value_grad.data_ptr<scalar_t>(),
-            relation_grad.data_ptr<scalar_t>(),
+            relation_grad_buffer.data_ptr<scalar_t>(),
             input_grad.data_ptr<scalar_t>(),
-            num_row, nnz, dim,
-            relation_mutex, input_mutex
+            num_row, num_col, num_relation, dim
         );
     });
+    Tensor relation_grad = relation_grad_buffer.sum(0);
 
     return std::make_tuple(sparse_grad, relation_grad, input_grad);
 }
 
+template <template<class> class NaryOp, template<class> class BinaryOp>
+Tensor csr_rspmm_forward_cpu(const Tensor &row_ptr_, const Tensor &col_ind_, const Tensor &order_,
+                             const Tensor &layer_ind_, const Tensor &value_, const Tensor &relation_,
+                             const Tensor &input_) {
+    constexpr const char *fn_name = "csr_rspmm_forward_cpu";
+    TensorArg row_ptr_arg(row_ptr_, "row_ptr", 1), col_ind_arg(col_ind_, "col_ind", 2), order_arg(order_, "order", 3),
+              layer_ind_arg(layer_ind_, "layer_ind", 4), value_arg(value_, "value", 5),
+              relation_arg(relation_, "relation", 6), input_arg(input_, "input", 7);
+
+    csr_rspmm_forward_check(fn_name, row_ptr_arg, col_ind_arg, order_arg, layer_ind_arg, value_arg, relation_arg,
+                            input_arg);
+    checkDeviceType(fn_name, {row_ptr_, col_ind_, order_, layer_ind_, value_, relation_, input_}, kCPU);
+
+    const Tensor row_ptr = row_ptr_.contiguous();
+    const Tensor col_ind = col_ind_.contiguous();
+    const Tensor order = order_.contiguous();
+    const Tensor layer_ind = layer_ind_.contiguous();
+    const Tensor value = value_.contiguous();
+    const Tensor relation = relation_.contiguous();
+    const Tensor input = input_.contiguous();
+
+    int64_t dim = input.size(1);
+    int64_t num_row = row_ptr.size(0) - 1;
+    Tensor output = at::empty({num_row, dim}, input.options());
+
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), fn_name, [&] {
+        rspmm_forward_out_cpu<scalar_t, NaryOp<scalar_t>, BinaryOp<scalar_t>>(
+            row_ptr.data_ptr<int64_t>(),
+            col_ind.data_ptr<int64_t>(),
+            order.data_ptr<int64_t>(),
+            layer_ind.data_ptr<int64_t>(),
+            value.data_ptr<scalar_t>(),
+            relation.data_ptr<scalar_t>(),
+            input.data_ptr<scalar_t>(),
+            output.data_ptr<scalar_t>(),
+            num_row, dim
+        );
+    });
+
+    return output;
+}
+
+template <template<class> class NaryOp, template<class> class BinaryOp>
+std::tuple<Tensor, Tensor, Tensor> csr_rspmm_backward_cpu(
+        const Tensor &row_ptr_, const Tensor &col_ind_, const Tensor &order_, const Tensor &col_ptr_,
+        const Tensor &row_ind_t_, const Tensor &order_t_, const Tensor &layer_ind_, const Tensor &value_,
+        const Tensor &relation_, const Tensor &input_, const Tensor &output_, const Tensor &output_grad_) {
+    constexpr const char *fn_name = "csr_rspmm_backward_cpu";
+    TensorArg row_ptr_arg(row_ptr_, "row_ptr", 1), col_ind_arg(col_ind_, "col_ind", 2), order_arg(order_, "order", 3),
+              col_ptr_arg(col_ptr_, "col_ptr", 4), row_ind_t_arg(row_ind_t_, "row_ind_t", 5),
+              order_t_arg(order_t_, "order_t", 6), layer_ind_arg(layer_ind_, "layer_ind", 7),
+              value_arg(value_, "value", 8), relation_arg(relation_, "relation", 9), input_arg(input_, "input", 10),
+              output_arg(output_, "output", 11), output_grad_arg(output_grad_, "output_grad", 12);
+
+    csr_rspmm_backward_check(fn_name, row_ptr_arg, col_ind_arg, order_arg, col_ptr_arg, row_ind_t_arg, order_t_arg,
+                             layer_ind_arg, value_arg, relation_arg, input_arg, output_arg, output_grad_arg);
+    checkDeviceType(fn_name, {row_ptr_, col_ind_, order_, col_ptr_, row_ind_t_, order_t_, layer_ind_, value_,
+                              relation_, input_, output_, output_grad_}, kCPU);
+
+    const Tensor row_ptr = row_ptr_.contiguous();
+    const Tensor col_ind = col_ind_.contiguous();
+    const Tensor order = order_.contiguous();
+    const Tensor col_ptr = col_ptr_.contiguous();
+    const Tensor row_ind_t = row_ind_t_.contiguous();
+    const Tensor order_t = order_t_.contiguous();
+    const Tensor layer_ind = layer_ind_.contiguous();
+    const Tensor value = value_.contiguous();
+    const Tensor relation = relation_.contiguous();
+    const Tensor input = input_.contiguous();
+    const Tensor output = output_.contiguous();
+    const Tensor output_grad = output_grad_.contiguous();
+
+    int64_t dim = input.size(1);
+    int64_t num_row = row_ptr.size(0) - 1;
+    int64_t num_col = col_ptr.size(0) - 1;
+    int64_t num_relation = relation.size(0);
+    Tensor value_grad = at::zeros_like(value);
+    Tensor relation_grad_buffer = at::zeros({get_num_threads(), num_relation, dim}, relation.options());
+    Tensor input_grad = at::zeros_like(input);
+
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), fn_name, [&] {
+        rspmm_backward_out_cpu<scalar_t, NaryOp<scalar_t>, BinaryOp<scalar_t>>(
+            row_ptr.data_ptr<int64_t>(),
+            col_ind.data_ptr<int64_t>(),
+            order.data_ptr<int64_t>(),
+            col_ptr.data_ptr<int64_t>(),
+            row_ind_t.data_ptr<int64_t>(),
+            order_t.data_ptr<int64_t>(),
+            layer_ind.data_ptr<int64_t>(),
+            value.data_ptr<scalar_t>(),
+            relation.data_ptr<scalar_t>(),
+            input.data_ptr<scalar_t>(),
+            output.data_ptr<scalar_t>(),
+            output_grad.data_ptr<scalar_t>(),
+            value_grad.data_ptr<scalar_t>(),
+            relation_grad_buffer.data_ptr<scalar_t>(),
+            input_grad.data_ptr<scalar_t>(),
+            num_row, num_col, num_relation, dim
+        );
+    });
+    Tensor relation_grad = relation_grad_buffer.sum(0);
+
+    return std::make_tuple(value_grad, relation_grad, input_grad);
+}
+
 #define DECLARE_FORWARD_IMPL(ADD, MUL, NARYOP, BINARYOP) \
     Tensor rspmm_##ADD##_##MUL##_forward_cpu(                                          \
             const SparseTensor &sparse, const Tensor &relation, const Tensor &input) { \
@@ -237,6 +403,22 @@ std::tuple<SparseTensor, Tensor, Tensor> rspmm_backward_cpu(
         return rspmm_backward_cpu<NARYOP, BINARYOP>(sparse, relation, input, output, output_grad);         \
     }
 
+#define DECLARE_CSR_FORWARD_IMPL(ADD, MUL, NARYOP, BINARYOP) \
+    Tensor csr_rspmm_##ADD##_##MUL##_forward_cpu(                                                               \
+            const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, const Tensor &layer_ind,         \
+            const Tensor &value, const Tensor &relation, const Tensor &input) {                                 \
+        return csr_rspmm_forward_cpu<NARYOP, BINARYOP>(row_ptr, col_ind, order, layer_ind, value, relation, input); \
+    }
+
+#define DECLARE_CSR_BACKWARD_IMPL(ADD, MUL, NARYOP, BINARYOP) \
+    std::tuple<Tensor, Tensor, Tensor> csr_rspmm_##ADD##_##MUL##_backward_cpu(                                  \
+            const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, const Tensor &col_ptr,           \
+            const Tensor &row_ind_t, const Tensor &order_t, const Tensor &layer_ind, const Tensor &value,        \
+            const Tensor &relation, const Tensor &input, const Tensor &output, const Tensor &output_grad) {     \
+        return csr_rspmm_backward_cpu<NARYOP, BINARYOP>(row_ptr, col_ind, order, col_ptr, row_ind_t, order_t,   \
+                                                        layer_ind, value, relation, input, output, output_grad); \
+    }
+
 DECLARE_FORWARD_IMPL(add, mul, NaryAdd, BinaryMul)
 DECLARE_BACKWARD_IMPL(add, mul, NaryAdd, BinaryMul)
 
@@ -252,4 +434,19 @@ DECLARE_BACKWARD_IMPL(min, add, NaryMin, BinaryAdd)
 DECLARE_FORWARD_IMPL(max, add, NaryMax, BinaryAdd)
 DECLARE_BACKWARD_IMPL(max, add, NaryMax, BinaryAdd)
 
+DECLARE_CSR_FORWARD_IMPL(add, mul, NaryAdd, BinaryMul)
+DECLARE_CSR_BACKWARD_IMPL(add, mul, NaryAdd, BinaryMul)
+
+DECLARE_CSR_FORWARD_IMPL(min, mul, NaryMin, BinaryMul)
+DECLARE_CSR_BACKWARD_IMPL(min, mul, NaryMin, BinaryMul)
+
+DECLARE_CSR_FORWARD_IMPL(max, mul, NaryMax, BinaryMul)
+DECLARE_CSR_BACKWARD_IMPL(max, mul, NaryMax, BinaryMul)
+
+DECLARE_CSR_FORWARD_IMPL(min, add, NaryMin, BinaryAdd)
+DECLARE_CSR_BACKWARD_IMPL(min, add, NaryMin, BinaryAdd)
+
+DECLARE_CSR_FORWARD_IMPL(max, add, NaryMax, BinaryAdd)
+DECLARE_CSR_BACKWARD_IMPL(max, add, NaryMax, BinaryAdd)
+
 } // namespace at
\ No newline at end of file
@@ -3,7 +3,12 @@
 #include <tuple>
 
 #include <torch/extension.h>
+// SparseTensorUtils.h is moved to ATen/native since PyTorch 1.9.0
+#if __has_include(<ATen/SparseTensorUtils.h>)
 #include <ATen/SparseTensorUtils.h>
+#else
+#include <ATen/native/SparseTensorUtils.h>
+#endif
 
 namespace at {
 
@@ -15,6 +20,16 @@ void rspmm_forward_check(CheckedFrom c, const TensorArg &sparse_arg, const Tenso
 void rspmm_backward_check(CheckedFrom c, const TensorArg &sparse_arg, const TensorArg &relation_arg,
                           const TensorArg &input_arg, const TensorArg &output_arg, const TensorArg &output_grad_arg);
 
+void csr_rspmm_forward_check(CheckedFrom c, const TensorArg &row_ptr_arg, const TensorArg &col_ind_arg,
+                             const TensorArg &order_arg, const TensorArg &layer_ind_arg, const TensorArg &value_arg,
+                             const TensorArg &relation_arg, const TensorArg &input_arg);
+
+void csr_rspmm_backward_check(CheckedFrom c, const TensorArg &row_ptr_arg, const TensorArg &col_ind_arg,
+                              const TensorArg &order_arg, const TensorArg &col_ptr_arg, const TensorArg &row_ind_t_arg,
+                              const TensorArg &order_t_arg, const TensorArg &layer_ind_arg, const TensorArg &value_arg,
+                              const TensorArg &relation_arg, const TensorArg &input_arg, const TensorArg &output_arg,
+                              const TensorArg &output_grad_arg);
+
 std::tuple<Tensor, Tensor, Tensor, Tensor> coo2csr3d(const SparseTensor &sparse);
 
 SparseTensor csr2coo3d(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &layer_ind, const Tensor &value,
@@ -45,6 +60,46 @@ Tensor rspmm_max_add_forward_cpu(const SparseTensor &sparse, const Tensor &relat
 std::tuple<SparseTensor, Tensor, Tensor> rspmm_max_add_backward_cpu(const SparseTensor &sparse,
         const Tensor &relation, const Tensor &input, const Tensor &output, const Tensor &output_grad);
 
+Tensor csr_rspmm_add_mul_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input);
+
+std::tuple<Tensor, Tensor, Tensor> csr_rspmm_add_mul_backward_cpu(const Tensor &row_ptr, const Tensor &col_ind,
+        const Tensor &order, const Tensor &col_ptr, const Tensor &row_ind_t, const Tensor &order_t,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
+Tensor csr_rspmm_min_mul_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input);
+
+std::tuple<Tensor, Tensor, Tensor> csr_rspmm_min_mul_backward_cpu(const Tensor &row_ptr, const Tensor &col_ind,
+        const Tensor &order, const Tensor &col_ptr, const Tensor &row_ind_t, const Tensor &order_t,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
+Tensor csr_rspmm_max_mul_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input);
+
+std::tuple<Tensor, Tensor, Tensor> csr_rspmm_max_mul_backward_cpu(const Tensor &row_ptr, const Tensor &col_ind,
+        const Tensor &order, const Tensor &col_ptr, const Tensor &row_ind_t, const Tensor &order_t,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
+Tensor csr_rspmm_min_add_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input);
+
+std::tuple<Tensor, Tensor, Tensor> csr_rspmm_min_add_backward_cpu(const Tensor &row_ptr, const Tensor &col_ind,
+        const Tensor &order, const Tensor &col_ptr, const Tensor &row_ind_t, const Tensor &order_t,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
+Tensor csr_rspmm_max_add_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input);
+
+std::tuple<Tensor, Tensor, Tensor> csr_rspmm_max_add_backward_cpu(const Tensor &row_ptr, const Tensor &col_ind,
+        const Tensor &order, const Tensor &col_ptr, const Tensor &row_ind_t, const Tensor &order_t,
+        const Tensor &layer_ind, const Tensor &value, const Tensor &relation, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
 #ifdef CUDA_OP
 Tensor rspmm_add_mul_forward_cuda(const SparseTensor &sparse, const Tensor &relation, const Tensor &input);
 
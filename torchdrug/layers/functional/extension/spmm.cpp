@@ -1,10 +1,9 @@
-#include <mutex>
-
 #define AT_PARALLEL_OPENMP true
 #include <ATen/Parallel.h>
 
 #include "operator.cuh"
 #include "spmm.h"
+#include "util.h"
 
 namespace at {
 
@@ -35,6 +34,35 @@ void spmm_backward_check(CheckedFrom c, const TensorArg &sparse_arg, const Tenso
     checkSize(c, output_arg, {sparse_arg->size(0), input_arg->size(1)});
 }
 
+void csr_spmm_forward_check(CheckedFrom c, const TensorArg &row_ptr_arg, const TensorArg &col_ind_arg,
+                            const TensorArg &order_arg, const TensorArg &value_arg, const TensorArg &input_arg) {
+    checkDim(c, row_ptr_arg, 1);
+    checkDim(c, col_ind_arg, 1);
+    checkDim(c, order_arg, 1);
+    checkDim(c, value_arg, 1);
+    checkDim(c, input_arg, 2);
+    checkScalarType(c, row_ptr_arg, kLong);
+    checkSameType(c, col_ind_arg, row_ptr_arg);
+    checkSameType(c, order_arg, row_ptr_arg);
+    checkSameSize(c, col_ind_arg, order_arg);
+    checkScalarType(c, input_arg, value_arg->scalar_type());
+}
+
+void csr_spmm_backward_check(CheckedFrom c, const TensorArg &row_ptr_arg, const TensorArg &col_ind_arg,
+                             const TensorArg &order_arg, const TensorArg &col_ptr_arg, const TensorArg &row_ind_t_arg,
+                             const TensorArg &order_t_arg, const TensorArg &value_arg, const TensorArg &input_arg,
+                             const TensorArg &output_arg, const TensorArg &output_grad_arg) {
+    csr_spmm_forward_check(c, row_ptr_arg, col_ind_arg, order_arg, value_arg, input_arg);
+    csr_spmm_forward_check(c, col_ptr_arg, row_ind_t_arg, order_t_arg, value_arg, input_arg);
+    checkSameSize(c, order_arg, order_t_arg);
+    checkSize(c, input_arg, 0, col_ptr_arg->size(0) - 1);
+    checkDim(c, output_arg, 2);
+    checkSameSize(c, output_arg, output_grad_arg);
+    checkSameType(c, input_arg, output_arg);
+    checkSameType(c, input_arg, output_grad_arg);
+    checkSize(c, output_arg, {row_ptr_arg->size(0) - 1, input_arg->size(1)});
+}
+
 std::tuple<Tensor, Tensor, Tensor> coo2csr(const SparseTensor &sparse) {
     TORCH_CHECK(sparse.is_coalesced(), "Expect coalesced sparse tensor");
     Tensor index = sparse.indices();
@@ -57,58 +85,67 @@ SparseTensor csr2coo(const Tensor &row_ptr_, const Tensor &col_ind, const Tensor
 }
 
 template <class scalar_t, class NaryOp, class BinaryOp>
-void spmm_forward_out_cpu(const int64_t *row_ptr, const int64_t *col_ind, const scalar_t *value,
-                          const scalar_t *input, scalar_t *output,
-                          int64_t num_row, int64_t nnz, int64_t dim) {
-    parallel_for(0, num_row, 0, [&](int64_t row_start, int64_t row_end) {
+void spmm_forward_out_cpu(const int64_t *row_ptr, const int64_t *col_ind, const int64_t *order,
+                          const scalar_t *value, const scalar_t *input, scalar_t *output,
+                          int64_t num_row, int64_t dim) {
+    parallel_for_rows(row_ptr, num_row, [&](int64_t row_start, int64_t row_end) {
         for (int64_t row = row_start; row < row_end; row++) {
+            scalar_t *__restrict__ out = output + row * dim;
+            #pragma omp simd
             for (int64_t d = 0; d < dim; d++)
-                output[row * dim + d] = NaryOp::zero;
-
-            int64_t ptr_start = row_ptr[row];
-            int64_t ptr_end = row + 1 < num_row ? row_ptr[row + 1] : nnz;
-            for (int64_t ptr = ptr_start; ptr < ptr_end; ptr++) {
-                int64_t col = col_ind[ptr];
-                scalar_t val = value[ptr];
-                for (int64_t d = 0; d < dim; d++) {
-                    scalar_t x = BinaryOp::forward(val, input[col * dim + d]);
-                    scalar_t &out = output[row * dim + d];
-                    out = NaryOp::forward(out, x);
-                }
+                out[d] = NaryOp::zero;
+
+            for (int64_t ptr = row_ptr[row]; ptr < row_ptr[row + 1]; ptr++) {
+                const scalar_t *__restrict__ in = input + col_ind[ptr] * dim;
+                scalar_t val = value[order[ptr]];
+                #pragma omp simd
+                for (int64_t d = 0; d < dim; d++)
+                    out[d] = NaryOp::forward(out[d], BinaryOp::forward(val, in[d]));
             }
         }
     });
 }
 
 template <class scalar_t, class NaryOp, class BinaryOp>
-void spmm_backward_out_cpu(const int64_t *row_ptr, const int64_t *col_ind, const scalar_t *value,
+void spmm_backward_out_cpu(const int64_t *row_ptr, const int64_t *col_ind, const int64_t *order,
+                           const int64_t *col_ptr, const int64_t *row_ind_t, const int64_t *order_t,
+                           const scalar_t *value,
                            const scalar_t *input, const scalar_t *output, const scalar_t *output_grad,
                            scalar_t *value_grad, scalar_t *input_grad,
-                           int64_t num_row, int64_t nnz, int64_t dim,
-                           std::vector<std::mutex> &mutex) {
-    parallel_for(0, num_row, 0, [&](int64_t row_start, int64_t row_end) {
+                           int64_t num_row, int64_t num_col, int64_t dim) {
+    // gradient w.r.t. values, traversed by rows
+    parallel_for_rows(row_ptr, num_row, [&](int64_t row_start, int64_t row_end) {
         for (int64_t row = row_start; row < row_end; row++) {
-            int64_t ptr_start = row_ptr[row];
-            int64_t ptr_end = row + 1 < num_row ? row_ptr[row + 1] : nnz;
-            for (int64_t ptr = ptr_start; ptr < ptr_end; ptr++) {
-                int64_t col = col_ind[ptr];
-                scalar_t val = value[ptr];
+            const scalar_t *__restrict__ out = output + row * dim;
+            const scalar_t *__restrict__ out_grad = output_grad + row * dim;
+            for (int64_t ptr = row_ptr[row]; ptr < row_ptr[row + 1]; ptr++) {
+                const scalar_t *__restrict__ in = input + col_ind[ptr] * dim;
+                scalar_t val = value[order[ptr]];
                 scalar_t val_grad = 0;
+                #pragma omp simd reduction(+:val_grad)
+                for (int64_t d = 0; d < dim; d++) {
+                    scalar_t x = BinaryOp::forward(val, in[d]);
+                    val_grad += out_grad[d] * NaryOp::backward(out[d], x) * BinaryOp::backward_lhs(val, in[d]);
+                }
+                value_grad[order[ptr]] = val_grad;
+            }
+        }
+    });
+    // gradient w.r.t. input, traversed by columns, so that each thread writes to different rows of input_grad
+    parallel_for_rows(col_ptr, num_col, [&](int64_t col_start, int64_t col_end) {
+        for (int64_t col = col_start; col < col_end; col++) {
+            const scalar_t *__restrict__ in = input + col * dim;
+            scalar_t *__restrict__ in_grad = input_grad + col * dim;
+            for (int64_t ptr_t = col_ptr[col]; ptr_t < col_ptr[col + 1]; ptr_t++) {
+                int64_t row = row_ind_t[ptr_t];
+                const scalar_t *__restrict__ out = output + row * dim;
+                const scalar_t *__restrict__ out_grad = output_grad + row * dim;
+                scalar_t val = value[order_t[ptr_t]];
+                #pragma omp simd
                 for (int64_t d = 0; d < dim; d++) {
-                    scalar_t in = input[col * dim + d];
-                    scalar_t out = output[row * dim + d];
-                    scalar_t out_grad = output_grad[row * dim + d];
-                    scalar_t x = BinaryOp::forward(val, in);
-                    scalar_t dx_dval = BinaryOp::backward_lhs(val, in);
-                    scalar_t dx_din = BinaryOp::backward_rhs(val, in);
-                    scalar_t dout_dx = NaryOp::backward(out, x);
-                    val_grad += out_grad * dout_dx * dx_dval;
-                    {
-                        std::lock_guard<std::mutex> lock(mutex[col * dim + d]);
-                        input_grad[col * dim + d] += out_grad * dout_dx * dx_din;
-                    }
+                    scalar_t x = BinaryOp::forward(val, in[d]);
+                    in_grad[d] += out_grad[d] * NaryOp::backward(out[d], x) * BinaryOp::backward_rhs(val, in[d]);
                 }
-                value_grad[ptr] = val_grad;
             }
         }
     });
@@ -130,18 +167,20 @@ Tensor spmm_forward_cpu(const SparseTensor &sparse, const Tensor &input_) {
     Tensor output = at::empty({num_row, dim}, input.options());
 
     auto csr = coo2csr(sparse);
-    Tensor row_ptr = std::get<0>(csr);
-    Tensor col_ind = std::get<1>(csr);
-    Tensor value = std::get<2>(csr);
+    Tensor row_ptr = at::cat({std::get<0>(csr), at::full({1}, nnz, std::get<0>(csr).options())});
+    Tensor col_ind = std::get<1>(csr).contiguous();
+    Tensor order = at::arange(nnz, row_ptr.options());
+    Tensor value = std::get<2>(csr).contiguous();
 
     AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), fn_name, [&] {
         spmm_forward_out_cpu<scalar_t, NaryOp<scalar_t>, BinaryOp<scalar_t>>(
             row_ptr.data_ptr<int64_t>(),
             col_ind.data_ptr<int64_t>(),
+            order.data_ptr<int64_t>(),
             value.data_ptr<scalar_t>(),
             input.data_ptr<scalar_t>(),
             output.data_ptr<scalar_t>(),
-            num_row, nnz, dim
+            num_row, dim
         );
     });
 
@@ -165,34 +204,134 @@ std::tuple<SparseTensor, Tensor> spmm_backward_cpu(
     int64_t nnz = sparse._nnz();
     int64_t dim = input.size(1);
     int64_t num_row = sparse.size(0);
+    int64_t num_col = sparse.size(1);
     Tensor value_grad = at::zeros_like(sparse.values());
     Tensor input_grad = at::zeros_like(input);
     SparseTensor sparse_grad = at::_sparse_coo_tensor_unsafe(sparse.indices(), value_grad, sparse.sizes());
 
     auto csr = coo2csr(sparse);
-    Tensor row_ptr = std::get<0>(csr).contiguous();
+    Tensor row_ptr = at::cat({std::get<0>(csr), at::full({1}, nnz, std::get<0>(csr).options())});
+    Tensor row_ind = sparse.indices().select(0, 0).contiguous();
     Tensor col_ind = std::get<1>(csr).contiguous();
+    Tensor order = at::arange(nnz, row_ptr.options());
     Tensor value = std::get<2>(csr).contiguous();
-    std::vector<std::mutex> mutex(input.numel());
+    // the transposed index replaces atomic updates to input_grad
+    // COO tensors carry no transposed index, so it is built here. Use csr_spmm to reuse a cached one.
+    Tensor col_ptr = at::empty({num_col + 1}, row_ptr.options());
+    Tensor order_t = at::empty({nnz}, row_ptr.options());
+    csr_transpose(col_ind.data_ptr<int64_t>(), nnz, num_col, col_ptr.data_ptr<int64_t>(), order_t.data_ptr<int64_t>());
+    Tensor row_ind_t = row_ind.index_select(0, order_t);
 
     AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), fn_name, [&] {
         spmm_backward_out_cpu<scalar_t, NaryOp<scalar_t>, BinaryOp<scalar_t>>(
             row_ptr.data_ptr<int64_t>(),
             col_ind.data_ptr<int64_t>(),
+            order.data_ptr<int64_t>(),
+            col_ptr.data_ptr<int64_t>(),
+            row_ind_t.data_ptr<int64_t>(),
+            order_t.data_ptr<int64_t>(),
             value.data_ptr<scalar_t>(),
             input.data_ptr<scalar_t>(),
             output.data_ptr<scalar_t>(),
             output_grad.data_ptr<scalar_t>(),
             value_grad.data_ptr<scalar_t>(),
             input_grad.data_ptr<scalar_t>(),
-            num_row, nnz, dim,
-            mutex
+            num_row, num_col, dim
         );
     });
 
     return std::make_tuple(sparse_grad, input_grad);
 }
 
+template <template<class> class NaryOp, template<class> class BinaryOp>
+Tensor csr_spmm_forward_cpu(const Tensor &row_ptr_, const Tensor &col_ind_, const Tensor &order_,
+                            const Tensor &value_, const Tensor &input_) {
+    constexpr const char *fn_name = "csr_spmm_forward_cpu";
+    TensorArg row_ptr_arg(row_ptr_, "row_ptr", 1), col_ind_arg(col_ind_, "col_ind", 2), order_arg(order_, "order", 3),
+              value_arg(value_, "value", 4), input_arg(input_, "input", 5);
+
+    csr_spmm_forward_check(fn_name, row_ptr_arg, col_ind_arg, order_arg, value_arg, input_arg);
+    checkDeviceType(fn_name, {row_ptr_, col_ind_, order_, value_, input_}, kCPU);
+
+    const Tensor row_ptr = row_ptr_.contiguous();
+    const Tensor col_ind = col_ind_.contiguous();
+    const Tensor order = order_.contiguous();
+    const Tensor value = value_.contiguous();
+    const Tensor input = input_.contiguous();
+
+    int64_t dim = input.size(1);
+    int64_t num_row = row_ptr.size(0) - 1;
+    Tensor output = at::empty({num_row, dim}, input.options());
+
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), fn_name, [&] {
+        spmm_forward_out_cpu<scalar_t, NaryOp<scalar_t>, BinaryOp<scalar_t>>(
+            row_ptr.data_ptr<int64_t>(),
+            col_ind.data_ptr<int64_t>(),
+            order.data_ptr<int64_t>(),
+            value.data_ptr<scalar_t>(),
+            input.data_ptr<scalar_t>(),
+            output.data_ptr<scalar_t>(),
+            num_row, dim
+        );
+    });
+
+    return output;
+}
+
+template <template<class> class NaryOp, template<class> class BinaryOp>
+std::tuple<Tensor, Tensor> csr_spmm_backward_cpu(
+        const Tensor &row_ptr_, const Tensor &col_ind_, const Tensor &order_, const Tensor &col_ptr_,
+        const Tensor &row_ind_t_, const Tensor &order_t_, const Tensor &value_, const Tensor &input_,
+        const Tensor &output_, const Tensor &output_grad_) {
+    constexpr const char *fn_name = "csr_spmm_backward_cpu";
+    TensorArg row_ptr_arg(row_ptr_, "row_ptr", 1), col_ind_arg(col_ind_, "col_ind", 2), order_arg(order_, "order", 3),
+              col_ptr_arg(col_ptr_, "col_ptr", 4), row_ind_t_arg(row_ind_t_, "row_ind_t", 5),
+              order_t_arg(order_t_, "order_t", 6), value_arg(value_, "value", 7), input_arg(input_, "input", 8),
+              output_arg(output_, "output", 9), output_grad_arg(output_grad_, "output_grad", 10);
+
+    csr_spmm_backward_check(fn_name, row_ptr_arg, col_ind_arg, order_arg, col_ptr_arg, row_ind_t_arg, order_t_arg,
+                            value_arg, input_arg, output_arg, output_grad_arg);
+    checkDeviceType(fn_name, {row_ptr_, col_ind_, order_, col_ptr_, row_ind_t_, order_t_, value_, input_, output_,
+                              output_grad_}, kCPU);
+
+    const Tensor row_ptr = row_ptr_.contiguous();
+    const Tensor col_ind = col_ind_.contiguous();
+    const Tensor order = order_.contiguous();
+    const Tensor col_ptr = col_ptr_.contiguous();
+    const Tensor row_ind_t = row_ind_t_.contiguous();
+    const Tensor order_t = order_t_.contiguous();
+    const Tensor value = value_.contiguous();
+    const Tensor input = input_.contiguous();
+    const Tensor output = output_.contiguous();
+    const Tensor output_grad = output_grad_.contiguous();
+
+    int64_t dim = input.size(1);
+    int64_t num_row = row_ptr.size(0) - 1;
+    int64_t num_col = col_ptr.size(0) - 1;
+    Tensor value_grad = at::zeros_like(value);
+    Tensor input_grad = at::zeros_like(input);
+
+    AT_DISPATCH_FLOATING_TYPES(input.scalar_type(), fn_name, [&] {
+        spmm_backward_out_cpu<scalar_t, NaryOp<scalar_t>, BinaryOp<scalar_t>>(
+            row_ptr.data_ptr<int64_t>(),
+            col_ind.data_ptr<int64_t>(),
+            order.data_ptr<int64_t>(),
+            col_ptr.data_ptr<int64_t>(),
+            row_ind_t.data_ptr<int64_t>(),
+            order_t.data_ptr<int64_t>(),
+            value.data_ptr<scalar_t>(),
+            input.data_ptr<scalar_t>(),
+            output.data_ptr<scalar_t>(),
+            output_grad.data_ptr<scalar_t>(),
+            value_grad.data_ptr<scalar_t>(),
+            input_grad.data_ptr<scalar_t>(),
+            num_row, num_col, dim
+        );
+    });
+
+    return std::make_tuple(value_grad, input_grad);
+}
+
 #define DECLARE_FORWARD_IMPL(ADD, MUL, NARYOP, BINARYOP) \
     Tensor spmm_##ADD##_##MUL##_forward_cpu(const SparseTensor &sparse, const Tensor &input) { \
         return spmm_forward_cpu<NARYOP, BINARYOP>(sparse, input);                              \
@@ -204,6 +343,21 @@ std::tuple<SparseTensor, Tensor> spmm_backward_cpu(
         return spmm_backward_cpu<NARYOP, BINARYOP>(sparse, input, output, output_grad);                         \
     }
 
+#define DECLARE_CSR_FORWARD_IMPL(ADD, MUL, NARYOP, BINARYOP) \
+    Tensor csr_spmm_##ADD##_##MUL##_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, \
+                                                const Tensor &value, const Tensor &input) {                      \
+        return csr_spmm_forward_cpu<NARYOP, BINARYOP>(row_ptr, col_ind, order, value, input);                     \
+    }
+
+#define DECLARE_CSR_BACKWARD_IMPL(ADD, MUL, NARYOP, BINARYOP) \
+    std::tuple<Tensor, Tensor> csr_spmm_##ADD##_##MUL##_backward_cpu(                                              \
+            const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, const Tensor &col_ptr,              \
+            const Tensor &row_ind_t, const Tensor &order_t, const Tensor &value, const Tensor &input,              \
+            const Tensor &output, const Tensor &output_grad) {                                                     \
+        return csr_spmm_backward_cpu<NARYOP, BINARYOP>(row_ptr, col_ind, order, col_ptr, row_ind_t, order_t, value, \
+                                                       input, output, output_grad);                                \
+    }
+
 DECLARE_FORWARD_IMPL(add, mul, NaryAdd, BinaryMul)
 DECLARE_BACKWARD_IMPL(add, mul, NaryAdd, BinaryMul)
 
@@ -219,6 +373,21 @@ DECLARE_BACKWARD_IMPL(min, add, NaryMin, BinaryAdd)
 DECLARE_FORWARD_IMPL(max, add, NaryMax, BinaryAdd)
 DECLARE_BACKWARD_IMPL(max, add, NaryMax, BinaryAdd)
 
+DECLARE_CSR_FORWARD_IMPL(add, mul, NaryAdd, BinaryMul)
+DECLARE_CSR_BACKWARD_IMPL(add, mul, NaryAdd, BinaryMul)
+
+DECLARE_CSR_FORWARD_IMPL(min, mul, NaryMin, BinaryMul)
+DECLARE_CSR_BACKWARD_IMPL(min, mul, NaryMin, BinaryMul)
+
+DECLARE_CSR_FORWARD_IMPL(max, mul, NaryMax, BinaryMul)
+DECLARE_CSR_BACKWARD_IMPL(max, mul, NaryMax, BinaryMul)
+
+DECLARE_CSR_FORWARD_IMPL(min, add, NaryMin, BinaryAdd)
+DECLARE_CSR_BACKWARD_IMPL(min, add, NaryMin, BinaryAdd)
+
+DECLARE_CSR_FORWARD_IMPL(max, add, NaryMax, BinaryAdd)
+DECLARE_CSR_BACKWARD_IMPL(max, add, NaryMax, BinaryAdd)
+
 } // namespace at
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
@@ -242,6 +411,26 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
     m.def("rspmm_min_add_backward_cpu", &at::rspmm_min_add_backward_cpu);
     m.def("rspmm_max_add_forward_cpu", &at::rspmm_max_add_forward_cpu);
     m.def("rspmm_max_add_backward_cpu", &at::rspmm_max_add_backward_cpu);
+    m.def("csr_spmm_add_mul_forward_cpu", &at::csr_spmm_add_mul_forward_cpu);
+    m.def("csr_spmm_add_mul_backward_cpu", &at::csr_spmm_add_mul_backward_cpu);
+    m.def("csr_spmm_min_mul_forward_cpu", &at::csr_spmm_min_mul_forward_cpu);
+    m.def("csr_spmm_min_mul_backward_cpu", &at::csr_spmm_min_mul_backward_cpu);
+    m.def("csr_spmm_max_mul_forward_cpu", &at::csr_spmm_max_mul_forward_cpu);
+    m.def("csr_spmm_max_mul_backward_cpu", &at::csr_spmm_max_mul_backward_cpu);
+    m.def("csr_spmm_min_add_forward_cpu", &at::csr_spmm_min_add_forward_cpu);
+    m.def("csr_spmm_min_add_backward_cpu", &at::csr_spmm_min_add_backward_cpu);
+    m.def("csr_spmm_max_add_forward_cpu", &at::csr_spmm_max_add_forward_cpu);
+    m.def("csr_spmm_max_add_backward_cpu", &at::csr_spmm_max_add_backward_cpu);
+    m.def("csr_rspmm_add_mul_forward_cpu", &at::csr_rspmm_add_mul_forward_cpu);
+    m.def("csr_rspmm_add_mul_backward_cpu", &at::csr_rspmm_add_mul_backward_cpu);
+    m.def("csr_rspmm_min_mul_forward_cpu", &at::csr_rspmm_min_mul_forward_cpu);
+    m.def("csr_rspmm_min_mul_backward_cpu", &at::csr_rspmm_min_mul_backward_cpu);
+    m.def("csr_rspmm_max_mul_forward_cpu", &at::csr_rspmm_max_mul_forward_cpu);
+    m.def("csr_rspmm_max_mul_backward_cpu", &at::csr_rspmm_max_mul_backward_cpu);
+    m.def("csr_rspmm_min_add_forward_cpu", &at::csr_rspmm_min_add_forward_cpu);
+    m.def("csr_rspmm_min_add_backward_cpu", &at::csr_rspmm_min_add_backward_cpu);
+    m.def("csr_rspmm_max_add_forward_cpu", &at::csr_rspmm_max_add_forward_cpu);
+    m.def("csr_rspmm_max_add_backward_cpu", &at::csr_rspmm_max_add_backward_cpu);
 #ifdef CUDA_OP
     m.def("spmm_add_mul_forward_cuda", &at::spmm_add_mul_forward_cuda);
     m.def("spmm_add_mul_backward_cuda", &at::spmm_add_mul_backward_cuda);
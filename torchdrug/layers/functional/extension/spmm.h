@@ -3,7 +3,12 @@
 #include <tuple>
 
 #include <torch/extension.h>
+// SparseTensorUtils.h is moved to ATen/native since PyTorch 1.9.0
+#if __has_include(<ATen/SparseTensorUtils.h>)
 #include <ATen/SparseTensorUtils.h>
+#else
+#include <ATen/native/SparseTensorUtils.h>
+#endif
 
 #include "rspmm.h"
 
@@ -16,6 +21,14 @@ void spmm_forward_check(CheckedFrom c, const TensorArg &sparse_arg, const Tensor
 void spmm_backward_check(CheckedFrom c, const TensorArg &sparse_arg, const TensorArg &input_arg,
                          const TensorArg &output_arg, const TensorArg &output_grad_arg);
 
+void csr_spmm_forward_check(CheckedFrom c, const TensorArg &row_ptr_arg, const TensorArg &col_ind_arg,
+                            const TensorArg &order_arg, const TensorArg &value_arg, const TensorArg &input_arg);
+
+void csr_spmm_backward_check(CheckedFrom c, const TensorArg &row_ptr_arg, const TensorArg &col_ind_arg,
+                             const TensorArg &order_arg, const TensorArg &col_ptr_arg, const TensorArg &row_ind_t_arg,
+                             const TensorArg &order_t_arg, const TensorArg &value_arg, const TensorArg &input_arg,
+                             const TensorArg &output_arg, const TensorArg &output_grad_arg);
+
 std::tuple<Tensor, Tensor, Tensor> coo2csr(const SparseTensor &sparse);
 
 SparseTensor csr2coo(const Tensor &row_ptr_, const Tensor &col_ind, const Tensor &value, IntArrayRef size);
@@ -45,6 +58,46 @@ Tensor spmm_max_add_forward_cpu(const SparseTensor &sparse, const Tensor &input)
 std::tuple<SparseTensor, Tensor> spmm_max_add_backward_cpu(
         const SparseTensor &sparse, const Tensor &input, const Tensor &output, const Tensor &output_grad);
 
+Tensor csr_spmm_add_mul_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+                                 const Tensor &value, const Tensor &input);
+
+std::tuple<Tensor, Tensor> csr_spmm_add_mul_backward_cpu(
+        const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, const Tensor &col_ptr,
+        const Tensor &row_ind_t, const Tensor &order_t, const Tensor &value, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
+Tensor csr_spmm_min_mul_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+                                 const Tensor &value, const Tensor &input);
+
+std::tuple<Tensor, Tensor> csr_spmm_min_mul_backward_cpu(
+        const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, const Tensor &col_ptr,
+        const Tensor &row_ind_t, const Tensor &order_t, const Tensor &value, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
+Tensor csr_spmm_max_mul_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+                                 const Tensor &value, const Tensor &input);
+
+std::tuple<Tensor, Tensor> csr_spmm_max_mul_backward_cpu(
+        const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, const Tensor &col_ptr,
+        const Tensor &row_ind_t, const Tensor &order_t, const Tensor &value, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
+Tensor csr_spmm_min_add_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+                                 const Tensor &value, const Tensor &input);
+
+std::tuple<Tensor, Tensor> csr_spmm_min_add_backward_cpu(
+        const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, const Tensor &col_ptr,
+        const Tensor &row_ind_t, const Tensor &order_t, const Tensor &value, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
+Tensor csr_spmm_max_add_forward_cpu(const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order,
+                                 const Tensor &value, const Tensor &input);
+
+std::tuple<Tensor, Tensor> csr_spmm_max_add_backward_cpu(
+        const Tensor &row_ptr, const Tensor &col_ind, const Tensor &order, const Tensor &col_ptr,
+        const Tensor &row_ind_t, const Tensor &order_t, const Tensor &value, const Tensor &input,
+        const Tensor &output, const Tensor &output_grad);
+
 #ifdef CUDA_OP
 Tensor spmm_add_mul_forward_cuda(const SparseTensor &sparse, const Tensor &input);
 
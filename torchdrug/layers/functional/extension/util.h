@@ -0,0 +1,58 @@
+#pragma once
+
+#include <algorithm>
+#include <vector>
+
+#include <ATen/Parallel.h>
+
+namespace at {
+
+// Partition rows into chunks of balanced workload. The workload of a row is its number of non-zeros plus 1.
+// row_ptr has num_row + 1 elements. Return the boundaries of chunks.
+inline std::vector<int64_t> balanced_partition(const int64_t *row_ptr, int64_t num_row, int64_t num_chunk) {
+    std::vector<int64_t> boundary(num_chunk + 1);
+    int64_t workload = row_ptr[num_row] + num_row;
+    boundary[0] = 0;
+    for (int64_t i = 1; i < num_chunk; i++) {
+        int64_t target = workload * i / num_chunk;
+        // first row whose cumulative workload reaches the target
+        int64_t low = boundary[i - 1], high = num_row;
+        while (low < high) {
+            int64_t mid = (low + high) / 2;
+            if (row_ptr[mid] + mid < target)
+                low = mid + 1;
+            else
+                high = mid;
+        }
+        boundary[i] = low;
+    }
+    boundary[num_chunk] = num_row;
+    return boundary;
+}
+
+// Apply function(row_start, row_end) to chunks of rows in parallel, where chunks are balanced by non-zeros
+template <class Function>
+void parallel_for_rows(const int64_t *row_ptr, int64_t num_row, const Function &function) {
+    int64_t num_chunk = std::min<int64_t>(get_num_threads() * 4, std::max<int64_t>(num_row, 1));
+    std::vector<int64_t> boundary = balanced_partition(row_ptr, num_row, num_chunk);
+    parallel_for(0, num_chunk, 1, [&](int64_t chunk_start, int64_t chunk_end) {
+        for (int64_t chunk = chunk_start; chunk < chunk_end; chunk++)
+            function(boundary[chunk], boundary[chunk + 1]);
+    });
+}
+
+// Transpose the index of a CSR matrix by counting sort in O(nnz + num_col)
+// col_ptr has num_col + 1 elements, and perm maps each position in the transposed matrix to a non-zero.
+// Non-zeros in the same column keep their original order.
+inline void csr_transpose(const int64_t *col_ind, int64_t nnz, int64_t num_col, int64_t *col_ptr, int64_t *perm) {
+    std::fill(col_ptr, col_ptr + num_col + 1, 0);
+    for (int64_t ptr = 0; ptr < nnz; ptr++)
+        col_ptr[col_ind[ptr] + 1]++;
+    for (int64_t col = 0; col < num_col; col++)
+        col_ptr[col + 1] += col_ptr[col];
+    std::vector<int64_t> position(col_ptr, col_ptr + num_col);
+    for (int64_t ptr = 0; ptr < nnz; ptr++)
+        perm[position[col_ind[ptr]]++] = ptr;
+}
+
+} // namespace at
@@ -270,6 +270,153 @@ class RSPMMMaxAddFunction(autograd.Function):
         return sparse_grad, relation_grad, input_grad
 
 
+class CSRSPMMFunction(autograd.Function):
+
+    @staticmethod
+    def forward(ctx, index, index_t, value, input):
+        ptr, col, order = index
+        ptr_t, col_t, order_t = index_t
+        shape = (len(ptr) - 1, len(ptr_t) - 1)
+        sparse = torch.sparse_csr_tensor(ptr, col, value[order].to(input.dtype), shape)
+        output = torch.sparse.mm(sparse, input)
+        ctx.save_for_backward(ptr, col, order, ptr_t, col_t, order_t, value, input)
+        return output
+
+    @staticmethod
+    def backward(ctx, output_grad):
+        ptr, col, order, ptr_t, col_t, order_t, value, input = ctx.saved_tensors
+        value_grad = input_grad = None
+        if ctx.needs_input_grad[2]:
+            row = torch.repeat_interleave(torch.arange(len(ptr) - 1, device=ptr.device), ptr.diff())
+            value_grad = torch.zeros_like(value)
+            value_grad[order] = (output_grad[row] * input[col]).sum(dim=-1).to(value.dtype)
+        if ctx.needs_input_grad[3]:
+            shape = (len(ptr_t) - 1, len(ptr) - 1)
+            sparse_t = torch.sparse_csr_tensor(ptr_t, col_t, value[order_t].to(output_grad.dtype), shape)
+            input_grad = torch.sparse.mm(sparse_t, output_grad)
+        return None, None, value_grad, input_grad
+
+
+class CSRGeneralizedSPMMFunction(autograd.Function):
+
+    @staticmethod
+    def forward(ctx, name, index, index_t, value, input):
+        forward = getattr(spmm, "csr_spmm_%s_forward_cpu" % name)
+        output = forward(*index, value, input)
+        ctx.name = name
+        ctx.save_for_backward(*index, *index_t, value, input, output)
+        return output
+
+    @staticmethod
+    def backward(ctx, output_grad):
+        backward = getattr(spmm, "csr_spmm_%s_backward_cpu" % ctx.name)
+        value_grad, input_grad = backward(*ctx.saved_tensors, output_grad)
+        return None, None, None, value_grad, input_grad
+
+
+class CSRGeneralizedRSPMMFunction(autograd.Function):
+
+    @staticmethod
+    def forward(ctx, name, index, index_t, relation_index, value, relation, input):
+        forward = getattr(spmm, "csr_rspmm_%s_forward_cpu" % name)
+        output = forward(*index, relation_index, value, relation, input)
+        ctx.name = name
+        ctx.save_for_backward(*index, *index_t, relation_index, value, relation, input, output)
+        return output
+
+    @staticmethod
+    def backward(ctx, output_grad):
+        backward = getattr(spmm, "csr_rspmm_%s_backward_cpu" % ctx.name)
+        value_grad, relation_grad, input_grad = backward(*ctx.saved_tensors, output_grad)
+        return None, None, None, None, value_grad, relation_grad, input_grad
+
+
+def _csr2coo(index, value):
+    ptr, col, order = index
+    row = torch.repeat_interleave(torch.arange(len(ptr) - 1, device=ptr.device), ptr.diff())
+    return torch.stack([row, col]), value[order]
+
+
+def csr_spmm(index, index_t, value, input, sum="add", mul="mul"):
+    """
+    Generalized sparse-dense matrix multiplication with precomputed compressed indexes.
+
+    The sparse matrix is specified by its non-zero values, and the CSR indexes of itself and its transpose,
+    e.g. :attr:`Graph.csc <torchdrug.data.Graph.csc>` and :attr:`Graph.csr <torchdrug.data.Graph.csr>` for the
+    transposed adjacency matrix. Since the indexes are cached by the graph, neither sorting nor coalescing
+    is performed here, in forward or backward. Duplicate entries are treated as separate non-zeros,
+    which coincides with summation when ``sum="add"`` and ``mul="mul"``.
+    On CPU, this operator pair only uses the C++ extension if it is precompiled, and ``torch.sparse`` otherwise,
+    so that default layers never trigger a just-in-time compilation.
+
+    See :func:`generalized_spmm` for the definition of the operators.
+
+    Parameters:
+        index (tuple of LongTensor): row pointers, column indexes and value ids of the sparse matrix
+        index_t (tuple of LongTensor): row pointers, column indexes and value ids of the transposed sparse matrix
+        value (Tensor): non-zero values of shape :math:`(nnz,)`
+        input (Tensor): 2D dense tensor
+        sum (str, optional): generalized summation operator. Available operators are ``add``, ``min`` and ``max``.
+        mul (str, optional): generalized multiplication operator. Available operators are ``add`` and ``mul``.
+    """
+    if not hasattr(module, "SPMM%s%sFunction" % (sum.capitalize(), mul.capitalize())):
+        raise ValueError("No generalized spmm implementation found for summation `%s` and multiplication `%s`"
+                         % (sum, mul))
+    if sum == "add" and mul == "mul":
+        if input.device.type == "cpu" and spmm.is_precompiled():
+            return CSRGeneralizedSPMMFunction.apply("add_mul", index, index_t, value.to(input.dtype), input)
+        # torch.sparse doesn't need the extension, so this also covers CPU without a compiler
+        if hasattr(torch, "sparse_csr_tensor"):
+            return CSRSPMMFunction.apply(index, index_t, value, input)
+        # PyTorch < 1.10 has no CSR tensors
+        indices, values = _csr2coo(index, value.to(input.dtype))
+        sparse = torch.sparse_coo_tensor(indices, values, (len(index[0]) - 1, len(index_t[0]) - 1))
+        return torch.sparse.mm(sparse, input)
+    if input.device.type == "cpu" and spmm.is_available():
+        name = "%s_%s" % (sum, mul)
+        return CSRGeneralizedSPMMFunction.apply(name, index, index_t, value.to(input.dtype), input)
+    # the extension kernels only take COO tensors on CUDA
+    indices, values = _csr2coo(index, value)
+    sparse = torch.sparse_coo_tensor(indices, values, (len(index[0]) - 1, len(index_t[0]) - 1))
+    return generalized_spmm(sparse, input, sum=sum, mul=mul)
+
+
+def csr_rspmm(index, index_t, relation_index, value, relation, input, sum="add", mul="mul"):
+    """
+    Generalized relational sparse-dense matrix multiplication with precomputed compressed indexes.
+
+    The 3D sparse matrix is specified by its non-zero values, the relation of each non-zero value,
+    and the CSR indexes of its first two dimensions and their transpose, e.g. :attr:`Graph.csc
+    <torchdrug.data.Graph.csc>`, :attr:`Graph.csr <torchdrug.data.Graph.csr>` and ``graph.edge_list[:, 2]``
+    for the transposed adjacency matrix. Neither sorting nor coalescing is performed here, in forward or backward.
+    Duplicate entries are treated as separate non-zeros.
+
+    See :func:`generalized_rspmm` for the definition of the operators.
+
+    Parameters:
+        index (tuple of LongTensor): row pointers, column indexes and value ids of the sparse matrix
+        index_t (tuple of LongTensor): row pointers, column indexes and value ids of the transposed sparse matrix
+        relation_index (LongTensor): relation of each non-zero value of shape :math:`(nnz,)`
+        value (Tensor): non-zero values of shape :math:`(nnz,)`
+        relation (Tensor): 2D dense tensor
+        input (Tensor): 2D dense tensor
+        sum (str, optional): generalized summation operator. Available operators are ``add``, ``min`` and ``max``.
+        mul (str, optional): generalized multiplication operator. Available operators are ``add`` and ``mul``.
+    """
+    if not hasattr(module, "RSPMM%s%sFunction" % (sum.capitalize(), mul.capitalize())):
+        raise ValueError("No generalized rspmm implementation found for summation `%s` and multiplication `%s`"
+                         % (sum, mul))
+    if input.device.type == "cpu" and spmm.is_available():
+        name = "%s_%s" % (sum, mul)
+        return CSRGeneralizedRSPMMFunction.apply(name, index, index_t, relation_index, value.to(input.dtype),
+                                                 relation, input)
+    # the extension kernels only take COO tensors on CUDA
+    indices, values = _csr2coo(index, value)
+    indices = torch.cat([indices, relation_index[index[2]].unsqueeze(0)])
+    sparse = torch.sparse_coo_tensor(indices, values, (len(index[0]) - 1, len(index_t[0]) - 1, len(relation)))
+    return generalized_rspmm(sparse, relation, input, sum=sum, mul=mul)
+
+
 def generalized_spmm(sparse, input, sum="add", mul="mul"):
     r"""
     Generalized sparse-dense matrix multiplication.
@@ -288,6 +435,11 @@ def generalized_spmm(sparse, input, sum="add", mul="mul"):
         Gradient w.r.t. the sparse matrix is only computed for non-zero entries of the sparse matrix.
         This behaves differently from dense-dense matrix multiplication with zero entries.
 
+    .. note::
+
+        The sparse matrix is coalesced on every call, and the CPU backward builds its transposed index.
+        For graphs, :func:`csr_spmm` reuses the compressed indexes cached by the graph instead.
+
     Parameters:
         sparse (SparseTensor): 2D sparse tensor
         input (Tensor): 2D dense tensor
@@ -320,6 +472,11 @@ def generalized_rspmm(sparse, relation, input, sum="add", mul="mul"):
         Gradient w.r.t. the sparse matrix is only computed for non-zero entries of the sparse matrix.
         This behaves differently from dense-dense matrix multiplication with zero entries.
 
+    .. note::
+
+        The sparse matrix is coalesced on every call, and the CPU backward builds its transposed index.
+        For graphs, :func:`csr_rspmm` reuses the compressed indexes cached by the graph instead.
+
     Parameters:
         sparse (SparseTensor): 3D sparse tensor
         relation (Tensor): 2D dense tensor
@@ -302,26 +302,24 @@ class AutoregressiveGeneration(tasks.Task, core.Configurable):
             node_model = self.node_model
             edge_model = self.edge_model
 
-        edge_list = torch.zeros(0, 3, dtype=torch.long, device=self.device)
-        num_nodes = torch.zeros(num_sample, dtype=torch.long, device=self.device)
-        num_edges = torch.zeros_like(num_nodes)
-        atom_type = torch.zeros(0, dtype=torch.long, device=self.device)
-        graph = data.PackedMolecule(edge_list, atom_type, edge_list[:, -1], num_nodes, num_edges,
-                                    num_relation=num_relation)
+        builder = data.PackedGraphBuilder(num_sample, num_relation=num_relation,
+                                          node_capacity=int(self.max_node), graph_type=data.PackedMolecule,
+                                          device=self.device)
+        graph = builder.pack()
         completed = torch.zeros(num_sample, dtype=torch.bool, device=self.device)
 
         for node_in in range(self.max_node):
             atom_pred = node_model.sample(graph)
             # why we add atom_pred even if it is completed?
             # because we need to batch edge model over (node_in, node_out), even on completed graphs
-            atom_type, num_nodes = self._append(atom_type, num_nodes, atom_pred)
-            graph = node_graph = data.PackedMolecule(edge_list, atom_type, edge_list[:, -1], num_nodes, num_edges,
-                                                     num_relation=num_relation)
+            builder.append_nodes(values={"atom_type": atom_pred})
+            graph = node_graph = builder.pack()
 
             start = max(0, node_in - self.max_edge_unroll)
             for node_out in range(start, node_in):
                 is_valid = completed.clone()
                 edge = torch.tensor([node_in, node_out], device=self.device).repeat(num_sample, 1)
+                num_edges = builder.num_edges
                 # default: non-edge
                 bond_pred = (self.num_bond_type - 1) * torch.ones(num_sample, dtype=torch.long, device=self.device)
                 for i in range(max_resample):
@@ -330,12 +328,11 @@ class AutoregressiveGeneration(tasks.Task, core.Configurable):
                     bond_pred[mask] = edge_model.sample(graph, edge)[mask]
                     # check valency
                     mask = (bond_pred < edge_model.input_dim - 1) & ~completed
-                    edge_pred = torch.cat([edge, bond_pred.unsqueeze(-1)], dim=-1)
-                    tmp_edge_list, tmp_num_edges = self._append(edge_list, num_edges, edge_pred, mask)
-                    edge_pred = torch.cat([edge.flip(-1), bond_pred.unsqueeze(-1)], dim=-1)
-                    tmp_edge_list, tmp_num_edges = self._append(tmp_edge_list, tmp_num_edges, edge_pred, mask)
-                    tmp_graph = data.PackedMolecule(tmp_edge_list, self.id2atom[atom_type], tmp_edge_list[:, -1],
-                                                    num_nodes, tmp_num_edges, num_relation=num_relation)
+                    # tentative edges are discarded by restoring the edge counts
+                    builder.truncate_edges(num_edges)
+                    self._append_edge(builder, edge, bond_pred, mask)
+                    tmp_graph = builder.pack()
+                    tmp_graph.atom_type = self.id2atom[tmp_graph.atom_type]
 
                     is_valid = tmp_graph.is_valid | completed
 
@@ -348,13 +345,11 @@ class AutoregressiveGeneration(tasks.Task, core.Configurable):
                     logger.warning("edge (%d, %d): %d / %d molecules are invalid even after %d resampling" %
                                    (node_in, node_out, num_invalid, num_working, max_resample))
 
-                mask = (bond_pred < edge_model.input_dim - 1) & ~completed
-                edge_pred = torch.cat([edge, bond_pred.unsqueeze(-1)], dim=-1)
-                edge_list, num_edges = self._append(edge_list, num_edges, edge_pred, mask)
-                edge_pred = torch.cat([edge.flip(-1), bond_pred.unsqueeze(-1)], dim=-1)
-                edge_list, num_edges = self._append(edge_list, num_edges, edge_pred, mask)
-                graph = data.PackedMolecule(edge_list, atom_type, edge_list[:, -1], num_nodes, num_edges,
-                                            num_relation=num_relation)
+                # the builder already holds the edges of the last resampling, whose packed result is reused
+                if max_resample == 0:
+                    mask = (bond_pred < edge_model.input_dim - 1) & ~completed
+                    self._append_edge(builder, edge, bond_pred, mask)
+                graph = builder.pack()
 
             if node_in > 0:
                 assert (graph.num_edges[completed] == node_graph.num_edges[completed]).all()
@@ -378,19 +373,11 @@ class AutoregressiveGeneration(tasks.Task, core.Configurable):
         graph = graph[graph.is_valid_rdkit]
         return graph
 
-    def _append(self, data, num_xs, input, mask=None):
-        if mask is None:
-            mask = torch.ones_like(num_xs, dtype=torch.bool)
-        new_num_xs = num_xs + mask
-        new_num_cum_xs = new_num_xs.cumsum(0)
-        new_num_x = new_num_cum_xs[-1].item()
-        new_data = torch.zeros(new_num_x, *data.shape[1:], dtype=data.dtype, device=data.device)
-        starts = new_num_cum_xs - new_num_xs
-        ends = starts + num_xs
-        index = functional.multi_slice_mask(starts, ends, new_num_x)
-        new_data[index] = data
-        new_data[~index] = input[mask]
-        return new_data, new_num_xs
+    def _append_edge(self, builder, edge, bond_type, mask):
+        # append the edge and its reverse edge
+        for edge in [edge, edge.flip(-1)]:
+            edge = torch.cat([edge, bond_type.unsqueeze(-1)], dim=-1)
+            builder.append_edges(mask, edge, {"bond_type": bond_type})
 
     @torch.no_grad()
     def mask_node(self, graph, metric=None):
@@ -1250,8 +1237,9 @@ class GCPNGeneration(tasks.Task, core.Configurable):
             bond_type = functional._extend(bond_type, num_edges, edge_action[has_new_edge], has_new_edge)[0]
             edge_list, num_edges = functional._extend(edge_list, num_edges, new_edge_list, has_new_edge)
 
-            tmp_graph = type(graph)(edge_list, atom_type=atom_type, bond_type=bond_type, num_nodes=num_nodes,
-                                    num_edges=num_edges, num_relation=graph.num_relation)
+            tmp_graph = type(graph)._from_trusted(edge_list, atom_type=atom_type, bond_type=bond_type,
+                                                  num_nodes=num_nodes, num_edges=num_edges,
+                                                  num_relation=graph.num_relation)
             is_valid = tmp_graph.is_valid | (stop_action == 1)
             if is_valid.all():
                 break
@@ -1278,9 +1266,9 @@ class GCPNGeneration(tasks.Task, core.Configurable):
                 new_data = torch.zeros(shape, dtype=v.dtype, device=self.device)
                 data_dict[k] = functional._extend(v, graph.num_edges, new_data, has_new_edge * 2)[0]
 
-        new_graph = type(graph)(edge_list, atom_type=atom_type, bond_type=bond_type, num_nodes=num_nodes,
-                                num_edges=num_edges, num_relation=graph.num_relation,
-                                meta_dict=meta_dict, **data_dict)
+        new_graph = type(graph)._from_trusted(edge_list, atom_type=atom_type, bond_type=bond_type,
+                                              num_nodes=num_nodes, num_edges=num_edges,
+                                              num_relation=graph.num_relation, meta_dict=meta_dict, **data_dict)
         with new_graph.graph():
             new_graph.is_stopped = stop_action == 1
 
@@ -863,10 +863,11 @@ class SynthonCompletion(tasks.Task, core.Configurable):
                 new_data = torch.zeros(shape, dtype=v.dtype, device=self.device)
                 data_dict[k] = functional._extend(v, graph.num_edges, new_data, has_new_edge * 2)[0]
 
-        new_graph = type(graph)(edge_list, atom_type=atom_type, bond_type=bond_type, num_nodes=num_nodes,
-                                num_edges=num_edges, num_relation=graph.num_relation,
-                                is_new_node=is_new_node, is_reaction_center=is_reaction_center, logp=logp,
-                                meta_dict=meta_dict, **data_dict)
+        new_graph = type(graph)._from_trusted(edge_list, atom_type=atom_type, bond_type=bond_type,
+                                              num_nodes=num_nodes, num_edges=num_edges,
+                                              num_relation=graph.num_relation, is_new_node=is_new_node,
+                                              is_reaction_center=is_reaction_center, logp=logp,
+                                              meta_dict=meta_dict, **data_dict)
         with new_graph.graph():
             new_graph.is_stopped = stop == 1
         valid = logp > float("-inf")
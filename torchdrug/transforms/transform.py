@@ -1,8 +1,10 @@
 import copy
 import logging
-from collections import deque
 
 import torch
+from torch_scatter import scatter_min
+
+from torchdrug import data
 
 
 logger = logging.getLogger(__name__)
@@ -53,36 +55,42 @@ class RemapAtomType(object):
 class RandomBFSOrder(object):
     """
     Order the nodes in a graph according to a random BFS order.
+    Nodes that can't be reached from the random root are removed.
+
+    This transform can be applied to either a sample or a collated batch.
+    For a batch, all graphs are traversed simultaneously, one BFS level per step.
     """
 
     def __call__(self, item):
-        graph = item["graph"]
-        edge_list = graph.edge_list[:, :2].tolist()
-        neighbor = [[] for _ in range(graph.num_node)]
-        for h, t in edge_list:
-            neighbor[h].append(t)
-        depth = [-1] * graph.num_node
-
-        i = torch.randint(graph.num_node, (1,)).item()
-        queue = deque([i])
-        depth[i] = 0
-        order = []
-        while queue:
-            h = queue.popleft()
-            order.append(h)
-            for t in neighbor[h]:
-                if depth[t] == -1:
-                    depth[t] = depth[h] + 1
-                    queue.append(t)
-
-        item = item.copy()
-        item["graph"] = graph.subgraph(order)
-        return item
+        return _transform_graph(item, self.transform_graph, self.transform_packed_graph)
+
+    def transform_graph(self, graph):
+        node_in, node_out = graph.edge_list.t()[:2]
+        root = torch.randint(graph.num_node, (1,), device=graph.device) if graph.num_node > 0 else node_in[:0]
+        rank = _bfs_rank(node_in, node_out, root, graph.num_node.item())
+        visited = (rank >= 0).nonzero().flatten()
+        order = visited[rank[visited].argsort()]
+        return graph.subgraph(order)
+
+    def transform_packed_graph(self, graph):
+        node_in, node_out = graph.edge_list.t()[:2]
+        num_node = graph.num_node.item()
+        root = graph.num_cum_nodes - graph.num_nodes
+        root = root + (torch.rand(graph.batch_size, device=graph.device) * graph.num_nodes).long()
+        root = root[graph.num_nodes > 0]
+        rank = _bfs_rank(node_in, node_out, root, num_node)
+        visited = (rank >= 0).nonzero().flatten()
+        order = visited[(graph.node2graph[visited] * num_node + rank[visited]).argsort()]
+        return graph.subgraph(order)
 
 
 class Shuffle(object):
     """
     Shuffle the order of nodes and edges in a graph.
+
+    This transform can be applied to either a sample or a collated batch.
+    For a batch, nodes and edges are shuffled within each graph.
+
     Parameters:
         shuffle_node (bool, optional): shuffle node order or not
         shuffle_edge (bool, optional): shuffle edge order or not
@@ -93,41 +101,34 @@ class Shuffle(object):
         self.shuffle_edge = shuffle_edge
 
     def __call__(self, item):
-        graph = item["graph"]
-        data = self.transform_data(graph.data_dict, graph.meta)
-
-        item = item.copy()
-        item["graph"] = type(graph)(**data)
-        return item
+        return _transform_graph(item, self.transform_graph, self.transform_packed_graph)
 
-    def transform_data(self, data, meta):
-        edge_list = data["edge_list"]
-        num_node = data["num_node"]
-        num_edge = data["num_edge"]
+    def transform_graph(self, graph):
+        if self.shuffle_node:
+            graph = graph.subgraph(torch.randperm(graph.num_node, device=graph.device))
         if self.shuffle_edge:
-            node_perm = torch.randperm(num_node, device=edge_list.device)
-        else:
-            node_perm = torch.arange(num_node, device=edge_list.device)
+            graph = graph.edge_mask(torch.randperm(graph.num_edge, device=graph.device))
+        return graph
+
+    def transform_packed_graph(self, graph):
+        if self.shuffle_node:
+            perm = torch.randperm(graph.num_node, device=graph.device)
+            node_perm = (graph.node2graph * graph.num_node + perm).argsort()
+            graph = graph.subgraph(node_perm)
         if self.shuffle_edge:
-            edge_perm = torch.randperm(num_edge, device=edge_list.device)
-        else:
-            edge_perm = torch.randperm(num_edge, device=edge_list.device)
-        new_data = {}
-        for key in data:
-            if meta[key] == "node":
-                new_data[key] = data[key][node_perm]
-            elif meta[key] == "edge":
-                new_data[key] = node_perm[data[key][edge_perm]]
-            else:
-                new_data[key] = data[key]
-
-        return new_data
+            perm = torch.randperm(graph.num_edge, device=graph.device)
+            edge_perm = (graph.edge2graph * graph.num_edge + perm).argsort()
+            graph = graph.edge_mask(edge_perm)
+        return graph
 
 
 class VirtualNode(object):
     """
     Add a virtual node and connect it with every node in the graph.
 
+    This transform can be applied to either a sample or a collated batch.
+    For a batch, a virtual node is appended to every graph.
+
     Parameters:
         relation (int, optional): relation of virtual edges.
             By default, use the maximal relation in the graph plus 1.
@@ -141,66 +142,113 @@ class VirtualNode(object):
         self.relation = relation
         self.weight = weight
 
-        self.default = {k: torch.as_tensor(v) for k, v in kwargs.items()}
+        self.default = {k: torch.as_tensor(v) for k, v in kwargs.items() if v is not None}
         if node_feature is not None:
             self.default["node_feature"] = torch.as_tensor(node_feature)
         if edge_feature is not None:
             self.default["edge_feature"] = torch.as_tensor(edge_feature)
 
     def __call__(self, item):
-        graph = item["graph"]
+        return _transform_graph(item, self.transform_graph, self.transform_packed_graph)
+
+    def transform_graph(self, graph):
         edge_list = graph.edge_list
-        edge_weight = graph.edge_weight
-        num_node = graph.num_node
         num_relation = graph.num_relation
+        num_node = graph.num_node
 
-        existing_node = torch.arange(num_node, device=edge_list.device)
-        virtual_node = torch.ones(num_node, dtype=torch.long, device=edge_list.device) * num_node
+        existing_node = torch.arange(num_node, device=graph.device)
+        virtual_node = torch.ones(num_node, dtype=torch.long, device=graph.device) * num_node
         node_in = torch.cat([virtual_node, existing_node])
         node_out = torch.cat([existing_node, virtual_node])
-        if edge_list.shape[1] == 2:
-            new_edge = torch.stack([node_in, node_out], dim=-1)
-        else:
+        new_edge = torch.stack([node_in, node_out], dim=-1)
+        if edge_list.shape[1] > 2:
             if self.relation is None:
                 relation = num_relation
                 num_relation = num_relation + 1
             else:
                 relation = self.relation
-            relation = relation * torch.ones(num_node * 2, dtype=torch.long, device=edge_list.device)
-            new_edge = torch.stack([node_in, node_out, relation], dim=-1)
+            relation = relation * torch.ones(len(new_edge), 1, dtype=torch.long, device=graph.device)
+            new_edge = torch.cat([new_edge, relation], dim=-1)
         edge_list = torch.cat([edge_list, new_edge])
-        new_edge_weight = self.weight * torch.ones(num_node * 2, device=edge_weight.device)
-        edge_weight = torch.cat([edge_weight, new_edge_weight])
+        new_edge_weight = self.weight * torch.ones(len(new_edge), device=graph.device)
+        edge_weight = torch.cat([graph.edge_weight, new_edge_weight])
 
         # add default node/edge attributes
-        data = graph.data_dict.copy()
-        for key, value in graph.meta.items():
-            if value == "node":
-                if key in self.default:
-                    new_data = self.default[key].unsqueeze(0)
-                else:
-                    new_data = torch.zeros(1, *data[key].shape[1:], dtype=data[key].dtype, device=data[key].device)
-                data[key] = torch.cat([data[key], new_data])
-            elif value == "edge":
-                if key in self.default:
-                    repeat = [-1] * (data[key].ndim - 1)
-                    new_data = self.default[key].expand(num_node * 2, *repeat)
-                else:
-                    new_data = torch.zeros(num_node * 2, *data[key].shape[1:],
-                                           dtype=data[key].dtype, device=data[key].device)
-                data[key] = torch.cat([data[key], new_data])
-
-        graph = type(graph)(edge_list, edge_weight=edge_weight, num_node=num_node + 1,
-                            num_relation=num_relation, meta=graph.meta, **data)
+        data_dict, meta_dict = graph.data_dict, graph.meta_dict
+        for key, value in data_dict.items():
+            if meta_dict[key] == "node":
+                data_dict[key] = torch.cat([value, self._get_default(key, value, 1)])
+            elif meta_dict[key] == "edge":
+                data_dict[key] = torch.cat([value, self._get_default(key, value, len(new_edge))])
 
-        item = item.copy()
-        item["graph"] = graph
-        return item
+        return type(graph)._from_trusted(edge_list, edge_weight=edge_weight, num_node=num_node + 1,
+                                         num_relation=num_relation, meta_dict=meta_dict, **data_dict)
+
+    def transform_packed_graph(self, graph):
+        edge_list = graph.edge_list
+        num_relation = graph.num_relation
+        node2graph = graph.node2graph
+        edge2graph = graph.edge2graph
+        num_nodes = graph.num_nodes + 1
+        num_cum_nodes = num_nodes.cumsum(0)
+        num_edges = graph.num_edges + graph.num_nodes * 2
+
+        # existing nodes are shifted by the virtual nodes of previous graphs
+        existing_node = torch.arange(graph.num_node, device=graph.device) + node2graph
+        virtual_node = num_cum_nodes - 1
+        node_in = torch.cat([virtual_node[node2graph], existing_node])
+        node_out = torch.cat([existing_node, virtual_node[node2graph]])
+        new_edge = torch.stack([node_in, node_out], dim=-1)
+        if edge_list.shape[1] > 2:
+            if self.relation is None:
+                relation = num_relation
+                num_relation = num_relation + 1
+            else:
+                relation = self.relation
+            relation = relation * torch.ones(len(new_edge), 1, dtype=torch.long, device=graph.device)
+            new_edge = torch.cat([new_edge, relation], dim=-1)
+        edge_list = edge_list.clone()
+        edge_list[:, :2] = existing_node[edge_list[:, :2]]
+        edge_list = torch.cat([edge_list, new_edge])
+        new_edge_weight = self.weight * torch.ones(len(new_edge), device=graph.device)
+        edge_weight = torch.cat([graph.edge_weight, new_edge_weight])
+
+        # virtual edges follow the existing edges of each graph
+        # virtual edges in each direction are ordered by their existing nodes
+        edge_key = torch.cat([edge2graph * 3, node2graph * 3 + 1, node2graph * 3 + 2])
+        edge_index = edge_key.argsort(stable=True)
+        edge_list = edge_list[edge_index]
+        edge_weight = edge_weight[edge_index]
+        offsets = (num_cum_nodes - num_nodes).repeat_interleave(num_edges)
+
+        # add default node/edge attributes
+        data_dict, meta_dict = graph.data_dict, graph.meta_dict
+        for key, value in data_dict.items():
+            if meta_dict[key] == "node":
+                node_value = torch.empty(len(value) + graph.batch_size, *value.shape[1:], dtype=value.dtype,
+                                         device=value.device)
+                node_value[existing_node] = value
+                node_value[virtual_node] = self._get_default(key, value, graph.batch_size)
+                data_dict[key] = node_value
+            elif meta_dict[key] == "edge":
+                data_dict[key] = torch.cat([value, self._get_default(key, value, len(new_edge))])[edge_index]
+
+        return type(graph)._from_trusted(edge_list, edge_weight=edge_weight, num_nodes=num_nodes, num_edges=num_edges,
+                                         num_relation=num_relation, offsets=offsets, meta_dict=meta_dict, **data_dict)
+
+    def _get_default(self, key, value, num):
+        # attribute of virtual nodes or virtual edges
+        if key in self.default:
+            return self.default[key].to(value).expand(num, *value.shape[1:])
+        return torch.zeros(num, *value.shape[1:], dtype=value.dtype, device=value.device)
 
 
 class VirtualAtom(VirtualNode):
     """
     Add a virtual atom and connect it with every atom in the molecule.
+
+    This transform can be applied to either a sample or a collated batch.
+
     Parameters:
         atom_type (int, optional): type of the virtual atom
         bond_type (int, optional): type of the virtual bonds
@@ -214,6 +262,45 @@ class VirtualAtom(VirtualNode):
                                           edge_feature=edge_feature, atom_type=atom_type, **kwargs)
 
 
+def _bfs_rank(node_in, node_out, root, num_node):
+    # rank of each node in the BFS order from the roots, -1 for unvisited nodes
+    # all roots are traversed simultaneously, one BFS level per step
+    num_edge = len(node_in)
+    edge_index = torch.arange(num_edge, device=node_in.device)
+    rank = -torch.ones(num_node, dtype=torch.long, device=node_in.device)
+    rank[root] = torch.arange(len(root), device=node_in.device)
+    frontier = torch.zeros(num_node, dtype=torch.bool, device=node_in.device)
+    frontier[root] = 1
+    num_visited = len(root)
+    while True:
+        edge_mask = frontier[node_in] & (rank[node_out] == -1)
+        if not edge_mask.any():
+            break
+        # a node is queued by its first edge from the earliest visited node
+        key = rank[node_in[edge_mask]] * num_edge + edge_index[edge_mask]
+        max_key = torch.full((num_node,), num_node * num_edge, dtype=torch.long, device=node_in.device)
+        key = scatter_min(key, node_out[edge_mask], dim=0, out=max_key)[0]
+        new_node = (key < num_node * num_edge).nonzero().flatten()
+        new_node = new_node[key[new_node].argsort()]
+        rank[new_node] = torch.arange(len(new_node), device=node_in.device) + num_visited
+        num_visited += len(new_node)
+        frontier = torch.zeros_like(frontier)
+        frontier[new_node] = 1
+    return rank
+
+
+def _transform_graph(item, transform, transform_packed):
+    # a collated batch is transformed in one pass, rather than graph by graph
+    graph = item["graph"]
+    if isinstance(graph, data.PackedGraph):
+        graph = transform_packed(graph)
+    else:
+        graph = transform(graph)
+    item = item.copy()
+    item["graph"] = graph
+    return item
+
+
 class Compose(object):
     """
     Compose a list of transforms into one.
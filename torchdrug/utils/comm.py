@@ -1,13 +1,24 @@
 import os
+import pickle
+import weakref
+import tempfile
 import multiprocessing
 from collections import defaultdict
 
+import numpy as np
 import torch
 from torch import distributed as dist
 
 
 cpu_group = None
 gpu_group = None
+# tensors returned by share_memory(), keyed by their location in shared memory, which are not shared again
+# references are weak, so that the memory is unmapped once a process releases its tensors
+_shared_tensors = weakref.WeakValueDictionary()
+# torch dtypes that numpy can represent, and integer dtypes to reinterpret the others of the same size
+_torch2numpy = {torch.bool, torch.uint8, torch.int8, torch.int16, torch.int32, torch.int64, torch.float16,
+                torch.float32, torch.float64, torch.complex64, torch.complex128}
+_int_dtypes = {1: torch.uint8, 2: torch.int16, 4: torch.int32, 8: torch.int64}
 
 
 def get_rank():
@@ -36,6 +47,19 @@ def get_world_size():
     return 1
 
 
+def get_local_rank():
+    """
+    Get the rank of this process among the distributed processes on this node.
+
+    Return 0 for single process case. Otherwise, ``LOCAL_RANK`` should be set by the launcher, e.g. ``torchrun``.
+    """
+    if "LOCAL_RANK" in os.environ:
+        return int(os.environ["LOCAL_RANK"])
+    if get_world_size() == 1:
+        return 0
+    raise ValueError("Can't find the local rank of process %d. Set `LOCAL_RANK` in the environment" % get_rank())
+
+
 def get_group(device):
     """
     Get the process group corresponding to the given device.
@@ -266,4 +290,206 @@ def cat(obj, dst=None):
         cated[k] = s.type(value[0].dtype)
     sizes = {k: v.sum(dim=0) for k, v in sizes.items()}
 
-    return _recursive_write(obj, cated, sizes)[0]
\ No newline at end of file
+    return _recursive_write(obj, cated, sizes)[0]
+
+
+def cat_shared(obj):
+    """
+    Concatenate any nested container of CPU tensors along the 0-th axis into shared memory.
+
+    Unlike :func:`cat`, only the first process on each node receives the parts of all processes.
+    The result is then placed in shared memory by :func:`share_memory`, so that each node holds a single copy,
+    and other processes never allocate more than their own parts.
+    Return the object unchanged for single process case.
+
+    Parameters:
+        obj (Object): any container object. Can be nested list, tuple or dict.
+    """
+    if get_world_size() == 1:
+        return obj
+
+    values, sizes = _recursive_read(obj)
+    sizes = stack({k: torch.cat(v) for k, v in sizes.items()}) # sizes[k]: (num_worker, num_obj)
+    is_writer = get_local_rank() == 0
+    writers = stack(torch.tensor([is_writer])).flatten().nonzero().flatten().tolist()
+    rank = get_rank()
+    group = get_group(torch.device("cpu"))
+
+    cated = {}
+    requests = []
+    for k, value in values.items():
+        size = sizes[k]
+        dtype = torch.uint8 if k == torch.bool else k
+        # the same layout as cat(), i.e. objects of all workers are concatenated one after another
+        offset = size.t().flatten().cumsum(0) - size.t().flatten()
+        offset = offset.view(size.shape[1], size.shape[0]).t()
+        if is_writer:
+            s = torch.empty(int(size.sum()), dtype=dtype)
+            for src, j in zip(*size.nonzero().t().tolist()):
+                start = offset[src, j].item()
+                part = s[start: start + size[src, j].item()]
+                if src == rank:
+                    part.copy_(value[j])
+                else:
+                    requests.append((dist.irecv(part, src=src, group=group), part))
+            cated[k] = s
+        for dst in writers:
+            if dst == rank:
+                continue
+            for v in value:
+                if v.numel() > 0:
+                    v = v.to(dtype)
+                    requests.append((dist.isend(v, dst=dst, group=group), v))
+    for request, tensor in requests:
+        request.wait()
+    del requests
+
+    if is_writer:
+        cated = {k: v.type(k) for k, v in cated.items()}
+        sizes = {k: v.sum(dim=0) for k, v in sizes.items()}
+        obj = _recursive_write(obj, cated, sizes)[0]
+    else:
+        obj = None
+    return share_memory(obj)
+
+
+class _SharedMemoryPickler(pickle.Pickler):
+    # CPU tensors and numpy arrays are written to a flat buffer in the order they are pickled,
+    # and replaced by their locations in the buffer
+
+    def __init__(self, file, token, shared_tensors, alignment=64):
+        super(_SharedMemoryPickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.token = token
+        self.alignment = alignment
+        self.arrays = []
+        self.num_byte = 0
+        self.memo_ids = {}
+        self.shared_keys = {id(tensor): key for key, tensor in shared_tensors.items()}
+
+    def persistent_id(self, obj):
+        if type(obj) is torch.Tensor:
+            if obj.device.type != "cpu" or obj.layout != torch.strided:
+                return None
+            if id(obj) in self.shared_keys:
+                return ("shared", self.shared_keys[id(obj)])
+        elif type(obj) is not np.ndarray or obj.dtype.hasobject:
+            return None
+        if id(obj) in self.memo_ids:
+            return self.memo_ids[id(obj)][1]
+
+        view_dtype = None
+        if isinstance(obj, torch.Tensor):
+            tensor = obj.detach().contiguous()
+            if tensor.dtype not in _torch2numpy:
+                # dtypes without a numpy counterpart, e.g. bfloat16, are written as integers of the same size
+                if tensor.is_quantized or tensor.element_size() not in _int_dtypes:
+                    return None
+                view_dtype = str(tensor.dtype).split(".")[-1]
+                tensor = tensor.view(_int_dtypes[tensor.element_size()])
+            array = tensor.numpy()
+        else:
+            array = np.ascontiguousarray(obj)
+        offset = -(-self.num_byte // self.alignment) * self.alignment
+        self.arrays.append((offset, array))
+        self.num_byte = offset + array.nbytes
+        pid = ("tensor" if isinstance(obj, torch.Tensor) else "array", offset, array.dtype.str, array.shape,
+               view_dtype)
+        # keep the object alive, so that its id is not reused during pickling
+        self.memo_ids[id(obj)] = (obj, pid)
+        return pid
+
+
+class _SharedMemoryUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, token, buffer, shared_tensors):
+        super(_SharedMemoryUnpickler, self).__init__(file)
+        self.token = token
+        self.buffer = buffer
+        self.shared_tensors = shared_tensors
+
+    def persistent_load(self, pid):
+        if pid[0] == "shared":
+            return self.shared_tensors[pid[1]]
+        type, offset, dtype, shape, view_dtype = pid
+        dtype = np.dtype(dtype)
+        num_byte = int(np.prod(shape)) * dtype.itemsize
+        array = self.buffer[offset: offset + num_byte].view(dtype).reshape(shape)
+        if type == "array":
+            return array
+        tensor = torch.from_numpy(array)
+        if view_dtype is not None:
+            tensor = tensor.view(getattr(torch, view_dtype))
+        _shared_tensors[(self.token, offset)] = tensor
+        return tensor
+
+
+def share_memory(obj):
+    """
+    Place any picklable object in shared memory, with a single copy of its tensors for all processes on each node.
+
+    The first process on each node writes CPU tensors and numpy arrays of the object to POSIX shared memory,
+    and other processes on the node map the same memory without copying.
+    Only the first process on each node needs to construct the object, and the argument is ignored on other
+    processes, which receive the object of the first process.
+    The returned tensors are copy-on-write, i.e. in-place modifications are private to each process.
+    The shared memory is released once all processes drop the returned tensors.
+    Return the object unchanged for single process case.
+
+    Parameters:
+        obj (Object): any picklable object, e.g. a nested container of tensors or a dataset
+
+    Examples::
+
+        >>> # assume 4 workers on a node
+        >>> obj = {"feature": torch.arange(16000000).view(-1, 16)} if comm.get_local_rank() == 0 else None
+        >>> obj = comm.share_memory(obj)
+        >>> # the node holds 1 copy of the features instead of 4
+    """
+    if get_world_size() == 1:
+        return obj
+
+    # a random name shared by all processes, so that concurrent jobs don't collide
+    token = torch.tensor([int.from_bytes(os.urandom(7), "little")])
+    dist.broadcast(token, 0, group=get_group(token.device))
+    token = token.item()
+    path = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    prefix = os.path.join(path, "torchdrug_%x" % token)
+    meta_file = "%s.pkl" % prefix
+    data_file = "%s.bin" % prefix
+    is_writer = get_local_rank() == 0
+
+    # tensors shared before are only referred to if every process still holds them,
+    # since a process can't map a tensor again once it is released
+    shared_tensors = dict(_shared_tensors)
+    keys = cat(torch.tensor([x for key in shared_tensors for x in key], dtype=torch.long)).view(-1, 2)
+    if len(keys) > 0:
+        keys, counts = keys.unique(dim=0, return_counts=True)
+        keys = {tuple(key) for key, count in zip(keys.tolist(), counts.tolist()) if count == get_world_size()}
+    else:
+        keys = set()
+    shared_tensors = {key: tensor for key, tensor in shared_tensors.items() if key in keys}
+
+    if is_writer:
+        # tensors are numbered by the traversal of the pickler on the writer, which all processes follow
+        with open(meta_file, "wb") as fout:
+            pickler = _SharedMemoryPickler(fout, token, shared_tensors)
+            pickler.dump(obj)
+        with open(data_file, "wb") as fout:
+            for offset, array in pickler.arrays:
+                fout.seek(offset)
+                fout.write(array.data)
+            fout.truncate(pickler.num_byte)
+        del pickler
+    synchronize()
+    if os.path.getsize(data_file) > 0:
+        buffer = np.memmap(data_file, dtype=np.uint8, mode="c")
+    else:
+        buffer = np.zeros(0, dtype=np.uint8)
+    with open(meta_file, "rb") as fin:
+        obj = _SharedMemoryUnpickler(fin, token, buffer, shared_tensors).load()
+    synchronize()
+    if is_writer:
+        # the memory stays mapped after the files are removed
+        os.remove(meta_file)
+        os.remove(data_file)
+    return obj
@@ -102,6 +102,28 @@ def compute_md5(file_name, chunk_size=65536):
     return md5.hexdigest()
 
 
+def get_source_checksum(sources):
+    """
+    Compute the checksum of a C++ extension.
+
+    The checksum covers all C++ and CUDA files in the directory of the sources, including the headers they include.
+    This module only depends on the standard library, so that ``setup.py`` can load it without PyTorch.
+
+    Parameters:
+        sources (list of str): source files of the extension
+    """
+    import hashlib
+
+    md5 = hashlib.md5()
+    path = os.path.dirname(os.path.abspath(sources[0]))
+    for file_name in sorted(os.listdir(path)):
+        if os.path.splitext(file_name)[1] in [".cpp", ".h", ".cu", ".cuh"]:
+            md5.update(file_name.encode())
+            with open(os.path.join(path, file_name), "rb") as fin:
+                md5.update(fin.read())
+    return md5.hexdigest()
+
+
 def get_line_count(file_name, chunk_size=8192*1024):
     """
     Get the number of lines in a file.
@@ -1,4 +1,6 @@
 import os
+import warnings
+import importlib.util
 from collections.abc import Mapping, Sequence
 
 import torch
@@ -6,6 +8,7 @@ from torch.utils import cpp_extension
 
 from torchdrug import data
 from torchdrug.utils import comm
+from torchdrug.utils.file import get_source_checksum
 
 
 class LazyExtensionLoader(object):
@@ -18,22 +21,114 @@ class LazyExtensionLoader(object):
         self.extra_cuda_cflags = extra_cuda_cflags
         self.extra_ldflags = extra_ldflags
         self.extra_include_paths = extra_include_paths
-        worker_name = "%s_%d" % (name, comm.get_rank())
-        self.build_directory = build_directory or cpp_extension._get_build_directory(worker_name, verbose)
+        self.build_directory = build_directory
         self.verbose = verbose
         self.kwargs = kwargs
+        self.module_name = self._get_module_name()
+
+    def _get_module_name(self):
+        # modules built ahead of time are placed beside their sources, e.g. torchdrug.utils.extension.torch_ext
+        package_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        source_path = os.path.dirname(os.path.abspath(self.sources[0]))
+        relpath = os.path.relpath(source_path, package_path)
+        if relpath.startswith(os.pardir):
+            return None
+        return ".".join(relpath.split(os.sep) + [self.name])
+
+    def load_precompiled(self):
+        """
+        Import the extension built ahead of time. Return ``None`` if it is not available.
+        """
+        if self.module_name is None:
+            return None
+        try:
+            spec = importlib.util.find_spec(self.module_name)
+        except ImportError:
+            return None
+        if spec is None or spec.origin is None:
+            return None
+        # a module built before the sources are changed is stale
+        checksum_file = spec.origin + ".md5"
+        if os.path.exists(checksum_file):
+            with open(checksum_file, "r") as fin:
+                checksum = fin.read().strip()
+        else:
+            checksum = None
+        if checksum != get_source_checksum(self.sources):
+            warnings.warn("Precompiled extension `%s` doesn't match its sources. "
+                          "Compile it just-in-time instead." % self.module_name)
+            return None
+        try:
+            module = importlib.import_module(self.module_name)
+        except ImportError:
+            return None
+        # the precompiled module may be built without CUDA
+        with_cuda = any(source.endswith(".cu") for source in self.sources)
+        if with_cuda and not any(key.endswith("_cuda") for key in dir(module)):
+            return None
+        return module
+
+    def load_jit(self, build_directory=None):
+        """
+        Compile and load the extension just-in-time.
+        """
+        if build_directory is None:
+            build_directory = self.build_directory
+        if build_directory is None:
+            worker_name = "%s_%d" % (self.name, comm.get_rank())
+            build_directory = cpp_extension._get_build_directory(worker_name, self.verbose)
+        return cpp_extension.load(self.name, self.sources, extra_cflags=self.extra_cflags,
+                                  extra_cuda_cflags=self.extra_cuda_cflags, extra_ldflags=self.extra_ldflags,
+                                  extra_include_paths=self.extra_include_paths, build_directory=build_directory,
+                                  verbose=self.verbose, **self.kwargs)
+
+    def load(self):
+        """
+        Load the extension, either precompiled or compiled just-in-time.
+        """
+        if "module" not in self.__dict__:
+            module = self.load_precompiled()
+            if module is None:
+                module = self.load_jit()
+            self.module = module
+        return self.module
+
+    def is_precompiled(self):
+        """
+        Check if the extension is loaded, or can be imported from a precompiled module without compilation.
+        """
+        if "module" not in self.__dict__ and "precompiled" not in self.__dict__:
+            module = self.load_precompiled()
+            self.precompiled = module is not None
+            if module is not None:
+                self.module = module
+        return "module" in self.__dict__
+
+    def is_available(self):
+        """
+        Check if the extension can be loaded. A failure is reported as a warning and remembered.
+        """
+        if "module" not in self.__dict__ and "error" not in self.__dict__:
+            try:
+                self.load()
+            except Exception as error:
+                self.error = error
+                warnings.warn("Failed to load extension `%s`: %s" % (self.name, error))
+        return "module" in self.__dict__
 
     def __getattr__(self, key):
-        if "module" not in self.__dict__:
-            self.module = cpp_extension.load(self.name, self.sources, self.extra_cflags, self.extra_cuda_cflags,
-                                             self.extra_ldflags, self.extra_include_paths, self.build_directory,
-                                             self.verbose, **self.kwargs)
-        return getattr(self.module, key)
+        if "error" in self.__dict__:
+            raise self.error
+        return getattr(self.load(), key)
 
 
 def load_extension(name, sources, **kwargs):
     """
-    Load a PyTorch C++ extension just-in-time (JIT).
+    Load a PyTorch C++ extension.
+
+    If the extension is built ahead of time by ``setup.py`` or ``python -m torchdrug.build_ext``
+    from the current sources, the precompiled module is imported.
+    Otherwise, the extension is compiled just-in-time (JIT).
 
     This function performs lazy evaluation and is multi-process-safe.
 